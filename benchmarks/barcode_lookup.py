@@ -0,0 +1,50 @@
+"""
+Server time of a counter scan: `GET /product/?__barcode__equal=` against the warmed barcode table behind
+`GET /barcode/<barcode>/`, over the products of the catalog that have a barcode.
+
+    python -m benchmarks.barcode_lookup <store_id> [scans]
+"""
+import random
+import sys
+import time
+
+from manager import app
+from src.products.barcodes import barcode_cache
+from src.products.models import Product
+from src.products.resources import ProductResource
+
+
+def _product_scan(barcode):
+    with app.test_request_context('/api/v1/product/?__barcode__equal={}'.format(barcode)):
+        resource = ProductResource()
+        objects = resource.apply_filters(Product.query.options(*resource.load_options()),
+                                         __barcode__equal=[barcode])
+        page = resource.paginate(resource.has_read_permission(objects))
+        resource.dump(page.items, many=True)
+
+
+def _barcode_scan(barcode, store_id):
+    barcode_cache.lookup(barcode, store_id)
+
+
+def _timed(scan, barcodes, *args):
+    start = time.perf_counter()
+    for barcode in barcodes:
+        scan(barcode, *args)
+    return (time.perf_counter() - start) / len(barcodes) * 1000
+
+
+def run(store_id, scans=2000):
+    with app.app_context():
+        start = time.perf_counter()
+        barcode_cache.warm()
+        print('{} barcodes warmed in {:.2f} s'.format(len(barcode_cache.products), time.perf_counter() - start))
+        barcodes = random.choices(list(barcode_cache.products), k=scans)
+        # the first scan of a product loads its default stock
+        print('barcode table, cold stock  {:8.3f} ms/scan'.format(_timed(_barcode_scan, barcodes, store_id)))
+        print('barcode table, warm        {:8.3f} ms/scan'.format(_timed(_barcode_scan, barcodes, store_id)))
+        print('product resource           {:8.3f} ms/scan'.format(_timed(_product_scan, barcodes[:200])))
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:3]])
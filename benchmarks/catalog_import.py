@@ -0,0 +1,65 @@
+"""
+Rows per second of the bulk catalog import over a generated JSON catalog file, from reading the file to the last
+commit.
+
+The catalog has a few duplicate names, brands and categories shared across products and rows missing a brand.
+The import runs in a session joined to an outer transaction that is rolled back afterwards, so its batch commits
+leave nothing behind.
+
+    python -m benchmarks.catalog_import [products] [batch_size]
+"""
+import json
+import random
+import sys
+import tempfile
+import time
+
+from sqlalchemy.orm import sessionmaker
+
+from manager import app
+from src import db
+from src.products.importer import CatalogImporter, normalize
+
+FORMS = ['Tablet', 'Capsule', 'Syrup', 'Injection', 'Cream', 'Drops']
+
+
+def _catalog(products):
+    brands = ['benchmark brand {}'.format(i) for i in range(max(products // 50, 1))]
+    categories = ['benchmark category {}'.format(i) for i in range(200)]
+    for i in range(products):
+        name = 'benchmark product {}'.format(i)
+        if i and i % 100 == 0:
+            # repeats an earlier name with another case
+            name = 'BENCHMARK PRODUCT {}'.format(i // 2)
+        yield dict(name=name, manufacturer=None if i % 250 == 0 else random.choice(brands),
+                   genericname='generic {}'.format(i % 997),
+                   price={'INR': {'default': round(random.uniform(1, 900), 2)}},
+                   drug_type='allopathy', formulation_types=random.choice(FORMS), url='/p/{}'.format(i),
+                   categories_without_path=random.sample(categories, 2))
+
+
+def run(products=100000, batch_size=1000):
+    with tempfile.NamedTemporaryFile('w+', suffix='.json') as catalog:
+        json.dump(list(_catalog(products)), catalog)
+        catalog.flush()
+
+        with app.app_context():
+            connection = db.engine.connect()
+            transaction = connection.begin()
+            session = sessionmaker(bind=connection)()
+            try:
+                start = time.perf_counter()
+                catalog.seek(0)
+                importer = CatalogImporter(batch_size, session)
+                importer.add_all(normalize(row) for row in json.load(catalog))
+                elapsed = time.perf_counter() - start
+                print(importer.report())
+                print('{:.1f} s for {} rows, {:.0f} rows/s'.format(elapsed, products, products / elapsed))
+            finally:
+                session.close()
+                transaction.rollback()
+                connection.close()
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:3]])
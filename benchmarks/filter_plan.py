@@ -0,0 +1,71 @@
+"""
+Per-request cost of turning query args into filters for `StockResource`.
+
+    python -m benchmarks.filter_plan [iterations]
+"""
+import sys
+import timeit
+
+from sqlalchemy import and_
+
+from manager import app
+from src import db
+from src.products.resources import StockResource
+
+ARGS = {
+    '__is_sold__bool': ['false'],
+    '__expired__bool': ['false'],
+    '__units_sold__lte': ['10'],
+    '__brand_name__contains': ['cipla'],
+    '__product_name__contains': ['para'],
+    '__store_id__in': ['1,2,3'],
+    '__product_id__in': ['4,5,6'],
+    '__id__not_in': ['7,8'],
+    '__distributor_id__in': ['9'],
+    '__distributor_name__contains': ['med'],
+    '__updated_on__date_gte': ['2018-01-01T00:00:00.000Z'],
+    '__created_on__date_btw': ['2018-01-01T00:00:00.000Z,2018-04-01T00:00:00.000Z'],
+    '__expiry_date__date_lte': ['2019-01-01T00:00:00.000Z'],
+    '__limit': ['50'],
+    '__page': ['2'],
+}
+
+
+def legacy_apply_filters(resource, queryset, **kwargs):
+    for k, v in kwargs.items():
+        array_key = k.split('__')
+        if array_key[0] == '' and array_key[1] in resource.filters.keys():
+            for operator in resource.filters.get(array_key[1]):
+                if operator.op == array_key[2]:
+                    queryset = operator().prepare_queryset(queryset, resource.model, array_key[1], v)
+
+        elif array_key[0] == '' and array_key[1] in resource.external_filter.keys():
+            query_filter = resource.external_filter.get(array_key[1])
+            for operator in query_filter['filters']:
+                if operator.op == array_key[2]:
+                    queryset = queryset.join(query_filter['model'],
+                                             and_(getattr(query_filter['model'],
+                                                          query_filter['join']) == resource.model.id))
+
+                    queryset = operator().prepare_queryset(queryset, query_filter['model'], array_key[1], v)
+    return queryset
+
+
+def run(iterations=2000):
+    with app.app_context():
+        query = db.session.query(StockResource.model)
+        plan = StockResource.filter_plan
+        assert str(plan.apply(query, ARGS)) == str(legacy_apply_filters(StockResource, query, **ARGS))
+
+        legacy = timeit.timeit(lambda: legacy_apply_filters(StockResource, query, **ARGS), number=iterations)
+        planned = timeit.timeit(lambda: plan.apply(query, ARGS), number=iterations)
+
+    filters = len([key for key in ARGS if key in plan.entries])
+    print('{} filters, {} iterations'.format(filters, iterations))
+    print('legacy loop   {:8.1f} us/request'.format(legacy / iterations * 1e6))
+    print('filter plan   {:8.1f} us/request'.format(planned / iterations * 1e6))
+    print('speedup       {:8.2f}x'.format(legacy / planned))
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,70 @@
+"""
+Orders per second for concurrent billing terminals of one store, per invoice numbering strategy.
+
+    python -m benchmarks.invoice_numbers <store_id> [terminals] [seconds]
+
+Every terminal inserts and commits orders in a loop; the orders are deleted afterwards.
+"""
+import sys
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+from manager import app
+from src import db
+from src.orders.invoice import next_invoice_number
+from src.orders.models import Order
+from src.user.models import Store
+
+
+def row_lock(store, terminal_id):
+    # previous behaviour: the store row stays locked until the order commits
+    Store.query.filter(Store.id == store.id).update({'invoice_number': Store.invoice_number + 1}, 'fetch')
+    return Store.query.get(store.id).invoice_number
+
+
+def sequence(store, terminal_id):
+    return next_invoice_number(SimpleNamespace(id=store.id, invoice_number=store.invoice_number,
+                                               separate_offline_billing=False))
+
+
+def blocks(store, terminal_id):
+    return next_invoice_number(SimpleNamespace(id=store.id, invoice_number=store.invoice_number,
+                                               separate_offline_billing=True), terminal_id)
+
+
+def terminal(store_id, terminal_id, allocate, deadline, created):
+    with app.app_context():
+        store = Store.query.get(store_id)
+        while time.time() < deadline:
+            order = Order(store_id=store_id, is_draft=False)
+            order.invoice_number = allocate(store, terminal_id)
+            db.session.add(order)
+            db.session.commit()
+            created.append((order.id, order.invoice_number))
+        db.session.remove()
+
+
+def run(store_id, terminals=20, seconds=10):
+    for allocate in (row_lock, sequence, blocks):
+        created = []
+        deadline = time.time() + seconds
+        threads = [threading.Thread(target=terminal, args=(store_id, 'bench-{}'.format(i), allocate, deadline,
+                                                           created)) for i in range(terminals)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        duplicates = [number for number, count in Counter(number for _, number in created).items() if count > 1]
+        print('{:10s} {:8.1f} orders/s  {} orders  {} duplicate numbers'.format(
+            allocate.__name__, len(created) / seconds, len(created), len(duplicates)))
+        with app.app_context():
+            Order.query.filter(Order.id.in_([order_id for order_id, _ in created])).delete(synchronize_session=False)
+            db.session.commit()
+        assert not duplicates
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:4]])
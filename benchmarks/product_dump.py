@@ -0,0 +1,57 @@
+"""
+Milliseconds per page of `GET /product` dumped by marshmallow and by the compiled dumper, against the products of
+the configured database. Loading is left out, both dumps serialize the same loaded objects and must be equal.
+Combos, salts and product salts are dynamic relationships queried once per product by either dumper, so they are
+excluded to time the serialization itself.
+
+    python -m benchmarks.product_dump [pages] [limit]
+"""
+import sys
+import time
+
+import simplejson
+
+from manager import app
+from src import db
+from src.products.resources import ProductResource
+from src.utils.dumper import compiled_dumper
+
+
+def _time(dump, pages, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for items in pages:
+            dump(items)
+    return (time.perf_counter() - start) / (repeat * len(pages)) * 1e3
+
+
+def run(pages=10, limit=100, repeat=5):
+    path = '/api/v1/product?__limit={}&__exclude=_links,combos,salts,product_salts&__include=brand'.format(limit)
+    with app.test_request_context(path):
+        resource = ProductResource()
+        schema = resource.dump_schema()
+        query = ProductResource.model.query.options(*resource.load_options()).order_by(ProductResource.model.id)
+        loaded = [query.limit(limit).offset(page * limit).all() for page in range(pages)]
+        loaded = [items for items in loaded if items]
+        if not loaded:
+            print('no products to dump')
+            return
+
+        dumper = compiled_dumper(schema)
+        for items in loaded:
+            expected = simplejson.dumps(schema.dump(items, many=True).data, sort_keys=True)
+            assert simplejson.dumps(dumper.dump(items, many=True), sort_keys=True) == expected, \
+                'compiled dump differs from marshmallow'
+
+        marshmallow = _time(lambda items: schema.dump(items, many=True), loaded, repeat)
+        compiled = _time(lambda items: dumper.dump(items, many=True), loaded, repeat)
+        db.session.rollback()
+
+    rows = sum(len(items) for items in loaded)
+    print('{} products in {} pages'.format(rows, len(loaded)))
+    print('marshmallow {:.1f} ms/page, compiled {:.1f} ms/page, {:.1f}x'.format(marshmallow, compiled,
+                                                                               marshmallow / compiled))
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,75 @@
+"""
+Product lookups over a seeded catalog: `__name__contains` without indexes, `__name__contains` on the trigram index
+and the ranked `__keywords__search`, reporting the mean latency of a page of results for each.
+
+The seeded products are inserted, indexed and queried in one transaction that is rolled back afterwards.
+
+    python -m benchmarks.product_search [products] [repeat]
+"""
+import sys
+import time
+
+from sqlalchemy import Integer, func, literal, literal_column, select
+
+from manager import app
+from src import db
+from src.products.models import Brand, Product
+from src.products.resources import ProductResource
+from src.products.search import update_keywords
+
+product_table = Product.__table__
+
+WORDS = ['para', 'ceta', 'amoxi', 'cillin', 'azithro', 'mycin', 'metfor', 'min', 'ator', 'vastatin', 'panto',
+         'prazole', 'cetiri', 'zine', 'dolo', 'calpol', 'crocin', 'combi', 'flam', 'ibu', 'profen', 'diclo',
+         'fenac', 'levo', 'floxacin', 'omez', 'rantac', 'glyco', 'met', 'telmi', 'sartan']
+
+QUERIES = ['ceta', 'amoxicillin 17', 'vastatin', 'ibuprofen 42']
+
+
+def _word(step):
+    return literal(WORDS, type_=db.ARRAY(db.String))[literal_column('n', Integer) / step % len(WORDS) + 1]
+
+
+def _seed(products):
+    brand_id = db.session.execute(Brand.__table__.insert().values(name='benchmark-brand')
+                                  .returning(Brand.__table__.c.id)).scalar()
+    db.session.execute(product_table.insert().from_select(
+        ['name', 'therapeutic_name', 'brand_id'],
+        select([_word(1) + _word(len(WORDS)) + ' ' + func.cast(literal_column('n'), db.String),
+                _word(7) + _word(3), literal(brand_id)]).select_from(func.generate_series(1, products).alias('n'))))
+    update_keywords(db.session, product_table.c.brand_id == brand_id)
+    db.session.execute('ANALYZE product')
+    return brand_id
+
+
+def _time(arg, repeat, scans=True):
+    resource = ProductResource()
+    timings = []
+    for _ in range(repeat):
+        for value in QUERIES:
+            if not scans:
+                db.session.execute('SET LOCAL enable_bitmapscan = off')
+                db.session.execute('SET LOCAL enable_indexscan = off')
+            start = time.perf_counter()
+            resource.apply_filters(Product.query, **{arg: [value]}).limit(resource.default_limit).all()
+            timings.append(time.perf_counter() - start)
+            db.session.execute('SET LOCAL enable_bitmapscan = on')
+            db.session.execute('SET LOCAL enable_indexscan = on')
+    return sum(timings) / len(timings) * 1000
+
+
+def run(products=500000, repeat=5):
+    with app.test_request_context('/api/v1/product/'):
+        try:
+            start = time.perf_counter()
+            _seed(products)
+            print('{} products seeded and indexed in {:.1f} s'.format(products, time.perf_counter() - start))
+            print('contains, sequential scan  {:8.2f} ms'.format(_time('__name__contains', repeat, scans=False)))
+            print('contains, trigram index    {:8.2f} ms'.format(_time('__name__contains', repeat)))
+            print('search, ranked             {:8.2f} ms'.format(_time('__keywords__search', repeat)))
+        finally:
+            db.session.rollback()
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,98 @@
+"""
+Checkouts per second for concurrent terminals selling the same product, per stock allocation strategy.
+
+    python -m benchmarks.stock_allocation <product_id> <store_id> [terminals] [seconds] [batches]
+
+The product must have no stocks in the store. Every run seeds `batches` stocks of it with staggered expiry dates,
+then every terminal sells 1 to 3 units per checkout in a loop until the time is up or the stocks run out. A
+checkout updates the counters of the stocks it sold from as the item inserts of an order do. The seeded stocks are
+deleted afterwards.
+"""
+import random
+import sys
+import threading
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import and_, func, select
+
+from manager import app
+from src import db
+from src.products.allocation import InsufficientStock, allocate, stock_table
+from src.products.barcodes import default_stock
+from src.products.counters import apply_stock_delta
+
+UNITS = 50
+
+
+def client_pick(connection, product_id, store_id, quantity):
+    # previous behaviour: the terminal sells from the stock it was shown, nothing stops two terminals from
+    # selling the same units
+    stock = default_stock(connection, product_id, store_id)
+    if stock is None:
+        raise InsufficientStock(product_id, quantity, 0)
+    return [(stock['id'], quantity)]
+
+
+def blocking(connection, product_id, store_id, quantity):
+    return allocate(connection, product_id, store_id, quantity, skip_locked=False)
+
+
+def skip_locked(connection, product_id, store_id, quantity):
+    return allocate(connection, product_id, store_id, quantity)
+
+
+def terminal(engine, product_id, store_id, strategy, deadline, checkouts):
+    connection = engine.connect()
+    try:
+        while time.time() < deadline:
+            quantity = random.randint(1, 3)
+            transaction = connection.begin()
+            try:
+                for stock_id, units in strategy(connection, product_id, store_id, quantity):
+                    apply_stock_delta(connection, stock_id, units)
+            except InsufficientStock:
+                transaction.rollback()
+                return
+            transaction.commit()
+            checkouts.append(quantity)
+    finally:
+        connection.close()
+
+
+def seed(product_id, store_id, batches):
+    today = date.today()
+    rows = [dict(product_id=product_id, store_id=store_id, units_purchased=UNITS, units_available=UNITS,
+                 units_sold=0, purchase_amount=1, selling_amount=2, batch_number='bench-{}'.format(i),
+                 expiry_date=today + timedelta(days=30 + i)) for i in range(batches)]
+    db.engine.execute(stock_table.insert(), rows)
+
+
+def run(product_id, store_id, terminals=20, seconds=10, batches=200):
+    s = stock_table.c
+    seeded = and_(s.product_id == product_id, s.store_id == store_id, s.batch_number.like('bench-%'))
+    with app.app_context():
+        assert not db.engine.execute(select([func.count()]).where(and_(s.product_id == product_id,
+                                                                        s.store_id == store_id))).scalar()
+        for strategy in (client_pick, blocking, skip_locked):
+            seed(product_id, store_id, batches)
+            checkouts = []
+            started = time.time()
+            deadline = started + seconds
+            threads = [threading.Thread(target=terminal, args=(db.engine, product_id, store_id, strategy,
+                                                               deadline, checkouts)) for _ in range(terminals)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = min(time.time(), deadline) - started
+
+            oversold = db.engine.execute(select([func.coalesce(func.sum(-s.units_available), 0)])
+                                         .where(and_(seeded, s.units_available < 0))).scalar()
+            print('{:12s} {:8.1f} checkouts/s  {} checkouts  {} units  {} units oversold'.format(
+                strategy.__name__, len(checkouts) / elapsed, len(checkouts), sum(checkouts), oversold))
+            db.engine.execute(stock_table.delete().where(seeded))
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:6]])
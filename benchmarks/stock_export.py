@@ -0,0 +1,55 @@
+"""
+Exports `GET /stock?__export__` for a store after seeding it with stock rows, reporting rows/s and peak memory.
+
+The seeded rows are inserted and exported in one transaction that is rolled back afterwards.
+
+    python -m benchmarks.stock_export <store_id> <product_id> [rows] [xlsx]
+"""
+import resource
+import sys
+import time
+
+from sqlalchemy import func, literal, select
+
+from manager import app
+from src import db
+from src.products.models import Stock
+from src.products.resources import StockResource
+from src.utils.export import export_response
+
+stock_table = Stock.__table__
+
+
+def _seed(store_id, product_id, rows):
+    series = func.generate_series(1, rows).alias('n')
+    db.session.execute(stock_table.insert().from_select(
+        ['store_id', 'product_id', 'purchase_amount', 'selling_amount', 'units_purchased', 'units_available',
+         'is_sold'],
+        select([literal(store_id), literal(product_id), literal(10.0), literal(12.5), literal(10), literal(10),
+                literal(False)]).select_from(series)))
+
+
+def run(store_id, product_id, rows=1000000, xlsx=0):
+    file_format = 'xlsx' if xlsx else 'csv'
+    with app.test_request_context('/api/v1/stock/?__export__={}'.format(file_format)):
+        try:
+            _seed(store_id, product_id, rows)
+            baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            stock = StockResource()
+            query = Stock.query.options(*stock.load_options()).filter(Stock.store_id == store_id).order_by(Stock.id)
+            start = time.perf_counter()
+            response = export_response(query, stock.dump, 'Stock', file_format,
+                                       app.config.get('EXPORT_CHUNK_SIZE', 1000))
+            size = sum(len(chunk) for chunk in response.response)
+            elapsed = time.perf_counter() - start
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        finally:
+            db.session.rollback()
+
+    print('{} rows as {} in {:.1f} s, {:.0f} rows/s, {:.1f} MB'.format(rows, file_format, elapsed, rows / elapsed,
+                                                                     size / 2 ** 20))
+    print('peak rss grew {:.1f} MB while exporting'.format((peak - baseline) / 1024))
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:5]])
@@ -0,0 +1,49 @@
+"""
+Serializes pages of `GET /stock` against the configured database and asserts no statement writes.
+
+    python -m benchmarks.stock_reads [pages] [limit]
+"""
+import sys
+import time
+
+from sqlalchemy import event
+
+from manager import app
+from src import db
+from src.products.resources import StockResource
+
+WRITES = ('INSERT', 'UPDATE', 'DELETE')
+
+
+def run(pages=20, limit=100):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.lstrip().split(None, 1)[0].upper())
+
+    with app.test_request_context('/api/v1/stock/?__limit={}&__include=product_name,brand_name'.format(limit)):
+        engine = db.engine
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            resource = StockResource()
+            rows = 0
+            start = time.perf_counter()
+            for page in range(1, pages + 1):
+                query = StockResource.model.query.options(*resource.load_options()).order_by(StockResource.model.id)
+                items = query.limit(limit).offset((page - 1) * limit).all()
+                rows += len(resource.dump(items, many=True))
+            elapsed = time.perf_counter() - start
+            dirty = len(db.session.dirty) + len(db.session.new)
+            db.session.rollback()
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+
+    writes = [statement for statement in statements if statement in WRITES]
+    print('{} rows in {} pages, {:.1f} ms/page, {} statements'.format(rows, pages, elapsed / pages * 1e3,
+                                                                    len(statements)))
+    print('writes {}, dirty objects {}'.format(len(writes), dirty))
+    assert not writes and not dirty, 'serializing stocks wrote to the database'
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:3]])
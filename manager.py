@@ -5,13 +5,15 @@ import urllib.parse as up
 from flask_script import Manager
 from flask import url_for
 
-from src import api, db, ma, create_app, configs, bp, security, admin, celery, sentry
+from src import api, db, ma, create_app, configs, bp, security, admin, celery, sentry, redis_store, schema_cache, \
+    search_index, barcode_cache
 
 config = os.environ.get('PYTH_SRVR', 'default')
 
 config = configs.get(config)
 
-extensions = [api, db, ma, security, admin, celery, sentry]
+extensions = [api, db, ma, security, admin, celery, sentry, redis_store, schema_cache, search_index,
+              barcode_cache]
 bps = [bp]
 
 app = create_app(__name__, config, extensions=extensions, blueprints=bps)
@@ -47,6 +49,100 @@ def list_routes():
         print(line)
 
 
+@manager.option('-s', '--store', dest='store_ids', action='append', default=None)
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=10000)
+def reconcile_stock_counters(store_ids, batch_size):
+    """Recomputes units_sold/units_available of stocks from their items."""
+    from src.products.counters import reconcile_stock_counters as reconcile
+    print('{} stocks reconciled'.format(reconcile(store_ids, batch_size)))
+
+
+@manager.option('-s', '--store', dest='store_ids', action='append', type=int, default=None)
+@manager.option('-t', '--to', dest='to_date', default=None)
+@manager.option('-f', '--from', dest='from_date', required=True)
+def backfill_sales_rollups(from_date, to_date, store_ids):
+    """Rebuilds daily_store_sales/daily_product_sales between two YYYY-MM-DD dates, to defaulting to today."""
+    from datetime import date, datetime
+    from src.orders.rollups import backfill_daily_sales
+    from_date = datetime.strptime(from_date, '%Y-%m-%d').date()
+    to_date = datetime.strptime(to_date, '%Y-%m-%d').date() if to_date else date.today()
+    print('{} days rebuilt'.format(backfill_daily_sales(from_date, to_date, store_ids)))
+
+
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=10000)
+def reconcile_customer_aggregates(batch_size):
+    """Recomputes the order count, billing, amount due and order dates of customers."""
+    from src.user.aggregates import reconcile_customer_aggregates as reconcile
+    print('{} customers reconciled'.format(reconcile(batch_size)))
+
+
+@manager.option('-s', '--store', dest='store_ids', action='append', type=int, default=None)
+@manager.option('-t', '--to', dest='to_date', default=None)
+@manager.option('-f', '--from', dest='from_date', required=True)
+def backfill_customer_cohorts(from_date, to_date, store_ids):
+    """
+    Rebuilds weekly_customer_cohort and monthly_customer_cohort between two YYYY-MM-DD dates, run after
+    reconcile_customer_aggregates.
+    """
+    from datetime import date, datetime
+    from src.user.aggregates import backfill_monthly_cohorts, backfill_weekly_cohorts
+    from_date = datetime.strptime(from_date, '%Y-%m-%d').date()
+    to_date = datetime.strptime(to_date, '%Y-%m-%d').date() if to_date else date.today()
+    print('{} weeks rebuilt'.format(len(backfill_weekly_cohorts(from_date, to_date, store_ids))))
+    print('{} months rebuilt'.format(len(backfill_monthly_cohorts(from_date, to_date, store_ids))))
+
+
+@manager.option('-s', '--store', dest='store_ids', action='append', type=int, default=None)
+def snapshot_stock_valuation(store_ids):
+    """Rebuilds stock_valuation/distributor_purchase for every day."""
+    from src.products.valuation import snapshot_all
+    snapshot_all(store_ids)
+
+
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=10000)
+def reindex_products(batch_size):
+    """Recomputes the search documents of every product."""
+    from src.products.search import reindex_products as reindex
+    print('{} products indexed'.format(reindex(batch_size)))
+
+
+@manager.option('-c', '--clear', dest='clear', action='store_true', default=False)
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=None)
+def index_products(batch_size, clear):
+    """Upserts the search document of every product, emptying the search index first with -c."""
+    from src.products.indexing import reindex_all
+    if clear:
+        search_index.backend.clear()
+    print('{} products indexed'.format(reindex_all(batch_size)))
+
+
+@manager.option('-r', '--restart', dest='restart', action='store_true', default=False)
+@manager.option('-c', '--chunk-size', dest='chunk_size', type=int, default=1000)
+@manager.option('-w', '--workers', dest='workers', type=int, default=None)
+@manager.option('-t', '--format', dest='fmt', choices=('jsonl', 'csv'), default=None)
+@manager.option('-f', '--file', dest='path', required=True)
+def import_catalog(path, fmt, workers, chunk_size, restart):
+    """Imports a JSON lines or CSV catalog dump, resuming from its checkpoint unless -r is given."""
+    from src.products.catalog_files import ingest_file
+    counts = ingest_file(path, fmt, workers, chunk_size, restart)
+    print('{rows} rows, {imported} products imported, {skipped} skipped'.format(**counts))
+
+
+@manager.command
+def stats_cache_info():
+    """Prints the hits, misses and hit rate of the stats response cache."""
+    from src.utils.stats_cache import cache_info
+    for endpoint, counts in sorted(cache_info().items()):
+        print('{:20s} hits {hits:>10} misses {misses:>10} hit rate {hit_rate:.2%}'.format(endpoint, **counts))
+
+
+@manager.command
+def schema_cache_info():
+    """Prints the hits, misses and hit rate of the schema cache reported by all the processes."""
+    from src.utils.schema import schema_cache
+    print('hits {hits:>10} misses {misses:>10} hit rate {hit_rate:.2%}'.format(**schema_cache.shared_info()))
+
+
 @manager.option('-A', '--application', dest='application', default='', required=True)
 @manager.option('-n', '--name', dest='name')
 @manager.option('-l', '--debug', dest='debug')
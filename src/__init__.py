@@ -1,10 +1,17 @@
 from .config import configs
 from .utils import api, db, ma, create_app, ReprMixin, bp, BaseMixin, admin, BaseSchema, BaseView,\
-    AssociationView, celery, sentry
+    AssociationView, celery, sentry, redis_store, schema_cache, search_index
 
 from .products import models
 from .orders import models
 from .user import models
+from .products import counters
+from .orders import rollups
+from .user import aggregates
+from .products import valuation
+from .products import search
+from .products import indexing
+from .products.barcodes import barcode_cache
 from .products import schemas
 from .orders import schemas
 from .user import schemas
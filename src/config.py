@@ -1,4 +1,8 @@
 import os
+import tempfile
+from datetime import timedelta
+
+from celery.schedules import crontab
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
@@ -28,6 +32,50 @@ class BaseConfig:
     SECURITY_POST_LOGIN_VIEW = '/admin/'
     SECURITY_TOKEN_AUTHENTICATION_HEADER = 'Authorization'
     MAX_AGE = 86400
+    REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+    AUTH_SNAPSHOT_TTL = 3600
+    SCHEMA_CACHE_SIZE = 128
+    SCHEMA_CACHE_REPORT_EVERY = 1000
+    STOCK_SWEEP_BATCH_SIZE = 5000
+    INVOICE_BLOCK_SIZE = 50
+    ORDER_SYNC_MAX_BATCH = 2000
+    IDEMPOTENCY_TTL = 86400
+    IDEMPOTENCY_LOCK_TIMEOUT = 60
+    EXPORT_CHUNK_SIZE = 1000
+    EXPORT_DIR = os.environ.get('EXPORT_DIR', os.path.join(tempfile.gettempdir(), 'pos-exports'))
+    EXPORT_JOB_TTL = 86400
+    EXPORT_JOB_STALE_AFTER = 600
+    STATS_CACHE_TTL = 7 * 86400
+    STATS_CACHE_TODAY_TTL = 60
+    SEARCH_INDEX = 'products'
+    SEARCH_INDEX_BATCH_SIZE = 500
+    BARCODE_STOCK_TTL = 300
+    CELERYBEAT_SCHEDULE = {
+        'sweep-stocks': {
+            'task': 'src.tasks.stock_tasks.sweep_stocks',
+            'schedule': timedelta(minutes=15),
+        },
+        'index-products': {
+            'task': 'src.tasks.elastic_tasks.index_products',
+            'schedule': timedelta(seconds=10),
+        },
+        'refresh-sales-rollups': {
+            'task': 'src.tasks.rollup_tasks.refresh_sales_rollups',
+            'schedule': timedelta(minutes=1),
+        },
+        'refresh-stock-valuation': {
+            'task': 'src.tasks.rollup_tasks.refresh_stock_valuation',
+            'schedule': timedelta(minutes=1),
+        },
+        'snapshot-stock-valuation': {
+            'task': 'src.tasks.rollup_tasks.snapshot_stock_valuation',
+            'schedule': crontab(hour=2, minute=30),
+        },
+        'purge-exports': {
+            'task': 'src.tasks.export_tasks.purge_exports',
+            'schedule': timedelta(hours=1),
+        },
+    }
     GOOGLE_APPLICATION_CREDENTIALS = ''
 
     @staticmethod
@@ -0,0 +1,145 @@
+"""
+Invoice number allocation without a row lock on `store`.
+
+Numbers come from a postgres sequence per store, `store_invoice_seq_<id>`, created on first use and starting
+after `Store.invoice_number`. `nextval` never blocks and is not rolled back, so orders of all terminals of a
+store are numbered concurrently at the cost of gaps left by failed orders. `Store.invoice_number` seeds the
+sequence and is left as is afterwards: `StoreSchema` dumps the last number of the sequence instead, and writing
+`Store.invoice_number` reseeds the sequence once the write commits.
+
+Stores with `separate_offline_billing` hand every terminal (`X-Terminal-Id` header) a block of
+`INVOICE_BLOCK_SIZE` numbers taken from the same sequence, so a terminal only ever locks its own block rows.
+"""
+from itertools import groupby
+from typing import List, Tuple
+
+from flask import current_app
+from sqlalchemy import and_, event, func, select, text
+from sqlalchemy.exc import IntegrityError, ProgrammingError
+from sqlalchemy.orm.attributes import get_history
+
+from src import db
+from src.user.models import Store
+from src.utils import commit_hooks
+from .models import InvoiceBlock
+
+SEQUENCE_NAME = 'store_invoice_seq_{}'
+
+block_table = InvoiceBlock.__table__
+
+_sequences = set()
+
+
+def _ensure_sequence(store: Store) -> str:
+    name = SEQUENCE_NAME.format(int(store.id))
+    if name not in _sequences:
+        # created outside the request transaction so a rollback doesn't drop it
+        with db.engine.connect() as connection:
+            try:
+                connection.execution_options(autocommit=True).execute(
+                    text('CREATE SEQUENCE IF NOT EXISTS {} START WITH {}'.format(name, store.invoice_number + 1)))
+            except (IntegrityError, ProgrammingError):
+                # created concurrently by another process
+                pass
+        _sequences.add(name)
+    return name
+
+
+# a catalog query rather than `to_regclass`: a backend keeps failed name lookups cached within its transaction,
+# so a later `nextval` there would miss a sequence created meanwhile by `_ensure_sequence`
+_SEQUENCE_EXISTS = text("SELECT EXISTS (SELECT 1 FROM pg_class WHERE relkind = 'S' AND relname = :name "
+                        "AND relnamespace = current_schema()::regnamespace)")
+
+
+def _sequence_exists(connection, name: str) -> bool:
+    return name in _sequences or connection.execute(_SEQUENCE_EXISTS, name=name).scalar()
+
+
+def current_invoice_number(store: Store) -> int:
+    """The last invoice number handed out for `store`, without creating its sequence."""
+    connection = db.session.connection()
+    name = SEQUENCE_NAME.format(int(store.id))
+    if connection.dialect.name != 'postgresql' or not _sequence_exists(connection, name):
+        return store.invoice_number
+    last_value, is_called = connection.execute(text('SELECT last_value, is_called FROM {}'.format(name))).first()
+    return last_value if is_called else last_value - 1
+
+
+def reseed_sequences(store_ids) -> None:
+    """Restarts the sequences of `store_ids` after their `Store.invoice_number`."""
+    with db.engine.begin() as connection:
+        if connection.dialect.name != 'postgresql':
+            return
+        for store_id, invoice_number in connection.execute(select([Store.id, Store.invoice_number])
+                                                           .where(Store.id.in_(list(store_ids)))):
+            name = SEQUENCE_NAME.format(int(store_id))
+            # a sequence created later starts after the store number anyway
+            if _sequence_exists(connection, name):
+                connection.execute(select([func.setval(name, invoice_number + 1, False)]))
+                # numbers left in the terminal blocks belong to the old numbering
+                connection.execute(block_table.delete().where(block_table.c.store_id == store_id))
+
+
+@event.listens_for(Store, 'after_update')
+def _store_number_changed(mapper, connection, target):
+    if get_history(target, 'invoice_number').has_changes():
+        commit_hooks.mark_object(target, 'invoice_seed', target.id)
+
+
+commit_hooks.register_commit_handler('invoice_seed', reseed_sequences)
+
+
+def _ranges(numbers: List[int]) -> List[Tuple[int, int]]:
+    ranges = []
+    for _, group in groupby(enumerate(sorted(numbers)), lambda pair: pair[1] - pair[0]):
+        group = [number for _, number in group]
+        ranges.append((group[0], group[-1]))
+    return ranges
+
+
+def reserve_block(store: Store, terminal_id: str, size: int) -> None:
+    """Reserves `size` numbers of the store sequence for `terminal_id` and drops its exhausted blocks."""
+    name = _ensure_sequence(store)
+    with db.engine.begin() as connection:
+        numbers = [row[0] for row in connection.execute(
+            select([func.nextval(name)]).select_from(func.generate_series(1, size)))]
+        connection.execute(block_table.delete().where(and_(block_table.c.store_id == store.id,
+                                                           block_table.c.terminal_id == terminal_id,
+                                                           block_table.c.next_number > block_table.c.last_number)))
+        connection.execute(block_table.insert(), [dict(store_id=store.id, terminal_id=terminal_id, next_number=first,
+                                                       last_number=last) for first, last in _ranges(numbers)])
+
+
+def _take_from_block(store_id, terminal_id: str):
+    block_id = select([block_table.c.id]).where(and_(block_table.c.store_id == store_id,
+                                                     block_table.c.terminal_id == terminal_id,
+                                                     block_table.c.next_number <= block_table.c.last_number)) \
+        .order_by(block_table.c.next_number).limit(1).with_for_update().as_scalar()
+    return db.session.execute(block_table.update().where(block_table.c.id == block_id)
+                              .values(next_number=block_table.c.next_number + 1)
+                              .returning(block_table.c.next_number - 1)).scalar()
+
+
+def next_invoice_number(store: Store, terminal_id: str = None) -> int:
+    if db.session.connection().dialect.name != 'postgresql':
+        Store.query.filter(Store.id == store.id).update({'invoice_number': Store.invoice_number + 1}, 'fetch')
+        return store.invoice_number
+
+    if store.separate_offline_billing and terminal_id:
+        number = _take_from_block(store.id, terminal_id)
+        if number is None:
+            reserve_block(store, terminal_id, current_app.config.get('INVOICE_BLOCK_SIZE', 50))
+            number = _take_from_block(store.id, terminal_id)
+        return number
+
+    return db.session.execute(select([func.nextval(_ensure_sequence(store))])).scalar()
+
+
+def next_invoice_numbers(store: Store, count: int, terminal_id: str = None) -> List[int]:
+    """`count` invoice numbers for a batch of orders, drawn from the sequence in a single statement."""
+    if count <= 0:
+        return []
+    if db.session.connection().dialect.name != 'postgresql' or (store.separate_offline_billing and terminal_id):
+        return [next_invoice_number(store, terminal_id) for _ in range(count)]
+    return sorted(row[0] for row in db.session.execute(
+        select([func.nextval(_ensure_sequence(store))]).select_from(func.generate_series(1, count))))
@@ -31,6 +31,8 @@ class Order(BaseMixin, db.Model, ReprMixin):
     is_void = db.Column(db.Boolean(), default=False)
     invoice_number = db.Column(db.Integer)
     reference_number = db.Column(db.String(12), nullable=True)
+    # key generated by the terminal, makes offline order sync idempotent
+    client_reference = db.Column(db.String(64), nullable=True)
 
     customer_id = db.Column(db.ForeignKey('customer.id'), nullable=True, index=True)
     user_id = db.Column(db.ForeignKey('user.id'), nullable=True, index=True)
@@ -44,6 +46,8 @@ class Order(BaseMixin, db.Model, ReprMixin):
     store = db.relationship('Store', foreign_keys=[store_id], lazy='subquery')
     time_line = db.relationship('Status', secondary='order_status')
 
+    __table_args__ = (db.UniqueConstraint('store_id', 'client_reference', name='uq_order_store_client_reference'),)
+
     @hybrid_property
     def total_discount(self):
         return sum([discount.value if discount.type == 'VALUE' else float(self.total*discount/100)
@@ -122,3 +126,50 @@ class ItemTax(BaseMixin, db.Model):
 
     tax = db.relationship('Tax', foreign_keys=[tax_id])
     item = db.relationship('Item', back_populates='taxes', foreign_keys=[item_id])
+
+
+class InvoiceBlock(BaseMixin, db.Model, ReprMixin):
+    """Range of invoice numbers reserved for one billing terminal of a store, see src/orders/invoice.py."""
+
+    __repr_fields__ = ['store_id', 'terminal_id', 'next_number', 'last_number']
+
+    terminal_id = db.Column(db.String(55), nullable=False)
+    next_number = db.Column(db.Integer, nullable=False)
+    last_number = db.Column(db.Integer, nullable=False)
+
+    store_id = db.Column(db.ForeignKey('store.id', ondelete='CASCADE'), nullable=False)
+
+    __table_args__ = (db.Index('ix_invoice_block_store_terminal', store_id, terminal_id),)
+
+
+class DailyStoreSales(BaseMixin, db.Model, ReprMixin):
+    """Sales of a store on one day, kept up to date from its orders by src/orders/rollups.py."""
+
+    __repr_fields__ = ['store_id', 'day', 'orders', 'total']
+
+    day = db.Column(db.Date, nullable=False)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Float(precision=2), nullable=False, default=0)
+    amount_due = db.Column(db.Float(precision=2), nullable=False, default=0)
+    quantity = db.Column(db.Float(precision=2), nullable=False, default=0)
+
+    store_id = db.Column(db.ForeignKey('store.id', ondelete='CASCADE'), nullable=False)
+
+    __table_args__ = (db.UniqueConstraint('store_id', 'day', name='uq_daily_store_sales_store_day'),)
+
+
+class DailyProductSales(BaseMixin, db.Model, ReprMixin):
+    """Units sold, sales and purchase cost of a product in a store on one day, see src/orders/rollups.py."""
+
+    __repr_fields__ = ['store_id', 'day', 'product_id', 'quantity']
+
+    day = db.Column(db.Date, nullable=False)
+    quantity = db.Column(db.Float(precision=2), nullable=False, default=0)
+    sales = db.Column(db.Float(precision=2), nullable=False, default=0)
+    cost = db.Column(db.Float(precision=2), nullable=False, default=0)
+
+    store_id = db.Column(db.ForeignKey('store.id', ondelete='CASCADE'), nullable=False)
+    product_id = db.Column(db.ForeignKey('product.id', ondelete='CASCADE'), nullable=False)
+
+    __table_args__ = (db.UniqueConstraint('store_id', 'day', 'product_id',
+                                          name='uq_daily_product_sales_store_day_product'),)
@@ -1,9 +1,13 @@
+from flask import request
 from sqlalchemy.sql import false
 from flask_security import current_user
 
+from src import db
 from src.utils import ModelResource, operators as ops
+from src.products.allocation import allocate_order_items
 from src.user.models import Store
 
+from .invoice import next_invoice_number
 from .models import Item, Order, ItemTax, Status
 from .schemas import ItemSchema, ItemTaxSchema, OrderSchema, StatusSchema
 
@@ -30,6 +34,8 @@ class OrderResource(ModelResource):
 
     roles_accepted = ('admin',)
 
+    export = True
+
     def has_read_permission(self, qs):
         if current_user.has_permission('view_order'):
             return qs.filter(self.model.store_id.in_(current_user.store_ids))
@@ -43,14 +49,16 @@ class OrderResource(ModelResource):
         return current_user.has_shop_access(obj.store_id) and current_user.has_permission('remove_order')
 
     def has_add_permission(self, objects):
+        store_id = current_user.store_ids[0]
+        store = Store.query.get(store_id)
+        terminal_id = request.headers.get('X-Terminal-Id')
         for obj in objects:
-            store_id = current_user.store_ids[0]
             obj.user_id = current_user.id
             obj.store_id = store_id
-            store = Store.query.get(store_id)
-            Store.query.filter(Store.id == store_id) \
-                .update({'invoice_number': Store.invoice_number + 1}, 'fetch')
-            obj.invoice_number = store.invoice_number
+            obj.invoice_number = next_invoice_number(store, terminal_id)
+            # items not flushed yet are the ones the client sent, not a query of the order's saved items
+            with db.session.no_autoflush:
+                allocate_order_items(db.session, obj)
         return True
 
 
@@ -0,0 +1,213 @@
+"""
+Daily sales rollups: `daily_store_sales` and `daily_product_sales`.
+
+Writes to orders and items mark the (store, day) they touch; once the transaction commits the marks are queued
+in redis and `refresh_sales_rollups` recomputes those days from the orders. Void orders are not counted. Readers
+take past days from the rollups and compute the current day live, see `store_sales_between`.
+"""
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Callable, Dict, Iterable, List, Set
+
+from sqlalchemy import Date, and_, cast, event, func, select, union_all
+from sqlalchemy.orm import object_session
+from sqlalchemy.orm.attributes import get_history
+
+from src import db, redis_store
+from src.products.models import Stock
+from src.utils import commit_hooks, stats_cache
+from .models import DailyProductSales, DailyStoreSales, Item, Order
+
+DIRTY_KEY = 'sales_rollup:dirty'
+
+order_table = Order.__table__
+item_table = Item.__table__
+stock_table = Stock.__table__
+store_sales_table = DailyStoreSales.__table__
+product_sales_table = DailyProductSales.__table__
+
+
+def _orders(start: datetime, end: datetime, store_ids: Iterable = None):
+    criterion = and_(order_table.c.created_on >= start, order_table.c.created_on < end,
+                     order_table.c.is_void.isnot(True), order_table.c.store_id.isnot(None))
+    if store_ids is not None:
+        criterion = and_(criterion, order_table.c.store_id.in_(list(store_ids)))
+    return criterion
+
+
+def store_sales(start: datetime, end: datetime, store_ids: Iterable = None):
+    """Per store and day totals of the orders created in [start, end), in the columns of `daily_store_sales`."""
+    day = cast(order_table.c.created_on, Date).label('day')
+    quantity = select([func.coalesce(func.sum(item_table.c.quantity), 0)]) \
+        .where(and_(item_table.c.order_id == order_table.c.id, item_table.c.stock_adjust.isnot(True))).as_scalar()
+    return select([order_table.c.store_id, day, func.count(order_table.c.id).label('orders'),
+                   func.coalesce(func.sum(order_table.c.total), 0).label('total'),
+                   func.coalesce(func.sum(order_table.c.total - func.coalesce(order_table.c.amount_paid, 0)), 0)
+                   .label('amount_due'),
+                   func.coalesce(func.sum(quantity), 0).label('quantity')]) \
+        .where(_orders(start, end, store_ids)).group_by(order_table.c.store_id, day)
+
+
+def product_sales(start: datetime, end: datetime, store_ids: Iterable = None):
+    """Per store, day and product sales of the orders created in [start, end), as in `daily_product_sales`."""
+    day = cast(order_table.c.created_on, Date).label('day')
+    return select([order_table.c.store_id, day, stock_table.c.product_id,
+                   func.sum(item_table.c.quantity).label('quantity'),
+                   func.coalesce(func.sum(item_table.c.unit_price * item_table.c.quantity), 0).label('sales'),
+                   func.coalesce(func.sum(stock_table.c.purchase_amount * item_table.c.quantity), 0).label('cost')]) \
+        .select_from(item_table.join(order_table, order_table.c.id == item_table.c.order_id)
+                     .join(stock_table, stock_table.c.id == item_table.c.stock_id)) \
+        .where(and_(_orders(start, end, store_ids), item_table.c.stock_adjust.isnot(True))) \
+        .group_by(order_table.c.store_id, day, stock_table.c.product_id)
+
+
+ROLLUPS = ((store_sales_table, store_sales), (product_sales_table, product_sales))
+
+# other rollups refreshed from the store days drained by `refresh_pending_sales`
+_day_refreshers: List[Callable[[Dict[date, Set[int]]], None]] = []
+
+
+def register_day_refresher(refresher: Callable[[Dict[date, Set[int]]], None]) -> None:
+    _day_refreshers.append(refresher)
+
+
+def refresh_daily_sales(day: date, store_ids: Iterable = None) -> None:
+    """Recomputes the rollups of `day` for `store_ids`, or every store, in the current transaction."""
+    start = datetime.combine(day, time.min)
+    store_ids = None if store_ids is None else list(store_ids)
+    for table, query in ROLLUPS:
+        criterion = table.c.day == day
+        if store_ids is not None:
+            criterion = and_(criterion, table.c.store_id.in_(store_ids))
+        db.session.execute(table.delete().where(criterion))
+        rows = query(start, start + timedelta(days=1), store_ids)
+        db.session.execute(table.insert().from_select([column.name for column in rows.columns], rows))
+
+
+def _between(table, query, from_date: date, to_date: date, store_ids: Iterable):
+    """Rows of `table` from `from_date` to `to_date` with the current day computed live."""
+    store_ids = list(store_ids)
+    today = date.today()
+    rolled = select([table.c[column.name] for column in query(today, today, store_ids).columns]) \
+        .where(and_(table.c.store_id.in_(store_ids), table.c.day >= from_date,
+                    table.c.day <= min(to_date, today - timedelta(days=1))))
+    if from_date <= today <= to_date:
+        start = datetime.combine(today, time.min)
+        return union_all(rolled, query(start, start + timedelta(days=1), store_ids)).alias()
+    return rolled.alias()
+
+
+def store_sales_between(from_date: date, to_date: date, store_ids: Iterable):
+    return _between(store_sales_table, store_sales, from_date, to_date, store_ids)
+
+
+def product_sales_between(from_date: date, to_date: date, store_ids: Iterable):
+    return _between(product_sales_table, product_sales, from_date, to_date, store_ids)
+
+
+def store_day(store_id, created_on: datetime) -> str:
+    return '{}:{}'.format(store_id, (created_on or datetime.now()).date())
+
+
+def _parse(key) -> tuple:
+    store_id, day = (key.decode('utf-8') if isinstance(key, bytes) else key).split(':')
+    return int(store_id), datetime.strptime(day, '%Y-%m-%d').date()
+
+
+def drain_store_days(key: str, refresh: Callable[[date, Set[int]], None]) -> Dict[date, Set[int]]:
+    """
+    Pops the `store_id:day` members queued in the redis set `key` and calls `refresh` for each day with its stores,
+    committing after each day and invalidating the cached stats of its stores. When a refresh fails the days left
+    are queued again.
+    """
+    pipeline = redis_store.pipeline()
+    pipeline.smembers(key)
+    pipeline.delete(key)
+    days = defaultdict(set)
+    for member in pipeline.execute()[0]:
+        store_id, day = _parse(member)
+        days[day].add(store_id)
+
+    pending = sorted(days.items())
+    try:
+        while pending:
+            day, store_ids = pending[0]
+            refresh(day, store_ids)
+            db.session.commit()
+            stats_cache.bump_stores(store_ids)
+            pending.pop(0)
+    except Exception:
+        db.session.rollback()
+        redis_store.sadd(key, *('{}:{}'.format(store_id, day) for day, store_ids in pending
+                                for store_id in store_ids))
+        raise
+    return days
+
+
+def refresh_pending_sales() -> int:
+    """Refreshes the (store, day) pairs queued since the last run."""
+    days = drain_store_days(DIRTY_KEY, refresh_daily_sales)
+    for refresher in _day_refreshers:
+        refresher(days)
+    stats_cache.bump_stores(set().union(*days.values()))
+    return sum(len(store_ids) for store_ids in days.values())
+
+
+def backfill_daily_sales(from_date: date, to_date: date, store_ids: Iterable = None) -> int:
+    """Rebuilds the rollups of every day from `from_date` to `to_date`, committing after each day."""
+    days = 0
+    day = from_date
+    while day <= to_date:
+        refresh_daily_sales(day, store_ids)
+        db.session.commit()
+        day += timedelta(days=1)
+        days += 1
+    return days
+
+
+def mark_sales(session, store_id, created_on) -> None:
+    if store_id is not None:
+        commit_hooks.mark(session, 'sales', store_day(store_id, created_on))
+
+
+def _queue_sales(keys: Set[str]) -> None:
+    redis_store.sadd(DIRTY_KEY, *keys)
+    # the current day is computed live
+    stats_cache.bump_stores({_parse(key)[0] for key in keys})
+
+
+def _queue_orders(order_ids: Set[int]) -> None:
+    # the session can't run statements once it has committed
+    with db.engine.connect() as connection:
+        rows = connection.execute(select([order_table.c.store_id, order_table.c.created_on])
+                                  .where(order_table.c.id.in_(list(order_ids))))
+        keys = {store_day(store_id, created_on) for store_id, created_on in rows if store_id is not None}
+    if keys:
+        _queue_sales(keys)
+
+
+@event.listens_for(Order, 'after_insert')
+@event.listens_for(Order, 'after_update')
+def _order_changed(mapper, connection, target):
+    commit_hooks.mark_object(target, 'sales_orders', target.id)
+    previous_store = get_history(target, 'store_id').deleted
+    previous_created = get_history(target, 'created_on').deleted
+    if previous_store or previous_created:
+        mark_sales(object_session(target), (previous_store or [target.store_id])[0],
+                   (previous_created or [target.__dict__.get('created_on')])[0])
+
+
+@event.listens_for(Order, 'after_delete')
+def _order_deleted(mapper, connection, target):
+    mark_sales(object_session(target), target.store_id, target.__dict__.get('created_on'))
+
+
+@event.listens_for(Item, 'after_insert')
+@event.listens_for(Item, 'after_update')
+@event.listens_for(Item, 'after_delete')
+def _item_changed(mapper, connection, target):
+    commit_hooks.mark_object(target, 'sales_orders', target.order_id, *get_history(target, 'order_id').deleted)
+
+
+commit_hooks.register_commit_handler('sales', _queue_sales)
+commit_hooks.register_commit_handler('sales_orders', _queue_orders)
@@ -1,8 +1,8 @@
-from marshmallow import pre_load
+from marshmallow import ValidationError, pre_load, validate, validates_schema
 from flask_security import current_user
 
 from src import ma, BaseSchema
-from src.user.models import Customer
+from src.user.models import Customer, CustomerAddress
 from .models import Order, Item, ItemTax, Status
 
 
@@ -45,11 +45,11 @@ class ItemSchema(BaseSchema):
         exclude = ('created_on', 'updated_on')
 
     id = ma.Integer(dump_only=True)
-    product_id = ma.Integer(load=False, dump_only=True)
+    product_id = ma.Integer(allow_none=True)
     unit_price = ma.Float(precision=2)
     quantity = ma.Float(precision=2)
     order_id = ma.Integer()
-    stock_id = ma.Integer()
+    stock_id = ma.Integer(allow_none=True)
     discount = ma.Float()
     discounted_total_price = ma.Float(dump_only=True)
     discounted_unit_price = ma.Float(dump_only=True)
@@ -80,3 +80,76 @@ class StatusSchema(BaseSchema):
 
     name = ma.String()
     amount = ma.Float(precision=2)
+
+
+class ItemTaxSyncSchema(ma.Schema):
+    tax_id = ma.Integer(required=True)
+    tax_value = ma.Float(allow_none=True)
+    tax_amount = ma.Float(allow_none=True)
+
+
+class ItemSyncSchema(ma.Schema):
+    name = ma.String(allow_none=True, validate=validate.Length(max=55))
+    unit_price = ma.Float(required=True)
+    quantity = ma.Float(required=True)
+    discount = ma.Float(missing=0)
+    stock_adjust = ma.Boolean(missing=False)
+    stock_id = ma.Integer(allow_none=True)
+
+    taxes = ma.Nested(ItemTaxSyncSchema, many=True, missing=list)
+
+
+class OrderSyncSchema(ma.Schema):
+    client_reference = ma.String(required=True, validate=validate.Length(min=1, max=64))
+    created_on = ma.DateTime(allow_none=True)
+    is_draft = ma.Boolean(missing=False)
+    is_void = ma.Boolean(missing=False)
+    sub_total = ma.Float(missing=0)
+    total = ma.Float(missing=0)
+    amount_paid = ma.Float(missing=0)
+    auto_discount = ma.Float(missing=0)
+    reference_number = ma.String(allow_none=True, validate=validate.Length(max=12))
+    customer_id = ma.Integer(allow_none=True)
+    address_id = ma.Integer(allow_none=True)
+
+    items = ma.Nested(ItemSyncSchema, many=True, required=True)
+
+    @pre_load(pass_many=True)
+    def load_customers(self, data, many):
+        """Customers and addresses of the batch in the organisation of `context['organisation_id']`."""
+        if 'organisation_id' not in self.context:
+            return data
+        orders = [order for order in (data if many else [data]) if isinstance(order, dict)]
+        customer_ids, address_ids = _ids(orders, 'customer_id'), _ids(orders, 'address_id')
+        organisation_id = self.context['organisation_id']
+        self.context['customers'] = {customer_id for customer_id, in Customer.query.with_entities(Customer.id)
+                                     .filter(Customer.id.in_(customer_ids),
+                                             Customer.organisation_id == organisation_id)} if customer_ids else set()
+        self.context['addresses'] = dict(
+            CustomerAddress.query.join(Customer, Customer.id == CustomerAddress.customer_id)
+            .with_entities(CustomerAddress.address_id, CustomerAddress.customer_id)
+            .filter(CustomerAddress.address_id.in_(address_ids), Customer.organisation_id == organisation_id)
+        ) if address_ids else {}
+        return data
+
+    @validates_schema
+    def validate_customer(self, data):
+        if 'organisation_id' not in self.context:
+            return
+        customer_id, address_id = data.get('customer_id'), data.get('address_id')
+        if customer_id is not None and customer_id not in self.context['customers']:
+            raise ValidationError('Unknown customer', 'customer_id')
+        if address_id is not None:
+            owner = self.context['addresses'].get(address_id)
+            if owner is None or customer_id is not None and owner != customer_id:
+                raise ValidationError('Unknown address', 'address_id')
+
+
+def _ids(orders, key):
+    ids = set()
+    for order in orders:
+        try:
+            ids.add(int(order[key]))
+        except (KeyError, TypeError, ValueError):
+            pass
+    return list(ids)
@@ -0,0 +1,159 @@
+"""
+Bulk ingestion of orders queued by terminals while they were offline.
+
+Every order carries a `client_reference` generated by the terminal; `(store_id, client_reference)` is unique, so
+a batch pushed again answers with the orders created the first time instead of duplicating them. A batch is
+validated in one pass, ids and invoice numbers are drawn from their sequences up front and orders, items and
+item taxes go in as multi-row INSERTs.
+"""
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+
+from src import db
+from src.products.counters import apply_stock_delta
+from src.products.barcodes import mark_sold
+from src.products.valuation import mark_stocks
+from src.products.models import Stock, Tax
+from src.user.aggregates import count_orders
+from src.user.models import Store
+from .invoice import next_invoice_numbers
+from .models import Item, ItemTax, Order
+from .rollups import mark_sales
+from .schemas import OrderSyncSchema
+
+CHUNK_SIZE = 500
+
+order_table = Order.__table__
+item_table = Item.__table__
+tax_table = ItemTax.__table__
+
+
+def _next_ids(table, count: int) -> List[int]:
+    if not count:
+        return []
+    sequence = '{}_id_seq'.format(table.name)
+    return [row[0] for row in db.session.execute(select([func.nextval(sequence)])
+                                                 .select_from(func.generate_series(1, count)))]
+
+
+def _insert(table, rows: List[Dict]) -> None:
+    for start in range(0, len(rows), CHUNK_SIZE):
+        db.session.execute(table.insert().values(rows[start:start + CHUNK_SIZE]))
+
+
+def _existing(store_id, references) -> Dict[str, tuple]:
+    if not references:
+        return {}
+    return {reference: (order_id, invoice_number) for reference, order_id, invoice_number in
+            Order.query.with_entities(Order.client_reference, Order.id, Order.invoice_number)
+            .filter(Order.store_id == store_id, Order.client_reference.in_(list(references)))}
+
+
+def _result(reference, status, order_id=None, invoice_number=None, errors=None) -> Dict:
+    result = {'client_reference': reference, 'status': status}
+    if order_id is not None:
+        result.update(id=order_id, invoice_number=invoice_number)
+    if errors:
+        result['errors'] = errors
+    return result
+
+
+def sync_orders(payload: List[Dict], store: Store, user_id, terminal_id: str = None) -> List[Dict]:
+    """
+    Inserts the valid, unseen orders of `payload` in the current transaction.
+
+    Returns one result per submitted order, in order, with status `created`, `duplicate` (with the id and
+    invoice number of the order created before) or `invalid` (with the validation errors). Customers and
+    addresses have to belong to the organisation of the store, stocks and taxes to the store.
+    """
+    data, errors = OrderSyncSchema(context={'organisation_id': store.organisation_id}).load(payload, many=True)
+    results = [None] * len(payload)
+    pending = {}
+
+    stock_ids = {item['stock_id'] for order in data for item in order.get('items', []) if item.get('stock_id')}
+    valid_stocks = {stock_id for stock_id, in Stock.query.with_entities(Stock.id)
+                    .filter(Stock.id.in_(list(stock_ids)), Stock.store_id == store.id)} if stock_ids else set()
+    tax_ids = {tax['tax_id'] for order in data for item in order.get('items', []) for tax in item.get('taxes', [])
+               if tax.get('tax_id')}
+    valid_taxes = {tax_id for tax_id, in Tax.query.with_entities(Tax.id)
+                   .filter(Tax.id.in_(list(tax_ids)), Tax.store_id == store.id)} if tax_ids else set()
+
+    for index, order in enumerate(data):
+        reference = order.get('client_reference')
+        if index in errors:
+            results[index] = _result(reference, 'invalid', errors=errors[index])
+            continue
+        unknown = sorted({item['stock_id'] for item in order['items'] if item.get('stock_id')} - valid_stocks)
+        unknown_taxes = sorted({tax['tax_id'] for item in order['items'] for tax in item['taxes']} - valid_taxes)
+        if unknown or unknown_taxes:
+            messages = [message.format(ids) for message, ids in (('Unknown stock {}', unknown),
+                                                                 ('Unknown tax {}', unknown_taxes)) if ids]
+            results[index] = _result(reference, 'invalid', errors={'items': messages})
+        elif reference in pending:
+            results[index] = _result(reference, 'duplicate')
+        else:
+            pending[reference] = index
+
+    for reference, (order_id, invoice_number) in _existing(store.id, pending).items():
+        results[pending.pop(reference)] = _result(reference, 'duplicate', order_id, invoice_number)
+
+    references = list(pending)
+    order_ids = _next_ids(order_table, len(references))
+    invoice_numbers = next_invoice_numbers(store, len(references), terminal_id)
+    now = datetime.now()
+    rows = []
+    for reference, order_id, invoice_number in zip(references, order_ids, invoice_numbers):
+        order = data[pending[reference]]
+        rows.append(dict(id=order_id, client_reference=reference, invoice_number=invoice_number, store_id=store.id,
+                         user_id=user_id, customer_id=order.get('customer_id'), address_id=order.get('address_id'),
+                         is_draft=order['is_draft'], is_void=order['is_void'], sub_total=order['sub_total'],
+                         total=order['total'], amount_paid=order['amount_paid'],
+                         auto_discount=order['auto_discount'], reference_number=order.get('reference_number'),
+                         created_on=order.get('created_on') or now, updated_on=now))
+
+    created = set()
+    for start in range(0, len(rows), CHUNK_SIZE):
+        statement = insert(order_table).values(rows[start:start + CHUNK_SIZE]) \
+            .on_conflict_do_nothing(index_elements=['store_id', 'client_reference']) \
+            .returning(order_table.c.client_reference)
+        created.update(reference for reference, in db.session.execute(statement))
+
+    # pushed concurrently by another request since the lookup above
+    for reference, (order_id, invoice_number) in _existing(store.id, set(pending) - created).items():
+        results[pending.pop(reference)] = _result(reference, 'duplicate', order_id, invoice_number)
+
+    orders = [(row, data[pending[row['client_reference']]]) for row in rows if row['client_reference'] in created]
+    item_ids = iter(_next_ids(item_table, sum(len(order['items']) for _, order in orders)))
+    items, taxes, sold = [], [], defaultdict(float)
+    for row, order in orders:
+        for item in order['items']:
+            item_id = next(item_ids)
+            items.append(dict(id=item_id, order_id=row['id'], name=item.get('name'), unit_price=item['unit_price'],
+                              quantity=item['quantity'], discount=item['discount'],
+                              stock_adjust=item['stock_adjust'], stock_id=item.get('stock_id'),
+                              created_on=row['created_on'], updated_on=now))
+            taxes.extend(dict(item_id=item_id, tax_id=tax['tax_id'], tax_value=tax.get('tax_value'),
+                              tax_amount=tax.get('tax_amount'), created_on=row['created_on'], updated_on=now)
+                         for tax in item['taxes'])
+            if item.get('stock_id') and not item['stock_adjust'] and not row['is_void']:
+                sold[item['stock_id']] += item['quantity']
+        results[pending[row['client_reference']]] = _result(row['client_reference'], 'created', row['id'],
+                                                            row['invoice_number'])
+    _insert(item_table, items)
+    _insert(tax_table, taxes)
+
+    # rows inserted through core skip the mapper events keeping the stock counters, customer aggregates and
+    # sales rollups
+    connection = db.session.connection()
+    for stock_id, quantity in sold.items():
+        apply_stock_delta(connection, stock_id, quantity)
+    mark_stocks(db.session, *sold)
+    mark_sold(db.session, *sold)
+    count_orders(connection, (row for row, _ in orders))
+    for row, _ in orders:
+        mark_sales(db.session, row['store_id'], row['created_on'])
+    return results
@@ -1,14 +1,20 @@
 from datetime import datetime
 
-from flask import make_response, jsonify, request
+from flask import current_app, make_response, jsonify, request
 from flask_restful import Resource
 from flask_security import auth_token_required, roles_accepted, current_user
-from sqlalchemy import func, and_, Date, Text
-
-from src import BaseView, api
-from src.products.models import Product, Stock
-from .models import Order, Item
+from sqlalchemy import func, select, Text
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from src import BaseView, api, db, sentry
+from src.utils.export_jobs import register_export
+from src.utils.stats_cache import cached_stats
+from src.products.models import Product
+from src.user.models import Store
+from .models import Order
 from .resources import ItemResource, OrderResource, ItemTaxResource, StatusResource
+from .rollups import product_sales_between, store_sales_between
+from .sync import sync_orders
 
 
 @api.register()
@@ -18,6 +24,9 @@ class OrderView(BaseView):
         return OrderResource
 
 
+register_export('order', OrderResource)
+
+
 @api.register()
 class ItemView(BaseView):
     @classmethod
@@ -40,7 +49,7 @@ class StatusView(BaseView):
 
 
 class OrderStatResource(Resource):
-    method_decorators = [roles_accepted('admin', 'owner', 'staff'), auth_token_required]
+    method_decorators = [cached_stats('order_stats'), roles_accepted('admin', 'owner', 'staff'), auth_token_required]
 
     model = Order
 
@@ -62,37 +71,27 @@ class OrderStatResource(Resource):
             if days > 360:
                 collection_type = 'month'
 
-        orders = self.model.query.join(Item, and_(Item.order_id == self.model.id)) \
-            .filter(self.model.retail_shop_id.in_(shops), self.model.created_on.between(from_date, to_date))
-
-        total_orders, total_sales, total_items, total_quantity, total_due = \
-            orders.with_entities(func.Count(func.Distinct(self.model.id)), func.sum(self.model.total),
-                                 func.Count(func.Distinct(Item.product_id)), func.sum(Item.quantity),
-                                 func.Sum(self.model.amount_due)).all()[0]
-
-        orders = self.model.query\
-            .with_entities(func.count(func.Distinct(self.model.id)), func.sum(self.model.total),
-                           func.avg(self.model.total),
-                           func.cast(func.date_trunc(collection_type, func.cast(self.model.created_on, Date)), Text)
-                           .label('dateWeek')) \
-            .filter(self.model.created_on.between(from_date, to_date), self.model.retail_shop_id.in_(shops)) \
-            .group_by('dateWeek').order_by('dateWeek').all()
-
-        items = Item.query.join(self.model, and_(self.model.id == Item.order_id)) \
-            .filter(self.model.retail_shop_id.in_(shops))
-
-        max_sold_items = items.join(Product, and_(Product.id == Item.product_id)) \
-            .with_entities(func.Sum(Item.quantity), Product.name, ) \
-            .filter(self.model.created_on.between(from_date, to_date)) \
-            .group_by(Item.product_id, Product.name).order_by(-func.Sum(Item.quantity)).limit(10).all()
-
-        max_profitable_items = items.join(Product, and_(Product.id == Item.product_id)) \
-            .join(Stock, and_(Stock.id == Item.stock_id)) \
-            .with_entities(func.Sum((Item.unit_price - Stock.purchase_amount) * Item.quantity), Product.name, ) \
-            .filter(self.model.created_on.between(from_date, to_date)) \
-            .group_by(Item.product_id, Product.name) \
-            .order_by(-func.Sum((Item.unit_price - Stock.purchase_amount) * Item.quantity)) \
-            .limit(10).all()
+        sales = store_sales_between(from_date, to_date, shops)
+        total_orders, total_sales, total_quantity = db.session.execute(
+            select([func.sum(sales.c.orders), func.sum(sales.c.total), func.sum(sales.c.quantity)])).first()
+
+        date_week = func.cast(func.date_trunc(collection_type, sales.c.day), Text).label('dateWeek')
+        orders = [list(row) for row in db.session.execute(
+            select([func.sum(sales.c.orders), func.sum(sales.c.total),
+                    func.sum(sales.c.total) / func.nullif(func.sum(sales.c.orders), 0), date_week])
+            .group_by(date_week).order_by(date_week))]
+
+        products = product_sales_between(from_date, to_date, shops)
+        total_items = db.session.execute(select([func.count(func.distinct(products.c.product_id))])).scalar()
+
+        def top_products(value):
+            value = func.sum(value)
+            return [list(row) for row in db.session.execute(
+                select([value, Product.name]).select_from(products.join(Product, Product.id == products.c.product_id))
+                .group_by(products.c.product_id, Product.name).order_by(-value).limit(10))]
+
+        max_sold_items = top_products(products.c.quantity)
+        max_profitable_items = top_products(products.c.sales - products.c.cost)
 
         return make_response(jsonify(dict(total_orders=total_orders, total_sales=total_sales,
                                           total_quantity=total_quantity, max_sold_items=max_sold_items,
@@ -101,3 +100,35 @@ class OrderStatResource(Resource):
 
 
 api.add_resource(OrderStatResource, '/order_stats/', endpoint='order_stats')
+
+
+class OrderSyncResource(Resource):
+    method_decorators = [roles_accepted('admin'), auth_token_required]
+
+    def post(self):
+        payload = request.json
+        orders = payload.get('orders') if isinstance(payload, dict) else payload
+        if not isinstance(orders, list) or not orders:
+            return make_response(jsonify({'error': True, 'message': 'Expected a list of orders'}), 400)
+        if len(orders) > current_app.config.get('ORDER_SYNC_MAX_BATCH', 2000):
+            return make_response(jsonify({'error': True, 'message': 'Too many orders in one batch'}), 413)
+
+        store_id = payload.get('store_id') if isinstance(payload, dict) else None
+        if store_id is None and current_user.store_ids:
+            store_id = current_user.store_ids[0]
+        if not current_user.has_store_access(store_id):
+            return make_response(jsonify({'error': True, 'message': 'Access Forbidden'}), 403)
+
+        try:
+            results = sync_orders(orders, Store.query.get(store_id), current_user.id,
+                                  request.headers.get('X-Terminal-Id'))
+            db.session.commit()
+        except (IntegrityError, OperationalError) as e:
+            sentry.captureException()
+            db.session.rollback()
+            return make_response(jsonify({'error': True, 'message': 'Could not save orders',
+                                          'operation': 'Syncing Orders', 'data': str(e)}), 400)
+        return make_response(jsonify({'success': True, 'data': results}), 200)
+
+
+api.add_resource(OrderSyncResource, '/order_sync/', endpoint='order_sync')
@@ -0,0 +1,123 @@
+"""
+Server side allocation of sold quantities to stock batches.
+
+Items posted with a `product_id` and no `stock_id` are sold from the sellable stocks of the product in the order's
+store, first expiry first out: the flagged default stock first, then by expiry date, batches without one last. The
+stocks are locked with `SELECT ... FOR UPDATE SKIP LOCKED` a few rows at a time, so concurrent checkouts of the
+same product take different batches instead of queueing on the one expiring first; only when the unlocked batches
+fall short does a checkout wait for the locked ones. Rows stay locked until the order commits, and the counters of
+`src.products.counters` are updated by the item inserts of the same transaction, so a batch is never oversold.
+"""
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import and_, func, nullslast, or_, select
+
+from src.orders.models import Item, ItemTax
+from src.utils.exceptions import CustomException
+from .models import Stock
+
+stock_table = Stock.__table__
+
+LOCK_BATCH_SIZE = 10
+
+
+def sell_order(s=stock_table.c) -> List:
+    """Ordering of the stocks of a product to sell from."""
+    return [s.default_stock.is_(True).desc(), nullslast(s.expiry_date.asc()), s.id]
+
+
+def sellable(product_id: int, store_id: int, s=stock_table.c):
+    return and_(s.product_id == product_id, s.store_id == store_id, s.is_sold.isnot(True), s.is_expired.isnot(True),
+                s.units_available > 0, or_(s.expiry_date.is_(None), s.expiry_date >= func.current_date()))
+
+
+class InsufficientStock(CustomException):
+
+    def __init__(self, product_id, requested, available):
+        super().__init__(data={'product_id': product_id, 'requested': requested, 'available': available},
+                         message='Insufficient stock', operation='Allocating Stock', status=409)
+
+
+def allocate(connection, product_id: int, store_id: int, quantity: float, skip_locked: bool = True,
+             batch_size: int = LOCK_BATCH_SIZE) -> List[Tuple[int, float]]:
+    """
+    Locks stocks of `product_id` in `store_id` holding `quantity` units and returns (stock id, units) pairs.
+
+    Raises `InsufficientStock` when the sellable stocks hold less; the caller rolls back to release the locks.
+    """
+    s = stock_table.c
+    allocations, taken, remaining = [], [], quantity
+    # the first pass skips the stocks other checkouts hold, the second waits for them
+    for skip in ((True, False) if skip_locked else (False,)):
+        while remaining > 0:
+            criterion = sellable(product_id, store_id)
+            if taken:
+                criterion = and_(criterion, s.id.notin_(taken))
+            rows = connection.execute(select([s.id, s.units_available]).where(criterion).order_by(*sell_order())
+                                      .limit(batch_size).with_for_update(skip_locked=skip)).fetchall()
+            if not rows:
+                break
+            for stock_id, available in rows:
+                taken.append(stock_id)
+                units = min(available, remaining)
+                allocations.append((stock_id, units))
+                remaining = round(remaining - units, 6)
+                if remaining <= 0:
+                    break
+        if remaining <= 0:
+            return allocations
+    raise InsufficientStock(product_id, quantity, quantity - remaining)
+
+
+def allocate_many(connection, store_id: int, demands: Iterable[Tuple[int, float]],
+                  skip_locked: bool = True) -> List[List[Tuple[int, float]]]:
+    """
+    Allocates every (product id, quantity) demand, returning the (stock id, units) pairs of each.
+
+    Demands of one product are allocated together, and products in id order so that checkouts lock in one order.
+    """
+    demands = list(demands)
+    totals = OrderedDict()
+    for product_id, quantity in sorted(demands, key=lambda demand: demand[0]):
+        totals[product_id] = totals.get(product_id, 0) + quantity
+    pools: Dict[int, List] = {product_id: allocate(connection, product_id, store_id, total, skip_locked)
+                              for product_id, total in totals.items()}
+    result = []
+    for product_id, quantity in demands:
+        pool, split = pools[product_id], []
+        while quantity > 0 and pool:
+            stock_id, units = pool[0]
+            used = min(units, quantity)
+            split.append((stock_id, used))
+            quantity = round(quantity - used, 6)
+            if used < units:
+                pool[0] = (stock_id, round(units - used, 6))
+            else:
+                pool.pop(0)
+        result.append(split)
+    return result
+
+
+def _share(amount, units, quantity):
+    return None if amount is None else round(amount * units / quantity, 2)
+
+
+def allocate_order_items(connection, order) -> None:
+    """Splits the items of `order` posted with a product and no stock into one item per stock allocated to them."""
+    pending = [item for item in order.items if item.stock_id is None and item.product_id is not None
+               and not item.stock_adjust and item.quantity and item.quantity > 0]
+    if not pending:
+        return
+    allocations = allocate_many(connection, order.store_id, [(item.product_id, item.quantity) for item in pending])
+    for item, split in zip(pending, allocations):
+        for stock_id, units in split[1:]:
+            part = Item(name=item.name, unit_price=item.unit_price, quantity=units, discount=item.discount,
+                        stock_adjust=item.stock_adjust, stock_id=stock_id)
+            part.taxes = [ItemTax(tax_id=tax.tax_id, tax_value=tax.tax_value,
+                                  tax_amount=_share(tax.tax_amount, units, item.quantity)) for tax in item.taxes]
+            order.items.append(part)
+        stock_id, units = split[0]
+        for tax in item.taxes:
+            tax.tax_amount = _share(tax.tax_amount, units, item.quantity)
+        item.stock_id, item.quantity = stock_id, units
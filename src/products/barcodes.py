@@ -0,0 +1,254 @@
+"""
+Per-process barcode lookup table of the counter scan endpoint, `GET /barcode/<barcode>/`.
+
+Every process keeps the products with a barcode, their price and taxes, loaded on its first request, and the
+default stock of the (product, store) pairs scanned so far. Writes to products, taxes and stocks publish the
+entries they change on the `BARCODE_CHANNEL` redis channel once committed; every process drops them and reloads
+them from the database on their next scan. Stock entries also expire after `BARCODE_STOCK_TTL` seconds as a
+safety net for writes made outside the mapper.
+"""
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Set
+
+import simplejson
+from sqlalchemy import and_, event, select
+from sqlalchemy.orm import object_session
+from sqlalchemy.orm.attributes import get_history
+
+from src import db, redis_store, sentry
+from src.orders.models import Item
+from src.utils import commit_hooks
+from .allocation import sell_order, sellable
+from .models import Product, ProductTax, Stock, Tax
+
+BARCODE_CHANNEL = 'barcodes:invalidate'
+
+PRODUCT_KEYS = ('name', 'barcode', 'price', 'is_disabled', 'is_loose', 'prescription_required')
+
+STOCK_KEYS = ('product_id', 'store_id', 'default_stock', 'selling_amount', 'expiry_date', 'batch_number',
+              'is_expired', 'is_sold')
+
+product_table = Product.__table__
+tax_table = Tax.__table__
+product_tax_table = ProductTax.__table__
+stock_table = Stock.__table__
+
+
+def default_stock(connection, product_id: int, store_id: int) -> Optional[Dict]:
+    """The stock a scan sells from, the first one `src.products.allocation` would allocate."""
+    s = stock_table.c
+    row = connection.execute(
+        select([s.id, s.selling_amount, s.batch_number, s.expiry_date, s.units_available])
+        .where(sellable(product_id, store_id)).order_by(*sell_order()).limit(1)).first()
+    if row is None:
+        return None
+    stock = dict(row)
+    stock['expiry_date'] = stock['expiry_date'].isoformat() if stock['expiry_date'] else None
+    return stock
+
+
+class BarcodeCache(object):
+
+    stock_ttl = 300
+
+    def __init__(self, app=None):
+        self.products: Dict[str, Dict] = {}
+        self.barcodes: Dict[int, str] = {}
+        self.stocks: Dict[tuple, tuple] = {}
+        self.warmed = False
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app=None):
+        self.stock_ttl = app.config.get('BARCODE_STOCK_TTL', 300)
+        app.before_first_request(self._warm_quietly)
+
+    def _warm_quietly(self) -> None:
+        # a failure must not fail the first request of the process, the first scan warms again
+        try:
+            self.warm()
+        except Exception:
+            sentry.captureException()
+
+    def warm(self) -> None:
+        """Subscribes to invalidations, then loads every product with a barcode."""
+        with self._lock:
+            if self.warmed:
+                return
+            pubsub = redis_store.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(BARCODE_CHANNEL)
+            threading.Thread(target=self._listen, args=(pubsub,), daemon=True).start()
+            self._load(product_table.c.barcode.isnot(None))
+            self.warmed = True
+
+    def _listen(self, pubsub) -> None:
+        try:
+            for message in pubsub.listen():
+                if message['type'] == 'message':
+                    self.handle_message(message)
+        except Exception:
+            sentry.captureException()
+        # invalidations may have been missed, the next lookup loads everything again
+        with self._lock:
+            self.warmed = False
+            self.products, self.barcodes, self.stocks = {}, {}, {}
+
+    def _load(self, criterion) -> None:
+        p = product_table.c
+        taxes = defaultdict(list)
+        for product_id, tax_id, name, value, store_id in db.session.execute(
+                select([product_tax_table.c.product_id, tax_table.c.id, tax_table.c.name, tax_table.c.value,
+                        tax_table.c.store_id])
+                .select_from(product_tax_table.join(tax_table, tax_table.c.id == product_tax_table.c.tax_id)
+                             .join(product_table, p.id == product_tax_table.c.product_id))
+                .where(and_(criterion, tax_table.c.is_disabled.isnot(True)))):
+            taxes[product_id].append(dict(id=tax_id, name=name, value=value, store_id=store_id))
+        rows = db.session.execute(select([p.id, p.name, p.barcode, p.price, p.is_loose, p.prescription_required])
+                                  .where(and_(criterion, p.is_disabled.isnot(True))))
+        for row in rows:
+            product = dict(row)
+            product['price'] = float(product['price'] or 0)
+            product['taxes'] = taxes[row.id]
+            self.products[row.barcode] = product
+            self.barcodes[row.id] = row.barcode
+        db.session.rollback()
+
+    def lookup(self, barcode: str, store_id: int) -> Optional[Dict]:
+        """The product scanned in `store_id` with its taxes there and its default stock, None for no product."""
+        if not self.warmed:
+            self.warm()
+        product = self.products.get(barcode)
+        if product is None:
+            self._load(product_table.c.barcode == barcode)
+            product = self.products.get(barcode)
+            if product is None:
+                return None
+        return dict(product, taxes=[tax for tax in product['taxes'] if tax['store_id'] == store_id],
+                    stock=self.stock(product['id'], store_id))
+
+    def stock(self, product_id: int, store_id: int) -> Optional[Dict]:
+        key = (product_id, store_id)
+        cached = self.stocks.get(key)
+        if cached is not None and cached[1] > time.monotonic():
+            return cached[0]
+        stock = default_stock(db.session, product_id, store_id)
+        db.session.rollback()
+        self.stocks[key] = (stock, time.monotonic() + self.stock_ttl)
+        return stock
+
+    def invalidate(self, product_ids: Iterable[int] = (), stocks: Iterable = ()) -> None:
+        for product_id in product_ids:
+            self.products.pop(self.barcodes.pop(product_id, None), None)
+        for product_id, store_id in stocks:
+            self.stocks.pop((product_id, store_id), None)
+
+    def handle_message(self, message) -> None:
+        try:
+            payload = simplejson.loads(message['data'])
+            self.invalidate(payload.get('products', ()), [tuple(key) for key in payload.get('stocks', ())])
+        except Exception:
+            sentry.captureException()
+
+
+barcode_cache = BarcodeCache()
+
+
+def publish(product_ids: Iterable[int] = (), stocks: Iterable = ()) -> None:
+    payload = {'products': sorted(set(product_ids)), 'stocks': sorted(set(stocks))}
+    if payload['products'] or payload['stocks']:
+        redis_store.publish(BARCODE_CHANNEL, simplejson.dumps(payload))
+
+
+def _publish_taxes(tax_ids: Set[int]) -> None:
+    # the session can't run statements once it has committed
+    with db.engine.connect() as connection:
+        publish([product_id for product_id, in connection.execute(
+            select([product_tax_table.c.product_id]).where(product_tax_table.c.tax_id.in_(list(tax_ids))))])
+
+
+def _publish_stocks(stock_ids: Set[int], sold_out: bool = False) -> None:
+    criterion = stock_table.c.id.in_(list(stock_ids))
+    if sold_out:
+        criterion = and_(criterion, stock_table.c.units_available <= 0)
+    with db.engine.connect() as connection:
+        publish(stocks=[tuple(row) for row in connection.execute(
+            select([stock_table.c.product_id, stock_table.c.store_id]).where(criterion))])
+
+
+def mark_sold(session, *stock_ids) -> None:
+    """Marks stocks items were sold from, their counters are updated outside the mapper."""
+    commit_hooks.mark(session, 'barcode_sold', *stock_ids)
+
+
+def _mark_product(target) -> None:
+    commit_hooks.mark_object(target, 'barcode_products', target.id)
+
+
+@event.listens_for(Product, 'after_update')
+def _product_updated(mapper, connection, target):
+    if any(get_history(target, key).has_changes() for key in PRODUCT_KEYS):
+        _mark_product(target)
+
+
+@event.listens_for(Product, 'after_delete')
+def _product_deleted(mapper, connection, target):
+    _mark_product(target)
+
+
+@event.listens_for(Product.taxes, 'append')
+@event.listens_for(Product.taxes, 'remove')
+def _product_taxes_changed(target, value, initiator):
+    commit_hooks.mark(object_session(target), 'barcode_products', target.id)
+
+
+@event.listens_for(ProductTax, 'after_insert')
+@event.listens_for(ProductTax, 'after_update')
+@event.listens_for(ProductTax, 'after_delete')
+def _product_tax_changed(mapper, connection, target):
+    commit_hooks.mark_object(target, 'barcode_products', target.product_id, *get_history(target, 'product_id').deleted)
+
+
+@event.listens_for(Tax, 'after_update')
+@event.listens_for(Tax, 'after_delete')
+def _tax_changed(mapper, connection, target):
+    commit_hooks.mark_object(target, 'barcode_taxes', target.id)
+
+
+def _mark_stock(target) -> None:
+    previous_product = get_history(target, 'product_id').deleted
+    previous_store = get_history(target, 'store_id').deleted
+    commit_hooks.mark_object(target, 'barcode_stocks', (target.product_id, target.store_id),
+                             ((previous_product or [target.product_id])[0], (previous_store or [target.store_id])[0]))
+
+
+@event.listens_for(Stock, 'after_insert')
+@event.listens_for(Stock, 'after_delete')
+def _stock_written(mapper, connection, target):
+    _mark_stock(target)
+
+
+@event.listens_for(Stock, 'after_update')
+def _stock_updated(mapper, connection, target):
+    if any(get_history(target, key).has_changes() for key in STOCK_KEYS):
+        _mark_stock(target)
+
+
+@event.listens_for(Item, 'after_insert')
+@event.listens_for(Item, 'after_update')
+def _item_changed(mapper, connection, target):
+    mark_sold(object_session(target), target.stock_id)
+
+
+@event.listens_for(Item, 'after_delete')
+def _item_deleted(mapper, connection, target):
+    commit_hooks.mark_object(target, 'barcode_returned', target.stock_id)
+
+
+commit_hooks.register_commit_handler('barcode_products', lambda product_ids: publish(product_ids))
+commit_hooks.register_commit_handler('barcode_taxes', _publish_taxes)
+commit_hooks.register_commit_handler('barcode_stocks', lambda stocks: publish(stocks=stocks))
+commit_hooks.register_commit_handler('barcode_sold', lambda stock_ids: _publish_stocks(stock_ids, sold_out=True))
+commit_hooks.register_commit_handler('barcode_returned', _publish_stocks)
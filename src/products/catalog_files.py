@@ -0,0 +1,144 @@
+"""
+Offline import of a catalog dump, JSON lines or CSV, through `src.products.importer`.
+
+The file is read as a stream of chunks of `chunk_size` records. Workers of a process pool parse and normalize the
+chunks while the importer inserts the ones before them, at most two chunks per worker in flight, so memory stays
+bounded whatever the size of the file. Chunks are imported in file order and each commits on its own; after every
+commit the byte offset reached is written to a checkpoint file next to the dump, from which an interrupted import
+resumes. A chunk imported again after a crash between its commit and its checkpoint only skips its products.
+"""
+import csv
+import io
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import simplejson
+
+from .importer import CatalogImporter, normalize
+
+CHECKPOINT_SUFFIX = '.checkpoint'
+
+
+def file_format(path: str) -> str:
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+def _csv_header(stream) -> Tuple[List[str], int]:
+    line = stream.readline()
+    return next(csv.reader([line.decode('utf-8-sig')])), stream.tell()
+
+
+def _csv_records(stream) -> Iterator[bytes]:
+    # a record spans lines while one of its quotes is open, quotes inside fields come in pairs
+    record = b''
+    for line in iter(stream.readline, b''):
+        record += line
+        if record.count(b'"') % 2 == 0:
+            yield record
+            record = b''
+    if record:
+        yield record
+
+
+def read_chunks(stream, offset: int, chunk_size: int, fmt: str = 'jsonl') -> Iterator[Tuple[int, List[bytes]]]:
+    """(offset after the chunk, raw records) from `offset` of a binary stream, skipping blank lines."""
+    stream.seek(offset)
+    chunk = []
+    for record in (_csv_records(stream) if fmt == 'csv' else iter(stream.readline, b'')):
+        if record.strip():
+            chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield stream.tell(), chunk
+            chunk = []
+    if chunk:
+        yield stream.tell(), chunk
+
+
+def _parse(record: bytes, header: Optional[List[str]]) -> Optional[Dict]:
+    try:
+        if header is None:
+            row = simplejson.loads(record)
+            return row if isinstance(row, dict) else None
+        values = next(csv.reader(io.StringIO(record.decode('utf-8'))))
+        return {key: value for key, value in zip(header, values) if value != ''}
+    except (ValueError, StopIteration):
+        return None
+
+
+def normalize_chunk(records: List[bytes], header: Optional[List[str]] = None) -> List[Optional[Dict]]:
+    """Parsed and normalized records, None for the ones that can't be imported; runs in the worker processes."""
+    rows = []
+    for record in records:
+        row = _parse(record, header)
+        rows.append(normalize(row) if row is not None else None)
+    return rows
+
+
+class Checkpoint(object):
+    """Offset and counts of an import of `path` over all its runs, reset when the file changed size since."""
+
+    COUNTS = ('rows', 'imported', 'skipped')
+
+    def __init__(self, path: str):
+        self.path = path + CHECKPOINT_SUFFIX
+        self.size = os.path.getsize(path)
+        self.state = dict({'size': self.size, 'offset': 0}, **{count: 0 for count in self.COUNTS})
+        self.previous = dict(self.state)
+
+    def load(self) -> Dict:
+        try:
+            with open(self.path) as stream:
+                state = simplejson.load(stream)
+        except (IOError, ValueError):
+            return self.state
+        if state.get('size') == self.size:
+            self.state, self.previous = state, dict(state)
+        return self.state
+
+    def save(self, offset: int, importer: CatalogImporter) -> None:
+        self.state = dict(self.state, offset=offset,
+                          **{count: self.previous[count] + getattr(importer, count) for count in self.COUNTS})
+        with open(self.path + '.tmp', 'w') as stream:
+            simplejson.dump(self.state, stream)
+        os.replace(self.path + '.tmp', self.path)
+
+    def clear(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def ingest_file(path: str, fmt: str = None, workers: int = None, chunk_size: int = 1000, restart: bool = False,
+                progress=print) -> Dict:
+    """Imports the catalog dump at `path` from its checkpoint, returning the counts of all its runs."""
+    fmt = fmt or file_format(path)
+    workers = workers or os.cpu_count() or 1
+    checkpoint = Checkpoint(path)
+    if restart:
+        checkpoint.clear()
+    state = checkpoint.load()
+    importer = CatalogImporter(chunk_size)
+
+    with open(path, 'rb') as stream, ProcessPoolExecutor(workers) as pool:
+        header, offset = None, state['offset']
+        if fmt == 'csv':
+            header, start = _csv_header(stream)
+            offset = max(offset, start)
+        if state['offset']:
+            progress('resuming {} at byte {} of {}'.format(path, offset, checkpoint.size))
+        pending = deque()
+        chunks = read_chunks(stream, offset, chunk_size, fmt)
+        while True:
+            for end, records in chunks:
+                pending.append((end, pool.submit(normalize_chunk, records, header)))
+                if len(pending) >= workers * 2:
+                    break
+            if not pending:
+                break
+            end, rows = pending.popleft()
+            importer.add_all(rows.result())
+            checkpoint.save(end, importer)
+            progress('{:.1%} {}'.format(end / max(checkpoint.size, 1), importer.report()))
+    checkpoint.clear()
+    return checkpoint.state
@@ -0,0 +1,125 @@
+from typing import Iterable
+
+from sqlalchemy import and_, case, event, exists, func, or_, select
+from sqlalchemy.orm.attributes import get_history
+
+from src import db
+from src.orders.models import Item, Order
+from .models import Stock
+
+stock_table = Stock.__table__
+item_table = Item.__table__
+order_table = Order.__table__
+
+ITEM_KEYS = ('stock_id', 'quantity', 'stock_adjust', 'order_id')
+
+
+def _not_void(order_id):
+    return ~exists().where(and_(order_table.c.id == order_id, order_table.c.is_void.is_(True)))
+
+
+def _counter_values(quantity):
+    units_sold = stock_table.c.units_sold + quantity
+    return dict(units_sold=units_sold, units_available=stock_table.c.units_available - quantity,
+                is_sold=case([(units_sold >= stock_table.c.units_purchased, True)], else_=stock_table.c.is_sold))
+
+
+def apply_stock_delta(connection, stock_id, quantity, order_id=None) -> None:
+    """Adds `quantity` sold units to the counters of `stock_id` unless the item's order is void."""
+    if stock_id is None or not quantity:
+        return
+    criterion = stock_table.c.id == stock_id
+    if order_id is not None:
+        criterion = and_(criterion, _not_void(order_id))
+    connection.execute(stock_table.update().where(criterion).values(**_counter_values(quantity)))
+
+
+def _load_previous(target, value, oldvalue, initiator):
+    pass
+
+
+# counters need the value an item had before a change even when the attribute was not loaded yet
+for attribute in (Item.stock_id, Item.quantity, Item.stock_adjust, Item.order_id, Order.is_void):
+    event.listen(attribute, 'set', _load_previous, active_history=True)
+
+
+def _previous(target, key):
+    history = get_history(target, key)
+    return history.deleted[0] if history.deleted else getattr(target, key)
+
+
+@event.listens_for(Stock, 'before_insert')
+def _init_counters(mapper, connection, target):
+    units_purchased = target.units_purchased
+    if units_purchased is None:
+        units_purchased = mapper.columns['units_purchased'].default.arg
+    target.units_sold = target.units_sold or 0
+    target.units_available = units_purchased - target.units_sold
+
+
+@event.listens_for(Stock, 'before_update')
+def _update_available(mapper, connection, target):
+    if get_history(target, 'units_purchased').has_changes():
+        target.units_available = target.units_purchased - Stock.units_sold
+
+
+@event.listens_for(Item, 'after_insert')
+def _item_inserted(mapper, connection, target):
+    if not target.stock_adjust:
+        apply_stock_delta(connection, target.stock_id, target.quantity, target.order_id)
+
+
+@event.listens_for(Item, 'after_update')
+def _item_updated(mapper, connection, target):
+    if not any(get_history(target, key).has_changes() for key in ITEM_KEYS):
+        return
+    stock_id, quantity, stock_adjust, order_id = (_previous(target, key) for key in ITEM_KEYS)
+    if not stock_adjust:
+        apply_stock_delta(connection, stock_id, -(quantity or 0), order_id)
+    if not target.stock_adjust:
+        apply_stock_delta(connection, target.stock_id, target.quantity, target.order_id)
+
+
+@event.listens_for(Item, 'before_delete')
+def _item_deleted(mapper, connection, target):
+    stock_id, quantity, stock_adjust, order_id = (_previous(target, key) for key in ITEM_KEYS)
+    if not stock_adjust:
+        apply_stock_delta(connection, stock_id, -(quantity or 0), order_id)
+
+
+@event.listens_for(Order, 'after_update')
+def _order_voided(mapper, connection, target):
+    history = get_history(target, 'is_void')
+    if not history.has_changes() or bool(history.deleted and history.deleted[0]) == bool(target.is_void):
+        return
+    counted = and_(item_table.c.order_id == target.id, item_table.c.stock_adjust.isnot(True))
+    sold = select([func.sum(item_table.c.quantity)]).where(and_(counted, item_table.c.stock_id == stock_table.c.id))
+    quantity = -sold.as_scalar() if target.is_void else sold.as_scalar()
+    stock_ids = select([item_table.c.stock_id]).where(counted)
+    connection.execute(stock_table.update().where(stock_table.c.id.in_(stock_ids)).values(**_counter_values(quantity)))
+
+
+def reconcile_stock_counters(store_ids: Iterable = None, batch_size: int = 10000) -> int:
+    """
+    Recomputes the counters of every stock from its items in id batches, committing after each batch.
+
+    Returns the number of stocks whose counters had drifted.
+    """
+    sold = select([func.coalesce(func.sum(item_table.c.quantity), 0)]) \
+        .where(and_(item_table.c.stock_id == stock_table.c.id, item_table.c.stock_adjust.isnot(True),
+                    _not_void(item_table.c.order_id))).as_scalar()
+    criterion = or_(stock_table.c.units_sold != sold,
+                    stock_table.c.units_available != stock_table.c.units_purchased - sold)
+    if store_ids:
+        criterion = and_(criterion, stock_table.c.store_id.in_(list(store_ids)))
+
+    low, high = db.session.query(func.min(Stock.id), func.max(Stock.id)).one()
+    drifted = 0
+    while low is not None and low <= high:
+        batch = and_(stock_table.c.id >= low, stock_table.c.id < low + batch_size, criterion)
+        result = db.session.execute(stock_table.update().where(batch)
+                                    .values(units_sold=sold, units_available=stock_table.c.units_purchased - sold))
+        drifted += result.rowcount
+        db.session.commit()
+        low += batch_size
+    return drifted
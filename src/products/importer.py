@@ -0,0 +1,196 @@
+"""
+Bulk import of catalog rows into products, brands and categories.
+
+`normalize` maps a row of any of the catalog sources to the columns of a product and is free of database access,
+so it can run in worker processes. `CatalogImporter` imports normalized rows a batch at a time with a handful of
+set based statements: names are deduplicated in memory, case insensitively like the database check, brands and
+categories are resolved with one `INSERT ... ON CONFLICT DO NOTHING` each, products and their categories are
+inserted with multi-row statements, and every batch commits once. Products already in the catalog are skipped.
+"""
+import time
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+
+from src import db
+from src.utils import commit_hooks
+from .models import Brand, Category, Product, ProductCategory
+from .search import update_keywords
+
+product_table = Product.__table__
+brand_table = Brand.__table__
+category_table = Category.__table__
+product_category_table = ProductCategory.__table__
+
+MAX_PRICE = Decimal('999999.99')
+
+
+def _text(value, length: int = None) -> Optional[str]:
+    if value is None:
+        return None
+    value = ' '.join(str(value).split())
+    if not value:
+        return None
+    return value[:length] if length else value
+
+
+def _price(value) -> Optional[Decimal]:
+    if isinstance(value, dict):
+        value = value.get('INR', {}).get('default')
+    if value in (None, ''):
+        return Decimal(0)
+    try:
+        price = Decimal(str(value)).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        return None
+    return price if 0 <= price <= MAX_PRICE else None
+
+
+def _categories(value) -> List[str]:
+    if isinstance(value, str):
+        value = value.split('|')
+    names = (_text(name) for name in value or ())
+    return [name for name in names if name and len(name) <= category_table.c.name.type.length]
+
+
+def normalize(row: Dict) -> Optional[Dict]:
+    """
+    Product columns of a catalog row, with `brand_name` and `categories` to resolve, or None when the row can't be
+    imported: no name or brand, names too long for their columns, or a price that isn't a number.
+
+    Reads the rows of the algolia catalog (`name`, `genericname`, `categories_without_path`), of medplus
+    (`productName`, `packSizeMrp`, `productFormName`) and flat rows named after the columns.
+    """
+    name = _text(row.get('productName') or row.get('name'))
+    brand_name = _text(row.get('manufacturer') or row.get('brand_name'))
+    price = _price(row['packSizeMrp'] if 'packSizeMrp' in row else row.get('price'))
+    if not name or not brand_name or price is None or len(name) > product_table.c.name.type.length \
+            or len(brand_name) > brand_table.c.name.type.length:
+        return None
+    return dict(name=name, brand_name=brand_name, price=price, url=_text(row.get('url')),
+                therapeutic_name=_text(row.get('genericname') or row.get('therapeutic_name'), 255),
+                drug_type=_text(row.get('drug_type'), 55),
+                formulation_types=_text(row.get('productFormName') or row.get('formulation_types'), 55),
+                dosage=_text(row.get('dosage'), 55),
+                categories=_categories(row.get('categories_without_path') or row.get('categories')))
+
+
+def _unique(names: Iterable[str]) -> Dict[str, str]:
+    unique = {}
+    for name in names:
+        unique.setdefault(name.lower(), name)
+    return unique
+
+
+def _unique_rows(rows: List[Dict]) -> Dict[str, Dict]:
+    unique = {}
+    for row in rows:
+        unique.setdefault(row['name'].lower(), row)
+    return unique
+
+
+def resolve_names(connection, table, names: Iterable[str]) -> Dict[str, int]:
+    """Ids of the rows of `table` named `names`, inserting the missing ones; keyed by lower case name."""
+    names = _unique(names)
+    if not names:
+        return {}
+    key = func.lower(table.c.name)
+    ids = dict(connection.execute(select([key, table.c.id]).where(key.in_(list(names)))).fetchall())
+    missing = [{'name': name} for lowered, name in names.items() if lowered not in ids]
+    if missing:
+        ids.update(connection.execute(insert(table).values(missing).on_conflict_do_nothing(index_elements=['name'])
+                                      .returning(key, table.c.id)).fetchall())
+        # inserted meanwhile by another import
+        raced = [lowered for lowered in names if lowered not in ids]
+        if raced:
+            ids.update(connection.execute(select([key, table.c.id]).where(key.in_(raced))).fetchall())
+    return ids
+
+
+class CatalogImporter(object):
+    """Imports normalized rows in batches of `batch_size`, counting what it did."""
+
+    def __init__(self, batch_size: int = 1000, session=None):
+        self.batch_size = batch_size
+        self.session = session or db.session
+        self.pending: List[Dict] = []
+        self.rows = self.imported = self.skipped = 0
+        self.started = time.perf_counter()
+
+    def add(self, row: Optional[Dict]) -> int:
+        """Queues a row, None for a row `normalize` rejected; returns the products imported by a full batch."""
+        self.rows += 1
+        if row is None:
+            self.skipped += 1
+            return 0
+        self.pending.append(row)
+        return self.flush() if len(self.pending) >= self.batch_size else 0
+
+    def add_all(self, rows: Iterable[Optional[Dict]]) -> 'CatalogImporter':
+        for row in rows:
+            self.add(row)
+        self.flush()
+        return self
+
+    def flush(self) -> int:
+        batch, self.pending = self.pending, []
+        if not batch:
+            return 0
+        rows = _unique_rows(batch)
+        try:
+            imported = self._import(rows)
+            self.session.commit()
+        except Exception:
+            self.session.rollback()
+            raise
+        self.imported += imported
+        self.skipped += len(batch) - imported
+        return imported
+
+    def _import(self, rows: Dict[str, Dict]) -> int:
+        connection = self.session
+        key = func.lower(product_table.c.name)
+        for lowered, in connection.execute(select([key]).where(key.in_(list(rows)))):
+            rows.pop(lowered, None)
+        if not rows:
+            return 0
+        brands = resolve_names(connection, brand_table, (row['brand_name'] for row in rows.values()))
+        categories = resolve_names(connection, category_table,
+                                   (name for row in rows.values() for name in row['categories']))
+
+        values = [dict(name=row['name'], brand_id=brands[row['brand_name'].lower()], price=row['price'],
+                       url=row['url'], therapeutic_name=row['therapeutic_name'], drug_type=row['drug_type'],
+                       formulation_types=row['formulation_types'], dosage=row['dosage'], is_disabled=False,
+                       prescription_required=False, is_loose=False) for row in rows.values()]
+        inserted = connection.execute(insert(product_table).values(values)
+                                      .on_conflict_do_nothing(index_elements=['name'])
+                                      .returning(product_table.c.id, product_table.c.name)).fetchall()
+
+        by_name = {row['name']: row for row in rows.values()}
+        links = {(product_id, categories[category.lower()])
+                 for product_id, name in inserted for category in by_name[name]['categories']}
+        if links:
+            connection.execute(product_category_table.insert().values(
+                [dict(product_id=product_id, category_id=category_id) for product_id, category_id in sorted(links)]))
+
+        # the inserts bypass the mapper events that keep the search documents and the search index current
+        product_ids = [product_id for product_id, _ in inserted]
+        if product_ids:
+            update_keywords(connection, product_table.c.id.in_(product_ids))
+            commit_hooks.mark(self.session, 'search_products', *product_ids)
+        return len(inserted)
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / max(time.perf_counter() - self.started, 1e-9)
+
+    def report(self) -> str:
+        return '{} rows, {} products imported, {} skipped in {:.1f} s, {:.0f} rows/s'.format(
+            self.rows, self.imported, self.skipped, time.perf_counter() - self.started, self.rows_per_second)
+
+
+def import_catalog(rows: Iterable[Dict], batch_size: int = 1000) -> CatalogImporter:
+    """Normalizes and imports raw catalog rows, returning the importer with its counts."""
+    return CatalogImporter(batch_size).add_all(normalize(row) for row in rows)
@@ -0,0 +1,176 @@
+"""
+Incremental indexing of products into `src.utils.search_index`.
+
+Writes to products, their salts and tags, and renames of brands, salts and tags mark the products they change;
+once the transaction commits the product ids are queued in redis and `index_pending_products` bulk upserts their
+documents every few seconds. Products gone from the database are deleted from the index.
+"""
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import object_session
+from sqlalchemy.orm.attributes import get_history
+
+from src import db, redis_store
+from src.utils import commit_hooks
+from src.utils.search_index import search_index
+from .models import Brand, Product, ProductSalt, ProductTag, Salt, Tag
+
+DIRTY_KEY = 'search_index:dirty'
+
+PRODUCT_KEYS = ('name', 'therapeutic_name', 'brand_id', 'barcode', 'drug_type', 'drug_schedule', 'is_disabled',
+                'prescription_required')
+
+product_table = Product.__table__
+brand_table = Brand.__table__
+salt_table = Salt.__table__
+tag_table = Tag.__table__
+product_salt_table = ProductSalt.__table__
+product_tag_table = ProductTag.__table__
+
+
+def _names(connection, link_table, table, column, product_ids: List[int]) -> Dict[int, List]:
+    names = defaultdict(list)
+    rows = connection.execute(select([link_table.c.product_id, table.c.id, table.c.name])
+                              .select_from(link_table.join(table, table.c.id == link_table.c[column]))
+                              .where(link_table.c.product_id.in_(product_ids)).order_by(table.c.id))
+    for product_id, row_id, name in rows:
+        names[product_id].append((row_id, name))
+    return names
+
+
+def product_documents(product_ids: Iterable[int], connection=None) -> List[Dict]:
+    """Documents of the products `product_ids` that exist, with the names of their brand, salts and tags."""
+    connection = connection or db.session
+    product_ids = list(product_ids)
+    p = product_table.c
+    rows = connection.execute(select([p.id, p.name, p.therapeutic_name, p.barcode, p.drug_type, p.drug_schedule,
+                                      p.is_disabled, p.prescription_required, p.brand_id,
+                                      brand_table.c.name.label('brand_name')])
+                              .select_from(product_table.outerjoin(brand_table, brand_table.c.id == p.brand_id))
+                              .where(p.id.in_(product_ids)))
+    salts = _names(connection, product_salt_table, salt_table, 'salt_id', product_ids)
+    tags = _names(connection, product_tag_table, tag_table, 'tag_id', product_ids)
+    documents = []
+    for row in rows:
+        document = dict(row)
+        document['is_disabled'] = bool(row.is_disabled)
+        document['prescription_required'] = bool(row.prescription_required)
+        document['salt_ids'] = [salt_id for salt_id, _ in salts[row.id]]
+        document['salt_names'] = [name for _, name in salts[row.id]]
+        document['tag_ids'] = [tag_id for tag_id, _ in tags[row.id]]
+        document['tag_names'] = [name for _, name in tags[row.id]]
+        documents.append(document)
+    return documents
+
+
+def index_products(product_ids: Iterable[int]) -> int:
+    """Upserts the documents of `product_ids`, deleting the ones of products that no longer exist."""
+    product_ids = set(product_ids)
+    documents = product_documents(product_ids)
+    search_index.backend.upsert(documents)
+    search_index.backend.delete(product_ids - {document['id'] for document in documents})
+    return len(documents)
+
+
+def index_pending_products() -> int:
+    """Indexes the products queued since the last run in batches; when a batch fails the rest are queued again."""
+    if not search_index.enabled:
+        # left queued for a backend configured later
+        return 0
+    pipeline = redis_store.pipeline()
+    pipeline.smembers(DIRTY_KEY)
+    pipeline.delete(DIRTY_KEY)
+    pending = sorted(int(product_id) for product_id in pipeline.execute()[0])
+    indexed = 0
+    try:
+        while pending:
+            indexed += index_products(pending[:search_index.batch_size])
+            del pending[:search_index.batch_size]
+    except Exception:
+        redis_store.sadd(DIRTY_KEY, *pending)
+        raise
+    finally:
+        db.session.rollback()
+    return indexed
+
+
+def reindex_all(batch_size: int = None) -> int:
+    """Upserts the document of every product in id batches."""
+    batch_size = batch_size or search_index.batch_size
+    indexed, last_id = 0, 0
+    while True:
+        ids = [product_id for product_id, in db.session.execute(
+            select([product_table.c.id]).where(product_table.c.id > last_id)
+            .order_by(product_table.c.id).limit(batch_size))]
+        if not ids:
+            return indexed
+        indexed += index_products(ids)
+        db.session.rollback()
+        last_id = ids[-1]
+
+
+def _queue_products(product_ids: Set[int]) -> None:
+    redis_store.sadd(DIRTY_KEY, *product_ids)
+
+
+def _queue_linked(product_id, linked_id):
+    def queue(ids: Set[int]) -> None:
+        # the session can't run statements once it has committed
+        with db.engine.connect() as connection:
+            product_ids = {row[0] for row in connection.execute(select([product_id]).where(linked_id.in_(list(ids))))}
+        if product_ids:
+            _queue_products(product_ids)
+    return queue
+
+
+def _mark(target, *product_ids) -> None:
+    commit_hooks.mark_object(target, 'search_products', *product_ids)
+
+
+@event.listens_for(Product, 'after_insert')
+@event.listens_for(Product, 'after_delete')
+def _product_written(mapper, connection, target):
+    _mark(target, target.id)
+
+
+@event.listens_for(Product, 'after_update')
+def _product_updated(mapper, connection, target):
+    if any(get_history(target, key).has_changes() for key in PRODUCT_KEYS):
+        _mark(target, target.id)
+
+
+@event.listens_for(Product.salts, 'append')
+@event.listens_for(Product.salts, 'remove')
+@event.listens_for(Product.tags, 'append')
+@event.listens_for(Product.tags, 'remove')
+def _product_links_changed(target, value, initiator):
+    # products not inserted yet are marked by `_product_written`
+    commit_hooks.mark(object_session(target), 'search_products', target.id)
+
+
+@event.listens_for(ProductSalt, 'after_insert')
+@event.listens_for(ProductSalt, 'after_update')
+@event.listens_for(ProductSalt, 'after_delete')
+@event.listens_for(ProductTag, 'after_insert')
+@event.listens_for(ProductTag, 'after_update')
+@event.listens_for(ProductTag, 'after_delete')
+def _link_written(mapper, connection, target):
+    _mark(target, target.product_id, *get_history(target, 'product_id').deleted)
+
+
+@event.listens_for(Brand, 'after_update')
+@event.listens_for(Salt, 'after_update')
+@event.listens_for(Tag, 'after_update')
+def _renamed(mapper, connection, target):
+    if get_history(target, 'name').has_changes():
+        commit_hooks.mark_object(target, 'search_' + mapper.local_table.name, target.id)
+
+
+commit_hooks.register_commit_handler('search_products', _queue_products)
+commit_hooks.register_commit_handler('search_brand', _queue_linked(product_table.c.id, product_table.c.brand_id))
+commit_hooks.register_commit_handler('search_salt', _queue_linked(product_salt_table.c.product_id,
+                                                                  product_salt_table.c.salt_id))
+commit_hooks.register_commit_handler('search_tag', _queue_linked(product_tag_table.c.product_id,
+                                                                 product_tag_table.c.tag_id))
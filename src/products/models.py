@@ -1,8 +1,8 @@
 from datetime import datetime
 import re
-from sqlalchemy import and_, func, select, or_
+from sqlalchemy import DDL, and_, event, func, select, or_
 from sqlalchemy import UniqueConstraint
-from sqlalchemy.dialects.postgresql import NUMERIC
+from sqlalchemy.dialects.postgresql import NUMERIC, TSVECTOR
 from sqlalchemy.ext.hybrid import hybrid_property
 
 from src import db, BaseMixin, ReprMixin
@@ -176,6 +176,9 @@ class Product(BaseMixin, db.Model, ReprMixin):
     is_loose = db.Column(db.Boolean(), default=False)
     barcode = db.Column(db.String(13), nullable=True, unique=True)
 
+    # name, therapeutic name, brand and salts, maintained by `src.products.search`
+    keywords = db.Column(TSVECTOR(), nullable=True)
+
     brand_id = db.Column(db.ForeignKey('brand.id'), index=True, nullable=False)
 
     taxes = db.relationship('Tax', back_populates='products', secondary='product_tax')
@@ -201,6 +204,17 @@ class Product(BaseMixin, db.Model, ReprMixin):
         return select([Brand.name]).where(Brand.id == self.brand_id).as_scalar()
 
 
+# `lower(name) LIKE '%x%'` of the contains filters is answered from trigram indexes
+event.listen(db.metadata, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+
+db.Index('ix_product_name_trgm', func.lower(Product.name).label('name'), postgresql_using='gin',
+         postgresql_ops={'name': 'gin_trgm_ops'})
+db.Index('ix_brand_name_trgm', func.lower(Brand.name).label('name'), postgresql_using='gin',
+         postgresql_ops={'name': 'gin_trgm_ops'})
+db.Index('ix_product_keywords', Product.keywords, postgresql_using='gin')
+
+
 class Salt(BaseMixin, db.Model, ReprMixin):
     name = db.Column(db.String(127), nullable=False, index=True)
     prescription_required = db.Column(db.Boolean(), default=True)
@@ -247,6 +261,11 @@ class Stock(BaseMixin, db.Model, ReprMixin):
     batch_number = db.Column(db.String(25), nullable=True)
     expiry_date = db.Column(db.Date, nullable=True)
     is_sold = db.Column(db.Boolean(), default=False, index=True)
+    # set by the stock sweeper, see src/tasks/stock_tasks.py
+    is_expired = db.Column(db.Boolean(), default=False, server_default='false', index=True)
+    # maintained from the items sold out of this stock, see src/products/counters.py
+    units_sold = db.Column(db.Float(precision=2), nullable=False, default=0, server_default='0', index=True)
+    units_available = db.Column(db.Float(precision=2), nullable=False, default=0, server_default='0', index=True)
     default_stock = db.Column(db.Boolean, default=False, nullable=True)
 
     distributor_bill_id = db.Column(db.ForeignKey('distributor_bill.id'), nullable=True, index=True)
@@ -258,24 +277,6 @@ class Stock(BaseMixin, db.Model, ReprMixin):
     order_items = db.relationship('Item', uselist=True, back_populates='stock', lazy='dynamic')
     store = db.relationship('Store', uselist=False, foreign_keys=[store_id])
 
-    @hybrid_property
-    def units_sold(self):
-
-        total_sold = self.order_items.with_entities(func.Sum(Item.quantity)) \
-            .filter(Item.stock_id == self.id, Item.stock_adjust.isnot(True)).scalar()
-        if total_sold:
-            if total_sold >= self.units_purchased and not self.is_sold:
-                self.is_sold = True
-                db.session.commit()
-            return total_sold
-        else:
-            return 0
-
-    @units_sold.expression
-    def units_sold(cls):
-        return select([func.coalesce(func.Sum(Item.quantity), 0)])\
-            .where(and_(Item.stock_id == cls.id, Item.stock_adjust.isnot(True))).as_scalar()
-
     @hybrid_property
     def product_name(self):
         return self.product.name
@@ -290,8 +291,8 @@ class Stock(BaseMixin, db.Model, ReprMixin):
 
     @expired.expression
     def expired(self):
-        return and_(or_(self.is_sold.isnot(True)), func.coalesce(self.expiry_date, datetime.now().date())
-                    < datetime.now().date()).label('expired')
+        return and_(or_(self.is_sold.isnot(True)), func.coalesce(self.expiry_date, func.current_date())
+                    < func.current_date()).label('expired')
 
     @hybrid_property
     def distributor_id(self):
@@ -331,6 +332,10 @@ class Stock(BaseMixin, db.Model, ReprMixin):
                                                Brand.id == Product.brand_id)).as_scalar()
 
 
+# items of an order may be posted with the product instead of a stock, see src/products/allocation.py
+Item.product_id = db.column_property(select([Stock.product_id]).where(Stock.id == Item.stock_id).as_scalar())
+
+
 class Combo(BaseMixin, db.Model, ReprMixin):
     name = db.Column(db.String(55), nullable=False, index=True)
     products = db.relationship('Product', back_populates='combos', secondary='combo_product')
@@ -356,4 +361,35 @@ class ProductCategory(BaseMixin, db.Model):
     product_id = db.Column(db.ForeignKey('product.id'), nullable=False)
     category_id = db.Column(db.ForeignKey('category.id'), nullable=False)
 
-    UniqueConstraint(product_id, category_id)
\ No newline at end of file
+    UniqueConstraint(product_id, category_id)
+
+
+class StockValuation(BaseMixin, db.Model, ReprMixin):
+    """Value of the stocks a store received on one day, kept up to date by src/products/valuation.py."""
+
+    __repr_fields__ = ['store_id', 'day', 'inventory_value']
+
+    day = db.Column(db.Date, nullable=False)
+    purchased_value = db.Column(db.Float(precision=2), nullable=False, default=0)
+    sold_value = db.Column(db.Float(precision=2), nullable=False, default=0)
+    expired_value = db.Column(db.Float(precision=2), nullable=False, default=0)
+    inventory_value = db.Column(db.Float(precision=2), nullable=False, default=0)
+
+    store_id = db.Column(db.ForeignKey('store.id', ondelete='CASCADE'), nullable=False)
+
+    __table_args__ = (db.UniqueConstraint('store_id', 'day', name='uq_stock_valuation_store_day'),)
+
+
+class DistributorPurchase(BaseMixin, db.Model, ReprMixin):
+    """Value of the stocks billed by a distributor to a store on one day, see src/products/valuation.py."""
+
+    __repr_fields__ = ['store_id', 'day', 'distributor_id', 'purchases']
+
+    day = db.Column(db.Date, nullable=False)
+    purchases = db.Column(db.Float(precision=2), nullable=False, default=0)
+
+    store_id = db.Column(db.ForeignKey('store.id', ondelete='CASCADE'), nullable=False)
+    distributor_id = db.Column(db.ForeignKey('distributor.id', ondelete='CASCADE'), nullable=False)
+
+    __table_args__ = (db.UniqueConstraint('store_id', 'day', 'distributor_id',
+                                          name='uq_distributor_purchase_store_day_distributor'),)
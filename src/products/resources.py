@@ -20,6 +20,10 @@ class ProductResource(ModelResource):
 
     max_limit = 500
 
+    count = 'estimate'
+
+    serializer = 'compiled'
+
     optional = ('distributors', 'brand', 'store', 'stocks', 'similar_products', 'available_stocks',
                 'last_purchase_amount', 'last_selling_amount', 'stock_required')
 
@@ -27,6 +31,8 @@ class ProductResource(ModelResource):
         'name': [ops.Equal, ops.Contains],
         'product_name': [ops.Equal, ops.Contains],
         'brand_name': [ops.Equal, ops.Contains],
+        'keywords': [ops.Search],
+        'barcode': [ops.Equal],
         'stock_required': [ops.Equal, ops.Greater, ops.Greaterequal],
         'available_stock': [ops.Equal, ops.Greater, ops.Greaterequal],
         'id': [ops.Equal, ops.In, ops.NotEqual, ops.NotIn],
@@ -99,8 +105,6 @@ class StockResource(ModelResource):
 
     export = True
 
-    max_export_limit = 500
-
     optional = ('product', 'store', 'distributor_bill', 'product_name', 'store_id', 'distributor_name',
                 'brand_name', 'product_id')
 
@@ -84,7 +84,7 @@ class DistributorBillSchema(BaseSchema):
 class ProductSchema(BaseSchema):
     class Meta:
         model = Product
-        exclude = ('created_on', 'updated_on')
+        exclude = ('created_on', 'updated_on', 'keywords')
 
     name = ma.String()
     description = ma.List(ma.Dict(), allow_none=True)
@@ -150,7 +150,9 @@ class StockSchema(BaseSchema):
     product_id = ma.Integer(load=True)
     distributor_bill_id = ma.Integer(allow_none=True)
     units_sold = ma.Integer(dump_only=True, load=False)
+    units_available = ma.Integer(dump_only=True, load=False)
     expired = ma.Boolean(dump_only=True)
+    is_expired = ma.Boolean(dump_only=True)
     brand_name = ma.String(dump_only=True)
     quantity_label = ma.String(dump_only=True)
     default_stock = ma.Boolean(load=True, allow_none=True)
@@ -224,7 +226,7 @@ class ProductElasticSchema(BaseSchema):
         model = Product
         exclude = ('created_on', 'updated_on', 'store', 'last_selling_amount',
                    'last_purchase_amount', 'stock_required', 'is_short', 'distributors',
-                   '_links', 'stocks', 'min_stock', 'combos', 'add_ons')
+                   '_links', 'stocks', 'min_stock', 'combos', 'add_ons', 'keywords')
 
     name = ma.String()
     short_code = ma.String()
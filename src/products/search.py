@@ -0,0 +1,114 @@
+"""
+Search document of products: the weighted tsvector `product.keywords` queried by `__keywords__search`.
+
+The name of a product weighs most, then its therapeutic name, its brand and its salts. Writes to products, brands,
+salts and the salts of products mark the products they change and their documents are recomputed at the end of
+the flush, so searches see them within the same transaction. `reindex_products` rebuilds every document.
+"""
+from sqlalchemy import event, func, literal_column, or_, select
+from sqlalchemy.orm import object_session
+from sqlalchemy.orm.attributes import get_history
+
+from src import db
+from src.utils.operators import Search
+from .models import Brand, Product, ProductSalt, Salt
+
+product_table = Product.__table__
+brand_table = Brand.__table__
+salt_table = Salt.__table__
+product_salt_table = ProductSalt.__table__
+
+PRODUCT_KEYS = ('name', 'therapeutic_name', 'brand_id')
+
+_INFO_KEY = '_search_marks'
+
+
+def _weighted(text, weight: str):
+    return func.setweight(func.to_tsvector(Search.config, func.coalesce(text, '')),
+                          literal_column("'{}'".format(weight)))
+
+
+def search_document():
+    """The `keywords` of the product row being updated."""
+    p = product_table.c
+    brand = select([brand_table.c.name]).where(brand_table.c.id == p.brand_id).as_scalar()
+    salts = select([func.string_agg(salt_table.c.name, literal_column("' '"))]) \
+        .select_from(product_salt_table.join(salt_table, salt_table.c.id == product_salt_table.c.salt_id)) \
+        .where(product_salt_table.c.product_id == p.id).as_scalar()
+    return _weighted(p.name, 'A').op('||')(_weighted(p.therapeutic_name, 'B')) \
+        .op('||')(_weighted(brand, 'C')).op('||')(_weighted(salts, 'D'))
+
+
+def update_keywords(connection, criterion) -> int:
+    return connection.execute(product_table.update().where(criterion).values(keywords=search_document())).rowcount
+
+
+def reindex_products(batch_size: int = 10000) -> int:
+    """Recomputes the documents of every product in id batches, committing after each batch."""
+    low, high = db.session.query(func.min(Product.id), func.max(Product.id)).one()
+    indexed = 0
+    while low is not None and low <= high:
+        indexed += update_keywords(db.session, product_table.c.id.between(low, low + batch_size - 1))
+        db.session.commit()
+        low += batch_size
+    return indexed
+
+
+def _mark(session, kind: str, *ids) -> None:
+    if session is not None:
+        marks = session.info.setdefault(_INFO_KEY, {'product': set(), 'brand': set(), 'salt': set()})
+        marks[kind].update(i for i in ids if i is not None)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _reindex_marked(session, flush_context):
+    marks = session.info.pop(_INFO_KEY, None)
+    if not marks:
+        return
+    criteria = []
+    if marks['product']:
+        criteria.append(product_table.c.id.in_(list(marks['product'])))
+    if marks['brand']:
+        criteria.append(product_table.c.brand_id.in_(list(marks['brand'])))
+    if marks['salt']:
+        criteria.append(product_table.c.id.in_(select([product_salt_table.c.product_id])
+                                               .where(product_salt_table.c.salt_id.in_(list(marks['salt'])))))
+    if criteria:
+        update_keywords(session, or_(*criteria))
+
+
+@event.listens_for(Product, 'after_insert')
+def _product_inserted(mapper, connection, target):
+    _mark(object_session(target), 'product', target.id)
+
+
+@event.listens_for(Product, 'after_update')
+def _product_updated(mapper, connection, target):
+    if any(get_history(target, key).has_changes() for key in PRODUCT_KEYS):
+        _mark(object_session(target), 'product', target.id)
+
+
+@event.listens_for(Product.salts, 'append')
+@event.listens_for(Product.salts, 'remove')
+def _product_salts_changed(target, value, initiator):
+    # products not inserted yet are marked by `_product_inserted`
+    _mark(object_session(target), 'product', target.id)
+
+
+@event.listens_for(ProductSalt, 'after_insert')
+@event.listens_for(ProductSalt, 'after_update')
+@event.listens_for(ProductSalt, 'after_delete')
+def _product_salt_changed(mapper, connection, target):
+    _mark(object_session(target), 'product', target.product_id, *get_history(target, 'product_id').deleted)
+
+
+@event.listens_for(Brand, 'after_update')
+def _brand_renamed(mapper, connection, target):
+    if get_history(target, 'name').has_changes():
+        _mark(object_session(target), 'brand', target.id)
+
+
+@event.listens_for(Salt, 'after_update')
+def _salt_renamed(mapper, connection, target):
+    if get_history(target, 'name').has_changes():
+        _mark(object_session(target), 'salt', target.id)
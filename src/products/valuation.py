@@ -0,0 +1,177 @@
+"""
+Stock valuation snapshots: `stock_valuation` and `distributor_purchase`.
+
+Both are keyed by store and day, stocks by the day they were received and distributor purchases by the day of
+their bill, so a date range is answered by summing a few rows. Writes to stocks and to the items selling them mark
+the store days they touch; `refresh_stock_valuation` recomputes those days every minute and
+`snapshot_stock_valuation` rebuilds every day at night, which also catches stocks expiring.
+"""
+from datetime import date, datetime, time, timedelta
+from typing import Iterable, Set
+
+from sqlalchemy import Date, and_, case, cast, event, func, select
+from sqlalchemy.orm import object_session
+from sqlalchemy.orm.attributes import get_history
+
+from src import db, redis_store
+from src.orders.models import Item, Order
+from src.orders.rollups import drain_store_days, store_day
+from src.utils import commit_hooks, stats_cache
+from .models import DistributorBill, DistributorPurchase, Stock, StockValuation
+
+DIRTY_KEY = 'stock_valuation:dirty'
+
+stock_table = Stock.__table__
+bill_table = DistributorBill.__table__
+valuation_table = StockValuation.__table__
+purchase_table = DistributorPurchase.__table__
+item_table = Item.__table__
+
+
+def _between(column, start: datetime = None, end: datetime = None):
+    criteria = []
+    if start is not None:
+        criteria.append(column >= start)
+    if end is not None:
+        criteria.append(column < end)
+    return criteria
+
+
+def stock_values(start: datetime = None, end: datetime = None, store_ids: Iterable = None):
+    """Per store and day values of the stocks received in [start, end), in the columns of `stock_valuation`."""
+    s = stock_table.c
+    day = cast(s.created_on, Date).label('day')
+    on_hand = s.units_available * s.purchase_amount
+    criteria = _between(s.created_on, start, end)
+    if store_ids is not None:
+        criteria.append(s.store_id.in_(list(store_ids)))
+    return select([s.store_id, day,
+                   func.coalesce(func.sum(s.purchase_amount * s.units_purchased), 0).label('purchased_value'),
+                   func.coalesce(func.sum(s.selling_amount * s.units_sold), 0).label('sold_value'),
+                   func.coalesce(func.sum(case([(s.is_expired.is_(True), on_hand)], else_=0)), 0)
+                   .label('expired_value'),
+                   func.coalesce(func.sum(case([(s.is_expired.is_(True), 0)], else_=on_hand)), 0)
+                   .label('inventory_value')]) \
+        .where(and_(*criteria)).group_by(s.store_id, day)
+
+
+def distributor_purchases(start: datetime = None, end: datetime = None, store_ids: Iterable = None):
+    """Per store, day and distributor value of the bills created in [start, end), as in `distributor_purchase`."""
+    s = stock_table.c
+    day = cast(bill_table.c.created_on, Date).label('day')
+    criteria = _between(bill_table.c.created_on, start, end)
+    if store_ids is not None:
+        criteria.append(s.store_id.in_(list(store_ids)))
+    return select([s.store_id, day, bill_table.c.distributor_id,
+                   func.coalesce(func.sum(s.purchase_amount * s.units_purchased), 0).label('purchases')]) \
+        .select_from(stock_table.join(bill_table, bill_table.c.id == s.distributor_bill_id)) \
+        .where(and_(*criteria)).group_by(s.store_id, day, bill_table.c.distributor_id)
+
+
+SNAPSHOTS = ((valuation_table, stock_values), (purchase_table, distributor_purchases))
+
+
+def _rebuild(criterion, start: datetime = None, end: datetime = None, store_ids: Iterable = None) -> None:
+    store_ids = None if store_ids is None else list(store_ids)
+    for table, query in SNAPSHOTS:
+        delete = table.delete()
+        if criterion is not None:
+            delete = delete.where(criterion(table))
+        if store_ids is not None:
+            delete = delete.where(table.c.store_id.in_(store_ids))
+        db.session.execute(delete)
+        rows = query(start, end, store_ids)
+        db.session.execute(table.insert().from_select([column.name for column in rows.columns], rows))
+
+
+def refresh_valuation_day(day: date, store_ids: Iterable = None) -> None:
+    """Recomputes the snapshots of `day` for `store_ids`, or every store, in the current transaction."""
+    start = datetime.combine(day, time.min)
+    _rebuild(lambda table: table.c.day == day, start, start + timedelta(days=1), store_ids)
+
+
+def snapshot_all(store_ids: Iterable = None) -> None:
+    """Rebuilds the snapshots of every day in one transaction, committed before returning."""
+    _rebuild(None, store_ids=store_ids)
+    db.session.commit()
+    if store_ids is None:
+        stats_cache.bump_generations(stats_cache.GLOBAL)
+    else:
+        stats_cache.bump_stores(store_ids)
+
+
+def refresh_pending_valuation() -> int:
+    days = drain_store_days(DIRTY_KEY, refresh_valuation_day)
+    return sum(len(store_ids) for store_ids in days.values())
+
+
+def _queue_days(keys: Set[str]) -> None:
+    redis_store.sadd(DIRTY_KEY, *keys)
+
+
+def _queue_stocks(stock_ids: Set[int]) -> None:
+    # the session can't run statements once it has committed
+    with db.engine.connect() as connection:
+        stocks = stock_table.outerjoin(bill_table, bill_table.c.id == stock_table.c.distributor_bill_id)
+        rows = connection.execute(select([stock_table.c.store_id, stock_table.c.created_on, bill_table.c.created_on])
+                                  .select_from(stocks).where(stock_table.c.id.in_(list(stock_ids))))
+        keys = set()
+        for store_id, created_on, billed_on in rows:
+            keys.add(store_day(store_id, created_on))
+            if billed_on is not None:
+                keys.add(store_day(store_id, billed_on))
+    if keys:
+        _queue_days(keys)
+
+
+def mark_stocks(session, *stock_ids) -> None:
+    commit_hooks.mark(session, 'valuation_stocks', *stock_ids)
+
+
+def _mark_bill_day(connection, target, store_id, bill_id) -> None:
+    if bill_id is not None:
+        billed_on = connection.execute(select([bill_table.c.created_on]).where(bill_table.c.id == bill_id)).scalar()
+        commit_hooks.mark_object(target, 'valuation', store_day(store_id, billed_on))
+
+
+@event.listens_for(Stock, 'after_insert')
+@event.listens_for(Stock, 'after_update')
+def _stock_changed(mapper, connection, target):
+    mark_stocks(object_session(target), target.id)
+    # the store day and bill the stock counted in before
+    previous_store = get_history(target, 'store_id').deleted
+    previous_created = get_history(target, 'created_on').deleted
+    store_id = previous_store[0] if previous_store else target.store_id
+    if previous_store or previous_created:
+        commit_hooks.mark_object(target, 'valuation', store_day(
+            store_id, previous_created[0] if previous_created else target.__dict__.get('created_on')))
+    bill_ids = get_history(target, 'distributor_bill_id').deleted
+    if previous_store and not bill_ids:
+        bill_ids = [target.distributor_bill_id]
+    for bill_id in bill_ids:
+        _mark_bill_day(connection, target, store_id, bill_id)
+
+
+@event.listens_for(Stock, 'after_delete')
+def _stock_deleted(mapper, connection, target):
+    commit_hooks.mark_object(target, 'valuation', store_day(target.store_id, target.__dict__.get('created_on')))
+    _mark_bill_day(connection, target, target.store_id, target.distributor_bill_id)
+
+
+@event.listens_for(Item, 'after_insert')
+@event.listens_for(Item, 'after_update')
+@event.listens_for(Item, 'after_delete')
+def _item_changed(mapper, connection, target):
+    # units sold move with the items
+    mark_stocks(object_session(target), target.stock_id, *get_history(target, 'stock_id').deleted)
+
+
+@event.listens_for(Order, 'after_update')
+def _order_voided(mapper, connection, target):
+    if get_history(target, 'is_void').has_changes():
+        mark_stocks(object_session(target), *(stock_id for stock_id, in connection.execute(
+            select([item_table.c.stock_id]).where(item_table.c.order_id == target.id))))
+
+
+commit_hooks.register_commit_handler('valuation', _queue_days)
+commit_hooks.register_commit_handler('valuation_stocks', _queue_stocks)
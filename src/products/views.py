@@ -3,14 +3,19 @@ from datetime import datetime
 from flask import make_response, jsonify, request
 from flask_restful import Resource
 from flask_security import current_user, roles_accepted, auth_token_required
-from sqlalchemy import func, cast, Date, Text, Integer
+from sqlalchemy import and_, func, cast, select, Text, Integer
 
 from src import BaseView, AssociationView
-from src import api
-from .models import Stock, DistributorBill
+from src import api, bp, db
+from src.utils.export_jobs import register_export
+from src.utils.search_index import search_backend, search_index
+from src.utils.stats_cache import cached_stats
+from .barcodes import barcode_cache
+from .models import Distributor, Product, Stock
 from .resources import BrandResource, DistributorBillResource, DistributorResource, ProductResource, \
     ProductTaxResource, StockResource, TaxResource, TagResource, ComboResource, SaltResource, \
     ProductTagResource, ProductSaltResource
+from .valuation import purchase_table, valuation_table
 
 
 @api.register()
@@ -34,6 +39,9 @@ class StockView(BaseView):
         return StockResource
 
 
+register_export('stock', StockResource)
+
+
 @api.register()
 class DistributorView(BaseView):
     @classmethod
@@ -98,7 +106,7 @@ class ProductSaltAssociationView(AssociationView):
 
 
 class StockStatResource(Resource):
-    method_decorators = [roles_accepted('admin', 'owner', 'staff'), auth_token_required]
+    method_decorators = [cached_stats('stock_stats'), roles_accepted('admin', 'owner', 'staff'), auth_token_required]
 
     model = Stock
 
@@ -120,26 +128,69 @@ class StockStatResource(Resource):
             if days > 360:
                 collection_type = 'month'
 
-        stock_metrics = Stock.query \
-            .with_entities(cast(func.coalesce(func.Sum(self.model.purchase_amount * self.model.units_purchased), 0), Integer),
-                           cast(func.coalesce(func.Sum(self.model.selling_amount * self.model.units_sold), 0), Integer),
-                           cast(func.coalesce(
-                               func.Sum((self.model.units_purchased - self.model.units_sold) * self.model.purchase_amount)
-                               .filter(self.model.expired == True), 0), Integer),
-                           func.cast(func.date_trunc(collection_type, func.cast(self.model.created_on, Date)), Text)
-                           .label('dateWeek')) \
-            .filter(self.model.created_on.between(from_date, to_date),
-                    self.model.retail_shop_id.in_(shops)).order_by('dateWeek').group_by('dateWeek').limit(100).all()
+        valuation = valuation_table.c
+        date_week = func.cast(func.date_trunc(collection_type, valuation.day), Text).label('dateWeek')
+        stock_metrics = [list(row) for row in db.session.execute(
+            select([cast(func.sum(valuation.purchased_value), Integer), cast(func.sum(valuation.sold_value), Integer),
+                    cast(func.sum(valuation.expired_value), Integer), date_week])
+            .where(and_(valuation.store_id.in_(shops), valuation.day.between(from_date, to_date)))
+            .group_by(date_week).order_by(date_week).limit(100))]
 
-        distributor_metrics = DistributorBill.query \
-            .with_entities(cast(func.coalesce(func.Sum(DistributorBill.bill_amount), 0), Integer), DistributorBill.distributor_name,
-                           ) \
-            .filter(DistributorBill.created_on.between(from_date, to_date),
-                    DistributorBill.retail_shop_id.in_(shops)) \
-            .group_by(DistributorBill.distributor_id) \
-            .limit(100).all()
+        inventory_value = db.session.execute(
+            select([cast(func.coalesce(func.sum(valuation.inventory_value), 0), Integer)])
+            .where(and_(valuation.store_id.in_(shops), valuation.day <= to_date))).scalar()
 
-        return make_response(jsonify(dict(stock_metrics=stock_metrics, distributor_metrics=distributor_metrics)), 200)
+        purchases = purchase_table.c
+        distributor_metrics = [list(row) for row in db.session.execute(
+            select([cast(func.sum(purchases.purchases), Integer), Distributor.name])
+            .select_from(purchase_table.join(Distributor, Distributor.id == purchases.distributor_id))
+            .where(and_(purchases.store_id.in_(shops), purchases.day.between(from_date, to_date)))
+            .group_by(purchases.distributor_id, Distributor.name).limit(100))]
+
+        return make_response(jsonify(dict(stock_metrics=stock_metrics, distributor_metrics=distributor_metrics,
+                                          inventory_value=inventory_value)), 200)
 
 
 api.add_resource(StockStatResource, '/stock_stats/', endpoint='stock_stats')
+
+
+class ProductSearchResource(Resource):
+    method_decorators = [auth_token_required]
+
+    def get(self):
+        """Products matching `q` from the search index, best first, dumped as by `GET /product/`."""
+        resource = ProductResource()
+        ids = search_index.backend.search(request.args.get('q', ''), {'is_disabled': False}, resource.limit)
+        if not ids:
+            return make_response(jsonify({'error': True, 'message': 'No Resource Found'}), 404)
+        products = resource.has_read_permission(
+            Product.query.options(*resource.load_options()).filter(Product.id.in_(ids))).all()
+        rank = {product_id: position for position, product_id in enumerate(ids)}
+        products.sort(key=lambda product: rank[product.id])
+        return make_response(jsonify({'success': True, 'data': resource.dump(products, many=True)}), 200)
+
+
+def _register_product_search(state):
+    # without a search backend shared by every worker there is nothing to search, see src/utils/search_index.py
+    if search_backend(state.app.config):
+        api.add_resource(ProductSearchResource, '/product_search/', endpoint='product_search')
+
+
+bp.record(_register_product_search)
+
+
+class BarcodeResource(Resource):
+    method_decorators = [auth_token_required]
+
+    def get(self, barcode):
+        """Product scanned at the counter of `store_id`, with its taxes there and the stock to sell from."""
+        store_id = request.args.get('store_id', type=int)
+        if store_id is None or not current_user.has_shop_access(store_id):
+            return make_response(jsonify({'message': 'Access Forbidden'}), 403)
+        product = barcode_cache.lookup(barcode, store_id)
+        if product is None:
+            return make_response(jsonify({'error': True, 'message': 'Resource not found'}), 404)
+        return make_response(jsonify({'success': True, 'data': product}), 200)
+
+
+api.add_resource(BarcodeResource, '/barcode/<string:barcode>/', endpoint='barcode')
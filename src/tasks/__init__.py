@@ -0,0 +1,4 @@
+from .stock_tasks import sweep_stocks
+from .export_tasks import export_job, purge_exports
+from .rollup_tasks import refresh_sales_rollups, refresh_stock_valuation, snapshot_stock_valuation
+from .elastic_tasks import index_products, reindex_products
@@ -0,0 +1,14 @@
+from src import celery
+from src.products.indexing import index_pending_products, reindex_all
+
+
+@celery.task
+def index_products():
+    """Upserts the search documents of the products written to since the last run."""
+    return index_pending_products()
+
+
+@celery.task
+def reindex_products():
+    """Upserts the search document of every product."""
+    return reindex_all()
@@ -0,0 +1,75 @@
+import gzip
+import os
+import time
+
+from flask import _request_ctx_stack, current_app, request
+
+from src import celery, db, sentry
+from src.user.models import User
+from src.utils.export import iter_records, write_csv, write_xlsx
+from src.utils.export_jobs import DONE, FAILED, RUNNING, exportable, job_path, update_job
+
+
+def _with_progress(job: str, records, every: int):
+    rows = 0
+    for rows, record in enumerate(records, 1):
+        yield record
+        if rows % every == 0:
+            update_job(job, rows=rows)
+    update_job(job, rows=rows)
+
+
+def _query(resource):
+    query = resource.apply_filters(queryset=resource.model.query.options(*resource.load_options()), **request.args)
+    query = resource.has_read_permission(query)
+    if '__order_by' in request.args:
+        query = resource.apply_ordering(query, request.args.getlist('__order_by'))
+    return query
+
+
+@celery.task
+def export_job(job: str, name: str, user_id, args: dict, file_format: str):
+    """Writes the export `job` to disk: the rows of resource `name` filtered by `args` as seen by `user_id`."""
+    chunk_size = current_app.config.get('EXPORT_CHUNK_SIZE', 1000)
+    path = job_path(job, file_format)
+    partial = '{}.{}.part'.format(path, os.getpid())
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    start = time.time()
+    with current_app.test_request_context(query_string=args):
+        _request_ctx_stack.top.user = User.query.get(user_id)
+        resource = exportable[name]()
+        try:
+            query = _query(resource)
+            update_job(job, status=RUNNING, total=query.order_by(None).count())
+            records = _with_progress(job, iter_records(query, resource.dump, chunk_size), chunk_size)
+            if file_format == 'xlsx':
+                with open(partial, 'wb') as fileobj:
+                    write_xlsx(records, fileobj, resource.model.__name__)
+            else:
+                with gzip.open(partial, 'wt', newline='') as fileobj:
+                    write_csv(records, fileobj)
+            os.replace(partial, path)
+        except Exception as e:
+            sentry.captureException()
+            update_job(job, status=FAILED, error=str(e))
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        finally:
+            db.session.rollback()
+    return update_job(job, status=DONE, seconds=round(time.time() - start, 2), size=os.path.getsize(path))
+
+
+@celery.task
+def purge_exports(max_age: int = None):
+    """Removes export files older than `EXPORT_JOB_TTL`, whose jobs have expired from redis."""
+    max_age = max_age or current_app.config.get('EXPORT_JOB_TTL', 86400)
+    directory = current_app.config['EXPORT_DIR']
+    if not os.path.isdir(directory):
+        return 0
+    removed = 0
+    for entry in os.scandir(directory):
+        if entry.is_file() and time.time() - entry.stat().st_mtime > max_age:
+            os.remove(entry.path)
+            removed += 1
+    return removed
@@ -0,0 +1,21 @@
+from src import celery
+from src.orders.rollups import refresh_pending_sales
+from src.products.valuation import refresh_pending_valuation, snapshot_all
+
+
+@celery.task
+def refresh_sales_rollups():
+    """Recomputes the daily sales rollups of the store days written to since the last run."""
+    return refresh_pending_sales()
+
+
+@celery.task
+def refresh_stock_valuation():
+    """Recomputes the stock valuation snapshots of the store days written to since the last run."""
+    return refresh_pending_valuation()
+
+
+@celery.task
+def snapshot_stock_valuation():
+    """Rebuilds every stock valuation snapshot, picking up stocks that expired since the last run."""
+    snapshot_all()
@@ -0,0 +1,44 @@
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import and_, or_, select
+
+from src import celery, db
+from src.products.models import Stock
+
+stock_table = Stock.__table__
+
+
+def _sweep(criterion, values, batch_size: int) -> int:
+    """Applies `values` to stocks matching `criterion` in batches of `batch_size`, committing after each batch."""
+    swept = 0
+    while True:
+        batch = select([stock_table.c.id]).where(criterion).limit(batch_size)
+        updated = db.session.execute(stock_table.update().where(stock_table.c.id.in_(batch)).values(**values)).rowcount
+        db.session.commit()
+        swept += updated
+        if updated < batch_size:
+            return swept
+
+
+def sweep_sold_out(batch_size: int) -> int:
+    return _sweep(and_(stock_table.c.is_sold.isnot(True), stock_table.c.units_sold >= stock_table.c.units_purchased),
+                  dict(is_sold=True), batch_size)
+
+
+def sweep_expired(batch_size: int) -> int:
+    today = datetime.now().date()
+    swept = _sweep(and_(stock_table.c.is_expired.isnot(True), stock_table.c.expiry_date < today),
+                   dict(is_expired=True), batch_size)
+    # expiry dates corrected after a stock was marked
+    swept += _sweep(and_(stock_table.c.is_expired.is_(True),
+                         or_(stock_table.c.expiry_date.is_(None), stock_table.c.expiry_date >= today)),
+                    dict(is_expired=False), batch_size)
+    return swept
+
+
+@celery.task
+def sweep_stocks(batch_size: int = None):
+    """Marks sold out and expired stocks, keeping these writes out of the read path."""
+    batch_size = batch_size or current_app.config.get('STOCK_SWEEP_BATCH_SIZE', 5000)
+    return {'sold': sweep_sold_out(batch_size), 'expired': sweep_expired(batch_size)}
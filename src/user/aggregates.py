@@ -0,0 +1,339 @@
+"""
+Customer aggregates kept on write.
+
+Every customer carries `total_orders`, `total_billing`, `amount_due`, `first_order_on` and `last_order_on` over
+its non void orders, updated by the order and transaction mapper events below. `weekly_customer_cohort` counts
+the customers ordering in each store and week by the week of their first order and `monthly_customer_cohort`
+likewise by month, since distinct customers don't add up from weeks to months; both are refreshed from the store
+days drained by `src.orders.rollups.refresh_pending_sales`. A customer whose first order moves changes cohort in
+every period it ordered in, so the order events queue all of those periods as well.
+"""
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Set
+
+from sqlalchemy import Date, and_, case, cast, event, func, or_, select, union
+from sqlalchemy.orm import object_session
+from sqlalchemy.orm.attributes import get_history
+
+from src import db
+from src.orders.models import Order
+from src.orders.rollups import mark_sales, register_day_refresher
+from src.utils import commit_hooks
+from .models import Customer, CustomerTransaction, MonthlyCustomerCohort, WeeklyCustomerCohort
+
+customer_table = Customer.__table__
+order_table = Order.__table__
+transaction_table = CustomerTransaction.__table__
+cohort_table = WeeklyCustomerCohort.__table__
+monthly_cohort_table = MonthlyCustomerCohort.__table__
+
+ORDER_KEYS = ('customer_id', 'is_void', 'total', 'amount_paid', 'created_on')
+
+
+def _counted(customer_id):
+    return and_(order_table.c.customer_id == customer_id, order_table.c.is_void.isnot(True))
+
+
+def apply_customer_delta(connection, customer_id, orders: int = 0, billing: float = 0, due: float = 0,
+                         first_order_on: datetime = None, last_order_on: datetime = None) -> bool:
+    """
+    Adds to the aggregates of `customer_id`; order dates only ever move outwards. Returns whether `first_order_on`
+    became the first order of a customer that had orders before.
+    """
+    if customer_id is None:
+        return False
+    c = customer_table.c
+    values = dict(total_orders=c.total_orders + orders, total_billing=c.total_billing + billing,
+                  amount_due=c.amount_due + due)
+    if first_order_on is not None:
+        values['first_order_on'] = case([(or_(c.first_order_on.is_(None), c.first_order_on > first_order_on),
+                                          first_order_on)], else_=c.first_order_on)
+    if last_order_on is not None:
+        values['last_order_on'] = case([(or_(c.last_order_on.is_(None), c.last_order_on < last_order_on),
+                                         last_order_on)], else_=c.last_order_on)
+    statement = customer_table.update().where(c.id == customer_id).values(**values)
+    if first_order_on is None:
+        connection.execute(statement)
+        return False
+    row = connection.execute(statement.returning(c.first_order_on, c.total_orders)).first()
+    return row is not None and row.first_order_on == first_order_on and row.total_orders > orders
+
+
+def _refresh_order_dates(connection, customer_id) -> bool:
+    """
+    Recomputes the order dates of `customer_id` after one of its orders stopped counting. Returns whether its
+    first order moved.
+    """
+    if customer_id is None:
+        return False
+    c = customer_table.c
+    counted = _counted(c.id)
+    previous = connection.execute(select([c.first_order_on]).where(c.id == customer_id)).scalar()
+    first_order_on = connection.execute(customer_table.update().where(c.id == customer_id).values(
+        first_order_on=select([func.min(order_table.c.created_on)]).where(counted).as_scalar(),
+        last_order_on=select([func.max(order_table.c.created_on)]).where(counted).as_scalar())
+        .returning(c.first_order_on)).scalar()
+    return first_order_on != previous
+
+
+def _mark_cohorts(connection, session, customer_id) -> None:
+    """Queues a day of every cohort period `customer_id` ordered in, once its first order moved."""
+    criterion = and_(_counted(customer_id), order_table.c.store_id.isnot(None))
+    periods = union(*(select([order_table.c.store_id, cast(func.date_trunc(period, order_table.c.created_on), Date)])
+                      .where(criterion) for period in COHORTS))
+    for store_id, start in connection.execute(periods):
+        mark_sales(session, store_id, datetime.combine(start, time.min))
+
+
+def _amounts(total, amount_paid) -> tuple:
+    total = total or 0
+    return total, total - (amount_paid or 0)
+
+
+def count_orders(connection, rows: Iterable[Dict]) -> None:
+    """Adds order rows inserted without the mapper, as by the order sync, to their customers."""
+    customers = defaultdict(lambda: [0, 0, 0, None, None])
+    for row in rows:
+        if row.get('customer_id') is None or row.get('is_void'):
+            continue
+        aggregate = customers[row['customer_id']]
+        billing, due = _amounts(row.get('total'), row.get('amount_paid'))
+        aggregate[0] += 1
+        aggregate[1] += billing
+        aggregate[2] += due
+        aggregate[3] = min(filter(None, (aggregate[3], row['created_on'])))
+        aggregate[4] = max(filter(None, (aggregate[4], row['created_on'])))
+    for customer_id, aggregate in customers.items():
+        if apply_customer_delta(connection, customer_id, *aggregate):
+            _mark_cohorts(connection, db.session, customer_id)
+    if any(aggregate[2] for aggregate in customers.values()):
+        commit_hooks.mark(db.session, 'stats', 'customer_stats')
+
+
+def _load_previous(target, value, oldvalue, initiator):
+    pass
+
+
+# the events need the values an order had before a change even when they were not loaded yet
+for attribute in (Order.customer_id, Order.total, Order.amount_paid, Order.created_on,
+                  CustomerTransaction.customer_id, CustomerTransaction.amount):
+    event.listen(attribute, 'set', _load_previous, active_history=True)
+
+
+def _previous(target, key):
+    history = get_history(target, key)
+    return history.deleted[0] if history.deleted else target.__dict__.get(key)
+
+
+def _created_on(target):
+    # created_on comes from a server default and isn't loaded right after the insert
+    return target.__dict__.get('created_on') or datetime.now()
+
+
+def _mark_stats(target) -> None:
+    # the amount due reported by the customer stats sums every store of the organisation, while orders only bump
+    # the generation of their own store
+    commit_hooks.mark_object(target, 'stats', 'customer_stats')
+
+
+def _mark_due(target, due: float) -> None:
+    if due:
+        _mark_stats(target)
+
+
+@event.listens_for(Order, 'after_insert')
+def _order_inserted(mapper, connection, target):
+    if target.customer_id is None or target.is_void:
+        return
+    created_on = _created_on(target)
+    billing, due = _amounts(target.total, target.amount_paid)
+    if apply_customer_delta(connection, target.customer_id, 1, billing, due, first_order_on=created_on,
+                            last_order_on=created_on):
+        _mark_cohorts(connection, object_session(target), target.customer_id)
+    _mark_due(target, due)
+
+
+@event.listens_for(Order, 'after_update')
+def _order_updated(mapper, connection, target):
+    if not any(get_history(target, key).has_changes() for key in ORDER_KEYS):
+        return
+    customer_id, is_void, total, amount_paid, created_on = (_previous(target, key) for key in ORDER_KEYS)
+    was_counted = customer_id is not None and not is_void
+    is_counted = target.customer_id is not None and not target.is_void
+    billing, due = _amounts(total, amount_paid)
+    new_billing, new_due = _amounts(target.total, target.amount_paid)
+
+    if was_counted and is_counted and customer_id == target.customer_id and \
+            not get_history(target, 'created_on').has_changes():
+        apply_customer_delta(connection, customer_id, 0, new_billing - billing, new_due - due)
+        _mark_due(target, new_due - due)
+        return
+    if was_counted:
+        apply_customer_delta(connection, customer_id, -1, -billing, -due)
+        if _refresh_order_dates(connection, customer_id):
+            _mark_cohorts(connection, object_session(target), customer_id)
+        _mark_due(target, due)
+    if is_counted:
+        created_on = _created_on(target)
+        if apply_customer_delta(connection, target.customer_id, 1, new_billing, new_due,
+                                first_order_on=created_on, last_order_on=created_on):
+            _mark_cohorts(connection, object_session(target), target.customer_id)
+        _mark_due(target, new_due)
+
+
+@event.listens_for(Order, 'after_delete')
+def _order_deleted(mapper, connection, target):
+    customer_id, is_void, total, amount_paid, _ = (_previous(target, key) for key in ORDER_KEYS)
+    if customer_id is not None and not is_void:
+        billing, due = _amounts(total, amount_paid)
+        apply_customer_delta(connection, customer_id, -1, -billing, -due)
+        if _refresh_order_dates(connection, customer_id):
+            _mark_cohorts(connection, object_session(target), customer_id)
+        _mark_due(target, due)
+
+
+@event.listens_for(CustomerTransaction, 'after_insert')
+def _transaction_inserted(mapper, connection, target):
+    apply_customer_delta(connection, target.customer_id, due=-(target.amount or 0))
+    _mark_stats(target)
+
+
+@event.listens_for(CustomerTransaction, 'after_update')
+def _transaction_updated(mapper, connection, target):
+    if not any(get_history(target, key).has_changes() for key in ('customer_id', 'amount')):
+        return
+    apply_customer_delta(connection, _previous(target, 'customer_id'), due=_previous(target, 'amount') or 0)
+    apply_customer_delta(connection, target.customer_id, due=-(target.amount or 0))
+    _mark_stats(target)
+
+
+@event.listens_for(CustomerTransaction, 'after_delete')
+def _transaction_deleted(mapper, connection, target):
+    apply_customer_delta(connection, _previous(target, 'customer_id'), due=_previous(target, 'amount') or 0)
+    _mark_stats(target)
+
+
+def reconcile_customer_aggregates(batch_size: int = 10000) -> int:
+    """
+    Recomputes the aggregates of every customer from its orders and transactions in id batches, committing after
+    each batch. Returns the number of customers whose aggregates had drifted.
+    """
+    counted = _counted(customer_table.c.id)
+    total = func.coalesce(order_table.c.total, 0)
+    orders = select([func.count(order_table.c.id)]).where(counted).as_scalar()
+    billing = select([func.coalesce(func.sum(total), 0)]).where(counted).as_scalar()
+    due = select([func.coalesce(func.sum(total - func.coalesce(order_table.c.amount_paid, 0)), 0)]) \
+        .where(counted).as_scalar() - \
+        select([func.coalesce(func.sum(transaction_table.c.amount), 0)]) \
+        .where(transaction_table.c.customer_id == customer_table.c.id).as_scalar()
+    first_order_on = select([func.min(order_table.c.created_on)]).where(counted).as_scalar()
+    last_order_on = select([func.max(order_table.c.created_on)]).where(counted).as_scalar()
+    c = customer_table.c
+    drift = or_(c.total_orders != orders, c.total_billing != billing, c.amount_due != due,
+                func.coalesce(c.first_order_on, datetime.min) != func.coalesce(first_order_on, datetime.min),
+                func.coalesce(c.last_order_on, datetime.min) != func.coalesce(last_order_on, datetime.min))
+
+    low, high = db.session.query(func.min(Customer.id), func.max(Customer.id)).one()
+    drifted = 0
+    while low is not None and low <= high:
+        batch = and_(c.id >= low, c.id < low + batch_size, drift)
+        result = db.session.execute(customer_table.update().where(batch).values(
+            total_orders=orders, total_billing=billing, amount_due=due, first_order_on=first_order_on,
+            last_order_on=last_order_on))
+        drifted += result.rowcount
+        db.session.commit()
+        low += batch_size
+    return drifted
+
+
+def week_start(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def _next_month(month: date) -> date:
+    return month_start(month + timedelta(days=31))
+
+
+# the table and the end of a period of each cohort rollup, by the `date_trunc` field it is truncated to
+COHORTS = {'week': (cohort_table, lambda week: week + timedelta(days=7)),
+           'month': (monthly_cohort_table, _next_month)}
+
+
+def customer_cohorts(start: datetime, end: datetime, store_ids: Iterable = None, period: str = 'week'):
+    """Per store, order `period` and first order `period` customers of the orders created in [start, end)."""
+    ordered = cast(func.date_trunc(period, order_table.c.created_on), Date).label(period)
+    cohort = cast(func.date_trunc(period, customer_table.c.first_order_on), Date).label('cohort_' + period)
+    criterion = and_(order_table.c.created_on >= start, order_table.c.created_on < end,
+                     order_table.c.is_void.isnot(True), order_table.c.store_id.isnot(None),
+                     customer_table.c.first_order_on.isnot(None))
+    if store_ids is not None:
+        criterion = and_(criterion, order_table.c.store_id.in_(list(store_ids)))
+    return select([order_table.c.store_id, ordered, cohort,
+                   func.count(func.distinct(order_table.c.customer_id)).label('customers'),
+                   func.count(order_table.c.id).label('orders'),
+                   func.coalesce(func.sum(order_table.c.total), 0).label('total')]) \
+        .select_from(order_table.join(customer_table, customer_table.c.id == order_table.c.customer_id)) \
+        .where(criterion).group_by(order_table.c.store_id, ordered, cohort)
+
+
+def refresh_cohorts(period: str, start: date, store_ids: Iterable = None) -> None:
+    """Recomputes the cohorts of the `period` starting on `start` for `store_ids`, or every store."""
+    table, period_end = COHORTS[period]
+    store_ids = None if store_ids is None else list(store_ids)
+    criterion = table.c[period] == start
+    if store_ids is not None:
+        criterion = and_(criterion, table.c.store_id.in_(store_ids))
+    db.session.execute(table.delete().where(criterion))
+    rows = customer_cohorts(datetime.combine(start, datetime.min.time()),
+                            datetime.combine(period_end(start), datetime.min.time()), store_ids, period)
+    db.session.execute(table.insert().from_select([column.name for column in rows.columns], rows))
+
+
+def refresh_weekly_cohorts(week: date, store_ids: Iterable = None) -> None:
+    refresh_cohorts('week', week, store_ids)
+
+
+def refresh_monthly_cohorts(month: date, store_ids: Iterable = None) -> None:
+    refresh_cohorts('month', month, store_ids)
+
+
+def _refresh_cohort_days(days: Dict[date, Set[int]]) -> None:
+    for period, start_of in (('week', week_start), ('month', month_start)):
+        periods = defaultdict(set)
+        for day, store_ids in days.items():
+            periods[start_of(day)].update(store_ids)
+        for start, store_ids in sorted(periods.items()):
+            refresh_cohorts(period, start, store_ids)
+            db.session.commit()
+
+
+def backfill_weekly_cohorts(from_date: date, to_date: date, store_ids: Iterable = None) -> List[date]:
+    """Rebuilds the cohorts of every week from `from_date` to `to_date`, committing after each week."""
+    weeks = []
+    week = week_start(from_date)
+    while week <= to_date:
+        refresh_weekly_cohorts(week, store_ids)
+        db.session.commit()
+        weeks.append(week)
+        week += timedelta(days=7)
+    return weeks
+
+
+def backfill_monthly_cohorts(from_date: date, to_date: date, store_ids: Iterable = None) -> List[date]:
+    """Rebuilds the cohorts of every month from `from_date` to `to_date`, committing after each month."""
+    months = []
+    month = month_start(from_date)
+    while month <= to_date:
+        refresh_monthly_cohorts(month, store_ids)
+        db.session.commit()
+        months.append(month)
+        month = _next_month(month)
+    return months
+
+
+register_day_refresher(_refresh_cohort_days)
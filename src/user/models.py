@@ -1,10 +1,13 @@
 from datetime import datetime
 
 from flask_security import RoleMixin, UserMixin
-from sqlalchemy import UniqueConstraint, func, select
-from sqlalchemy.ext.hybrid import hybrid_property, hybrid_method
+from sqlalchemy import UniqueConstraint, event, func, select
+from sqlalchemy.orm.attributes import get_history
+from sqlalchemy.ext.hybrid import hybrid_property
 
 from src import db, BaseMixin, ReprMixin
+from src.utils import commit_hooks
+from src.utils.auth_context import AuthContext, get_auth_context, load_auth_snapshot, invalidate_auth_snapshots
 from src.orders.models import Order
 
 
@@ -120,22 +123,40 @@ class User(BaseMixin, UserMixin, ReprMixin, db.Model):
     permissions = db.relationship('Permission', back_populates='users', secondary='user_permission', lazy='dynamic')
     stores = db.relationship('Store', back_populates='users', secondary='user_store', lazy='dynamic')
 
+    @property
+    def auth_context(self):
+        return get_auth_context(('user', self.id), lambda: load_auth_snapshot(self.id, self.load_auth_context))
+
+    def load_auth_context(self):
+        roles = Role.query.with_entities(Role.name).join(UserRole, UserRole.role_id == Role.id) \
+            .filter(UserRole.user_id == self.id).all()
+        permissions = Permission.query.with_entities(Permission.name) \
+            .join(UserPermission, UserPermission.permission_id == Permission.id) \
+            .filter(UserPermission.user_id == self.id).all()
+        store_ids = UserStore.query.with_entities(UserStore.store_id).filter(UserStore.user_id == self.id) \
+            .order_by(UserStore.id).all()
+        return AuthContext(roles=[i[0] for i in roles], permissions=[i[0] for i in permissions],
+                           store_ids=[i[0] for i in store_ids])
+
     @hybrid_property
     def store_ids(self):
-        return [i[0] for i in self.stores.with_entities(Store.id).all()]
+        return list(self.auth_context.store_ids)
 
     @store_ids.expression
     def store_ids(self):
         return select([UserStore.store_id]).where(UserStore.user_id == self.id).label('store_ids').limit(1)
 
-    @hybrid_method
+    def has_role(self, role):
+        return self.auth_context.has_role(role if isinstance(role, str) else role.name)
+
     def has_shop_access(self, shop_id):
-        return db.session.query(UserStore.query.filter(UserStore.store_id == shop_id,
-                                                       UserStore.user_id == self.id).exists()).scalar()
+        return self.auth_context.has_store_access(shop_id)
+
+    def has_store_access(self, store_id):
+        return self.auth_context.has_store_access(store_id)
 
-    @hybrid_method
     def has_permission(self, permission):
-        return db.session.query(self.permissions.filter(Permission.name == permission).exists()).scalar()
+        return self.auth_context.has_permission(permission)
 
     @hybrid_property
     def is_owner(self):
@@ -166,21 +187,14 @@ class Customer(BaseMixin, db.Model, ReprMixin):
     orders = db.relationship('Order', uselist=True, lazy='dynamic')
     transactions = db.relationship('CustomerTransaction', uselist=True, lazy='dynamic')
 
-    UniqueConstraint(number, name, organisation_id)
-
-    @hybrid_property
-    def total_orders(self):
-        return self.orders.with_entities(func.coalesce(func.Count(Order.id), 0)).scalar()
-
-    @hybrid_property
-    def total_billing(self):
-        return self.orders.with_entities(func.coalesce(func.Sum(Order.total), 0)).scalar()
+    # running aggregates over the customer's non void orders, maintained by src/user/aggregates.py
+    total_orders = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    total_billing = db.Column(db.Float(precision=2), nullable=False, default=0, server_default='0')
+    amount_due = db.Column(db.Float(precision=2), nullable=False, default=0, server_default='0')
+    first_order_on = db.Column(db.TIMESTAMP, nullable=True, index=True)
+    last_order_on = db.Column(db.TIMESTAMP, nullable=True)
 
-    @hybrid_property
-    def amount_due(self):
-        return self.orders.with_entities(func.coalesce(func.Sum(Order.total), 0) -
-                                         func.coalesce(func.Sum(Order.amount_paid), 0)).scalar() - \
-               self.transactions.with_entities(func.coalesce(func.Sum(CustomerTransaction.amount), 0)).scalar()
+    UniqueConstraint(number, name, organisation_id)
 
 
 class CustomerTransaction(BaseMixin, db.Model, ReprMixin):
@@ -189,6 +203,40 @@ class CustomerTransaction(BaseMixin, db.Model, ReprMixin):
     customer = db.relationship('Customer', foreign_keys=[customer_id])
 
 
+class WeeklyCustomerCohort(BaseMixin, db.Model, ReprMixin):
+    """Customers of a store ordering in `week` grouped by the week of their first order, see src/user/aggregates.py."""
+
+    __repr_fields__ = ['store_id', 'week', 'cohort_week', 'customers']
+
+    week = db.Column(db.Date, nullable=False)
+    cohort_week = db.Column(db.Date, nullable=False)
+    customers = db.Column(db.Integer, nullable=False, default=0)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Float(precision=2), nullable=False, default=0)
+
+    store_id = db.Column(db.ForeignKey('store.id', ondelete='CASCADE'), nullable=False)
+
+    __table_args__ = (db.UniqueConstraint('store_id', 'week', 'cohort_week',
+                                          name='uq_weekly_customer_cohort_store_week_cohort'),)
+
+
+class MonthlyCustomerCohort(BaseMixin, db.Model, ReprMixin):
+    """Customers of a store ordering in `month` by the month of their first order, see src/user/aggregates.py."""
+
+    __repr_fields__ = ['store_id', 'month', 'cohort_month', 'customers']
+
+    month = db.Column(db.Date, nullable=False)
+    cohort_month = db.Column(db.Date, nullable=False)
+    customers = db.Column(db.Integer, nullable=False, default=0)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Float(precision=2), nullable=False, default=0)
+
+    store_id = db.Column(db.ForeignKey('store.id', ondelete='CASCADE'), nullable=False)
+
+    __table_args__ = (db.UniqueConstraint('store_id', 'month', 'cohort_month',
+                                          name='uq_monthly_customer_cohort_store_month_cohort'),)
+
+
 class Address(BaseMixin, db.Model, ReprMixin):
     name = db.Column(db.Text, nullable=False)
     locality_id = db.Column(db.ForeignKey('locality.id'), index=True)
@@ -226,3 +274,22 @@ class PrinterConfig(BaseMixin, db.Model, ReprMixin):
 
     stores = db.relationship('Store', back_populates='printer_config',
                              foreign_keys=[store_id])
+
+
+def _mark_user_association(mapper, connection, target):
+    commit_hooks.mark_object(target, 'auth', target.user_id, *get_history(target, 'user_id').deleted)
+
+
+def _mark_user(target, value, initiator):
+    commit_hooks.mark_object(target, 'auth', target.id)
+
+
+for _model in (UserRole, UserPermission, UserStore):
+    for _event_name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _event_name, _mark_user_association)
+
+for _attribute in (User.roles, User.permissions, User.stores):
+    for _event_name in ('append', 'remove'):
+        event.listen(_attribute, _event_name, _mark_user)
+
+commit_hooks.register_commit_handler('auth', invalidate_auth_snapshots)
@@ -1,4 +1,7 @@
+from marshmallow import validate
+
 from src import ma, BaseSchema
+from src.orders.invoice import current_invoice_number
 from .models import User, Role, Permission, UserRole, Store, Organisation, UserStore, \
     Customer, Address, Locality, City, RegistrationDetail, CustomerAddress, CustomerTransaction, \
     UserPermission, PrinterConfig
@@ -62,6 +65,8 @@ class StoreSchema(BaseSchema):
         exclude = ('created_on', 'updated_on', 'products', 'orders', 'users', 'brands', 'distributors', 'tags', 'taxes')
 
     organisation_id = ma.UUID()
+    # the last number of the invoice sequence of the store, writes reseed it, see src/orders/invoice.py
+    invoice_number = ma.Method('current_invoice_number', deserialize='load_invoice_number')
     retail_brand = ma.Nested('OrganisationSchema', many=False)
     total_sales = ma.Dict()
     address = ma.Nested('AddressSchema', many=False)
@@ -69,6 +74,12 @@ class StoreSchema(BaseSchema):
     registration_details = ma.Nested('RegistrationDetailSchema', many=True)
     printer_config = ma.Nested('PrinterConfigSchema', load=True, many=False)
 
+    def current_invoice_number(self, store):
+        return current_invoice_number(store)
+
+    def load_invoice_number(self, value):
+        return ma.Integer(validate=validate.Range(min=0)).deserialize(value)
+
 
 class OrganisationSchema(BaseSchema):
     class Meta:
@@ -94,6 +105,8 @@ class CustomerSchema(BaseSchema):
     total_orders = ma.Integer(dump_only=True)
     total_billing = ma.Float(precison=2, dump_only=True)
     amount_due = ma.Float(precison=2, dump_only=True)
+    first_order_on = ma.DateTime(dump_only=True)
+    last_order_on = ma.DateTime(dump_only=True)
     addresses = ma.Nested('AddressSchema', many=True, load=False, partial=True)
     organisation_id = ma.UUID(load=True)
     store_id = ma.List(ma.UUID(), load=True)
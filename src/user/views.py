@@ -4,13 +4,15 @@ from flask import request, jsonify, make_response, redirect
 from flask_restful import Resource
 from flask_security.utils import verify_and_update_password, login_user
 from flask_security import auth_token_required, roles_accepted, current_user
-from sqlalchemy import func, and_, cast, Date, Text, Float
+from sqlalchemy import func, and_, select, Text
 
 from src import BaseView, AssociationView
-from src import api
+from src import api, db
 from src.orders.models import Order
 from src.utils.methods import List
-from .models import User, Customer, CustomerTransaction
+from src.utils.stats_cache import cached_stats
+from .aggregates import COHORTS, month_start, week_start
+from .models import User, Customer
 from .resources import UserResource, UserRoleResource, RoleResource, \
     OrganisationResource, StoreResource, UserStoreResource, CustomerResource, AddressResource, \
     LocalityResource, CityResource, CustomerAddressResource, CustomerTransactionResource, \
@@ -161,7 +163,7 @@ class RegistrationDetailView(BaseView):
 
 
 class CustomerStatResource(Resource):
-    method_decorators = [roles_accepted('admin', 'owner', 'staff'), auth_token_required]
+    method_decorators = [cached_stats('customer_stats'), roles_accepted('admin', 'owner', 'staff'), auth_token_required]
 
     model = Customer
 
@@ -178,59 +180,39 @@ class CustomerStatResource(Resource):
         from_date = datetime.strptime(request.args['__created_on__gte'], '%Y-%m-%dT%H:%M:%S.%fZ').date()
         to_date = datetime.strptime(request.args['__created_on__lte'], '%Y-%m-%dT%H:%M:%S.%fZ').date()
 
-        days = (to_date - from_date).days
-
-        collection_type = 'day'
-        if days > 56:
-            collection_type = 'week'
-            if days > 360:
-                collection_type = 'month'
-
-        new_customers = self.model.query.join(Order, and_(Order.customer_id == self.model.id)) \
-            .with_entities(func.Count(func.Distinct(Order.customer_id)), func.Sum(Order.total), func.avg(Order.total),
-                           func.cast(func.date_trunc(collection_type, func.cast(self.model.created_on, Date)), Text)
-                           .label('dateWeek')
-                           ) \
-            .filter(and_(self.model.created_on.between(from_date, to_date), Order.created_on.between(from_date, to_date),
-                    Order.retail_shop_id.in_(shops))).group_by('dateWeek').order_by('dateWeek')\
-            .having(func.Count(func.Distinct(Order.id)) > 0).all()
-
-        return_customers = self.model.query.join(Order, and_(Order.customer_id == self.model.id)) \
-            .with_entities(func.Count(func.Distinct(Order.customer_id)), func.Sum(Order.total), func.avg(Order.total),
-                           func.cast(func.date_trunc(collection_type, func.cast(self.model.created_on, Date)), Text)
-                           .label('dateWeek')
-                           ) \
-            .filter(and_(self.model.created_on.between(from_date, to_date), Order.created_on.between(from_date, to_date))) \
-            .having(func.Count(func.Distinct(Order.id)) > 1).group_by('dateWeek').order_by('dateWeek').all()
-
-        old_customers = Order.query.join(Customer, and_(Customer.id == Order.customer_id)) \
-            .with_entities(func.Count(func.Distinct(Order.customer_id)), func.Sum(Order.total), func.avg(Order.total),
-                           func.cast(func.date_trunc(collection_type, func.cast(Order.created_on, Date)), Text)
-                           .label('dateWeek')
-                           ) \
-            .filter(and_(Customer.created_on <= from_date, Order.created_on.between(from_date, to_date),
-                    Order.retail_shop_id.in_(shops), Customer.retail_brand_id == brand_id))\
-            .group_by('dateWeek').order_by('dateWeek') \
-            .having(func.Count(func.Distinct(Order.id)) > 0).all()
-
-        total_due = self.model.query.outerjoin(Order, and_(Order.customer_id == self.model.id)) \
-            .outerjoin(CustomerTransaction, and_(CustomerTransaction.customer_id == self.model.id)) \
-            .with_entities(func.coalesce(cast(func.Sum(Order.total), Float), 0.0) -
-                           func.coalesce(cast(func.Sum(Order.amount_paid), Float), 0.0)
-                           - func.coalesce(cast(func.Sum(CustomerTransaction.amount), Float), 0.0)) \
-            .filter(self.model.retail_brand_id == brand_id).scalar()
-
-        top_customers = self.model.query.outerjoin(Order, and_(Order.customer_id == self.model.id)) \
-            .with_entities(func.Count(func.Distinct(Order.id)), self.model.name) \
-            .filter(self.model.retail_brand_id == brand_id, Order.created_on.between(from_date, to_date),
-                    Order.retail_shop_id.in_(shops)).group_by(Order.customer_id, self.model.name) \
-            .order_by(-func.Count(func.Distinct(Order.id))).limit(10).all()
-
-        top_billed_customers = self.model.query.outerjoin(Order, and_(Order.customer_id == self.model.id)) \
-            .with_entities(func.Sum(Order.total), self.model.name) \
-            .filter(self.model.retail_brand_id == brand_id, Order.created_on.between(from_date, to_date),
-                    Order.retail_shop_id.in_(shops)).group_by(Order.customer_id, self.model.name) \
-            .order_by(-func.Sum(Order.total)).limit(10).all()
+        # distinct customers of weeks don't add up to months, which have cohorts of their own
+        period, start_of = 'week', week_start
+        if (to_date - from_date).days > 360:
+            period, start_of = 'month', month_start
+
+        first_period = start_of(from_date)
+        table, _ = COHORTS[period]
+        ordered, cohort = table.c[period], table.c['cohort_' + period]
+        date_week = func.cast(func.date_trunc(period, ordered), Text).label('dateWeek')
+
+        def cohort_series(criterion):
+            return [list(row) for row in db.session.execute(
+                select([func.sum(table.c.customers), func.sum(table.c.total),
+                        func.sum(table.c.total) / func.nullif(func.sum(table.c.orders), 0), date_week])
+                .where(and_(table.c.store_id.in_(shops), ordered >= first_period, ordered <= to_date, criterion))
+                .group_by(date_week).order_by(date_week))]
+
+        new_customers = cohort_series(cohort == ordered)
+        return_customers = cohort_series(and_(cohort >= first_period, cohort < ordered))
+        old_customers = cohort_series(cohort < first_period)
+
+        total_due = db.session.query(func.coalesce(func.sum(self.model.amount_due), 0.0)) \
+            .filter(self.model.organisation_id == brand_id).scalar()
+
+        orders = Order.query.join(self.model, and_(self.model.id == Order.customer_id)) \
+            .filter(self.model.organisation_id == brand_id, Order.created_on.between(from_date, to_date),
+                    Order.store_id.in_(shops), Order.is_void.isnot(True))
+
+        top_customers = orders.with_entities(func.Count(Order.id), self.model.name) \
+            .group_by(Order.customer_id, self.model.name).order_by(-func.Count(Order.id)).limit(10).all()
+
+        top_billed_customers = orders.with_entities(func.Sum(Order.total), self.model.name) \
+            .group_by(Order.customer_id, self.model.name).order_by(-func.Sum(Order.total)).limit(10).all()
 
         return make_response(jsonify(dict(new_customers=new_customers, return_customers=return_customers,
                                           old_customers=old_customers, top_billed_customers=top_billed_customers,
@@ -6,10 +6,11 @@ from .factory import create_app
 from .models import db, ReprMixin, BaseMixin
 # from .push_notification import push_service
 from .resource import ModelResource, AssociationModelResource, DataResource
-from .schema import ma, BaseSchema
+from .schema import ma, BaseSchema, schema_cache
 from .serializer_helper import serializer_helper
 from .sentry import sentry
 from .redis import redis_store
+from .search_index import search_index
 from .sms import sms
 from .url_shortener import url_shortener
 from .limiter import limiter
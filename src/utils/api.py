@@ -9,7 +9,6 @@ from flask import request, jsonify, make_response
 from flask_security import roles_accepted, roles_required, current_user
 from flask_security.decorators import _security, _get_unauthorized_response, current_app, \
     _request_ctx_stack, identity_changed, Identity
-from flask_excel import make_response_from_records
 from sqlalchemy.exc import DataError
 
 from .models import db
@@ -18,6 +17,8 @@ from .resource import ModelResource, AssociationModelResource, DataResource
 from .exceptions import ResourceNotFound, SQLIntegrityError, SQlOperationalError, CustomException, \
     SQlInvalidRequestError, SQLDetachedInstanceError
 from .methods import BulkUpdate, List, Fetch, Create, Delete, Update
+from .idempotency import idempotent
+from .export import export_response
 
 ModelResourceType = TypeVar('ModelResourceType', bound=ModelResource)
 AssociationModelResource = TypeVar('AssociationModelResource', bound=AssociationModelResource)
@@ -49,6 +50,17 @@ def _check_token():
     return False
 
 
+def page_response(page, count, data):
+    response = {'success': True, 'data': data}
+    if count == 'none':
+        response['has_more'] = page.has_more
+    else:
+        response['total'] = page.total
+        if page.estimated:
+            response['estimated'] = True
+    return response
+
+
 def check_shop_access(fn):
     @wraps(fn)
     def decorated(*args, **kwargs):
@@ -126,48 +138,67 @@ class BaseView(Resource):
 
     def get(self, slug=None):
         if slug:
-            obj = self.resource.model.query.filter(self.resource.model.id == slug)
+            obj = self.resource.model.query.options(*self.resource.load_options())\
+                .filter(self.resource.model.id == slug)
             obj = self.resource.has_read_permission(obj).first()
             if obj:
-                return make_response(jsonify(self.resource.schema(exclude=tuple(self.resource.obj_exclude),
-                                                                  only=tuple(self.resource.obj_only)).dump(
-                    obj, many=False).data), 200)
+                return make_response(jsonify(self.resource.dump(obj, many=False)), 200)
 
             return make_response(jsonify({'error': True, 'message': 'Resource not found'}), 404)
 
         else:
-            objects = self.resource.apply_filters(queryset=self.resource.model.query, **request.args)
+            objects = self.resource.apply_filters(
+                queryset=self.resource.model.query.options(*self.resource.load_options()), **request.args)
             objects = self.resource.has_read_permission(objects)
 
+            if self.resource.cursor:
+                try:
+                    items, next_cursor = self.resource.paginate_cursor(objects, request.args.getlist('__order_by'))
+                except CustomException as e:
+                    e.message['error'] = True
+                    return make_response(jsonify(e.message), e.status)
+                except DataError as e:
+                    return make_response(jsonify(dict(message='invalid query params', operation='Query Resource',
+                                                      error=str(e))), 400)
+                if items:
+                    return make_response(jsonify({'success': True,
+                                                  'data': self.resource.dump(items, many=True),
+                                                  'next_cursor': next_cursor}), 200)
+                return make_response(jsonify({'error': True, 'message': 'No Resource Found'}), 404)
+
             if '__order_by' in request.args:
                 objects = self.resource.apply_ordering(objects, request.args.getlist('__order_by'))
 
             if '__export__' in request.args and self.resource.export is True:
-                objects = objects.paginate(page=self.resource.page, per_page=self.resource.max_export_limit)
-                return make_response_from_records(
-                    self.resource.schema(exclude=tuple(self.resource.obj_exclude), only=tuple(self.resource.obj_only))
-                        .dump(objects.items, many=True).data, 'csv', 200,  self.resource.model.__name__)
+                file_format = request.args.get('__export__') or 'csv'
+                limit = self.resource.max_export_limit
+                if limit and objects.enable_eagerloads(False).order_by(None).limit(limit + 1).count() > limit:
+                    # export_jobs adds its resources to the api of this module
+                    from .export_jobs import export_job_response
+                    return export_job_response(type(self.resource), file_format, limit)
+                return export_response(objects, self.resource.dump, self.resource.model.__name__, file_format,
+                                       current_app.config.get('EXPORT_CHUNK_SIZE', 1000), limit)
             try:
-                resources = objects.paginate(page=self.resource.page, per_page=self.resource.limit)
+                resources = self.resource.paginate(objects)
             except DataError as e:
                 return make_response(jsonify(dict(message='invalid query params', operation='Query Resource',
                                                   error=str(e))), 400)
             if resources.items:
-                return make_response(jsonify({'success': True,
-                                              'data': self.resource.schema(exclude=tuple(self.resource.obj_exclude),
-                                                                           only=tuple(self.resource.obj_only))
-                                             .dump(resources.items, many=True).data, 'total': resources.total}), 200)
+                return make_response(jsonify(page_response(resources, self.resource.count,
+                                                           self.resource.dump(resources.items, many=True))), 200)
             return make_response(jsonify({'error': True, 'message': 'No Resource Found'}), 404)
 
+    @idempotent
     def post(self):
         try:
             data, status = self.resource.save_resource()
-        except (SQLIntegrityError, SQlOperationalError, SQlInvalidRequestError) as e:
+        except (SQLIntegrityError, SQlOperationalError, SQlInvalidRequestError, CustomException) as e:
             db.session.rollback()
             e.message['error'] = True
             return make_response(jsonify(e.message), e.status)
         return make_response(jsonify(data), status)
 
+    @idempotent
     def put(self):
 
         try:
@@ -227,27 +258,25 @@ class AssociationView(Resource):
 
     def get(self, slug=None):
         if slug:
-            obj = self.resource.model.query.filter(self.resource.model.id == slug)
+            obj = self.resource.model.query.options(*self.resource.load_options())\
+                .filter(self.resource.model.id == slug)
             obj = self.resource.has_read_permission(obj).first()
             if obj:
-                return make_response(jsonify(self.resource.schema(exclude=tuple(self.resource.obj_exclude),
-                                                                  only=tuple(self.resource.obj_only)).dump(
-                    obj, many=False).data), 200)
+                return make_response(jsonify(self.resource.dump(obj, many=False)), 200)
 
             return make_response(jsonify({'error': True, 'message': 'Resource not found'}), 404)
 
         else:
-            objects = self.resource.apply_filters(queryset=self.resource.model.query, **request.args)
+            objects = self.resource.apply_filters(
+                queryset=self.resource.model.query.options(*self.resource.load_options()), **request.args)
             objects = self.resource.has_read_permission(objects)
 
             if '__order_by' in request.args:
                 objects = self.resource.apply_ordering(objects, request.args['__order_by'])
-            resources = objects.paginate(page=self.resource.page, per_page=self.resource.limit)
+            resources = self.resource.paginate(objects)
             if resources.items:
-                return make_response(jsonify({'success': True,
-                                              'data': self.resource.schema(exclude=tuple(self.resource.obj_exclude),
-                                                                           only=tuple(self.resource.obj_only))
-                                             .dump(resources.items, many=True).data, 'total': resources.total}), 200)
+                return make_response(jsonify(page_response(resources, self.resource.count,
+                                                           self.resource.dump(resources.items, many=True))), 200)
             return make_response(jsonify({'error': True, 'message': 'No Resource Found'}), 404)
 
     def post(self):
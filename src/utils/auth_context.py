@@ -0,0 +1,96 @@
+from typing import Callable, Dict, FrozenSet, Iterable, Tuple
+
+import simplejson
+from flask import current_app, g, has_app_context
+from redis.exceptions import RedisError
+
+from .redis import redis_store
+
+AUTH_VERSION_KEY = 'auth:{}:version'
+
+AUTH_SNAPSHOT_KEY = 'auth:{}:v{}'
+
+
+class AuthContext(object):
+    """Roles, permission names and store ids of a user, loaded once and checked in memory."""
+
+    __slots__ = ('roles', 'permissions', 'store_ids', 'store_id_set')
+
+    def __init__(self, roles: Iterable[str] = (), permissions: Iterable[str] = (), store_ids: Iterable = ()):
+        self.roles: FrozenSet[str] = frozenset(roles)
+        self.permissions: FrozenSet[str] = frozenset(permissions)
+        self.store_ids: Tuple = tuple(store_ids)
+        self.store_id_set: FrozenSet[str] = frozenset(str(store_id) for store_id in self.store_ids)
+
+    def has_role(self, role: str) -> bool:
+        return role in self.roles
+
+    def has_permission(self, permission: str) -> bool:
+        return permission in self.permissions
+
+    def has_store_access(self, store_id) -> bool:
+        return store_id is not None and str(store_id) in self.store_id_set
+
+    def to_dict(self) -> Dict:
+        return {'roles': sorted(self.roles), 'permissions': sorted(self.permissions), 'store_ids': self.store_ids}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'AuthContext':
+        return cls(roles=data['roles'], permissions=data['permissions'], store_ids=data['store_ids'])
+
+
+def get_auth_context(key, loader: Callable[[], AuthContext]) -> AuthContext:
+    """Returns the request scoped context stored under `key`, calling `loader` on first access."""
+    if not has_app_context():
+        return loader()
+    contexts = g.setdefault('_auth_contexts', {})
+    if key not in contexts:
+        contexts[key] = loader()
+    return contexts[key]
+
+
+def clear_auth_context(key=None) -> None:
+    if not has_app_context():
+        return
+    contexts = g.get('_auth_contexts', {})
+    if key is None:
+        contexts.clear()
+    else:
+        contexts.pop(key, None)
+
+
+def load_auth_snapshot(user_id, loader: Callable[[], AuthContext]) -> AuthContext:
+    """
+    Returns the snapshot of `user_id` stored in redis, falling back to `loader` on a miss.
+
+    The version is read before the database so a snapshot built from rows that changed
+    concurrently is written under a version nobody reads anymore.
+    """
+    try:
+        version = int(redis_store.get(AUTH_VERSION_KEY.format(user_id)) or 0)
+        snapshot = redis_store.get(AUTH_SNAPSHOT_KEY.format(user_id, version))
+    except RedisError:
+        return loader()
+    if snapshot:
+        return AuthContext.from_dict(simplejson.loads(snapshot))
+
+    context = loader()
+    try:
+        redis_store.setex(AUTH_SNAPSHOT_KEY.format(user_id, version),
+                          current_app.config.get('AUTH_SNAPSHOT_TTL', 3600), simplejson.dumps(context.to_dict()))
+    except RedisError:
+        pass
+    return context
+
+
+def invalidate_auth_snapshots(user_ids: Iterable) -> None:
+    user_ids = set(user_ids)
+    for user_id in user_ids:
+        clear_auth_context(('user', user_id))
+    try:
+        pipe = redis_store.pipeline()
+        for user_id in user_ids:
+            pipe.incr(AUTH_VERSION_KEY.format(user_id))
+        pipe.execute()
+    except RedisError:
+        pass
@@ -0,0 +1,45 @@
+from typing import Callable, Dict, Set
+
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+
+from .models import db
+from .sentry import sentry
+
+_handlers: Dict[str, Callable[[Set], None]] = {}
+
+_INFO_KEY = '_commit_hooks'
+
+
+def register_commit_handler(name: str, handler: Callable[[Set], None]) -> None:
+    """Registers `handler` to be called with the keys marked under `name` once the outer transaction commits."""
+    _handlers[name] = handler
+
+
+def mark(session, name: str, *keys) -> None:
+    if session is None:
+        return
+    session.info.setdefault(_INFO_KEY, {}).setdefault(name, set()).update(key for key in keys if key is not None)
+
+
+def mark_object(target, name: str, *keys) -> None:
+    mark(object_session(target), name, *keys)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _run_commit_handlers(session):
+    if session.transaction is not None and session.transaction.nested:
+        return
+    pending = session.info.pop(_INFO_KEY, {})
+    for name, keys in pending.items():
+        if keys and name in _handlers:
+            try:
+                _handlers[name](keys)
+            except Exception:
+                sentry.captureException()
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_marks(session, previous_transaction):
+    if previous_transaction._parent is None:
+        session.info.pop(_INFO_KEY, None)
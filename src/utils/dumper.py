@@ -0,0 +1,128 @@
+from collections.abc import Mapping
+
+from marshmallow import Schema, fields, missing
+from marshmallow.decorators import PRE_DUMP, POST_DUMP
+from marshmallow.exceptions import ValidationError
+from marshmallow.utils import is_iterable_but_not_string
+
+
+def _compilable(schema) -> bool:
+    processors = schema.__processors__
+    return not (schema.prefix or schema.extra or any(processors.get((tag, pass_many))
+                                                     for tag in (PRE_DUMP, POST_DUMP) for pass_many in (False, True)))
+
+
+class _NestedField(object):
+    """Dumps a `Nested` field through a compiled dumper of its schema once marshmallow has bound its fields."""
+
+    def __init__(self, field: fields.Nested):
+        self.field = field
+        self.bound = False
+        self.dumper = None
+
+    def serialize(self, name, obj, accessor):
+        field = self.field
+        value = field.get_value(name, obj, accessor=accessor)
+        if value is missing:
+            if hasattr(field, 'default'):
+                return field.default() if callable(field.default) else field.default
+        if value is None:
+            return None
+        if not self.bound:
+            # the first nested value updates the fields of the nested schema, leave that to marshmallow
+            self.bound = True
+            return field._serialize(value, name, obj)
+        if self.dumper is None:
+            self.dumper = compiled_dumper(field.schema)
+        if not self.dumper.compilable:
+            return field._serialize(value, name, obj)
+        return self.dumper.serialize(value, field.many)
+
+
+class CompiledDumper(object):
+    """
+    Serializes objects through a flat list of the dump fields of a schema instance.
+
+    The output matches `schema.dump(obj, many).data`. The first dump of every type of object, mappings, schemas
+    with dump processors, `extra` or `prefix` and any dump raising `ValidationError` go through marshmallow.
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.compilable = _compilable(schema)
+        self._fields = None
+        self._plan = []
+        self._types_seen = set()
+        self._default_accessor = type(schema).get_attribute is Schema.get_attribute
+
+    @property
+    def plan(self):
+        fields_dict = self.schema.fields
+        if fields_dict is not self._fields:
+            plan = []
+            for name, field in fields_dict.items():
+                if getattr(field, 'load_only', False):
+                    continue
+                nested = None
+                if isinstance(field, fields.Nested) and not isinstance(field.only, str):
+                    nested = _NestedField(field)
+                attribute = getattr(field, 'attribute', None)
+                attribute = name if attribute is None else attribute
+                # plain attribute lookups can skip the accessor for objects that aren't subscriptable
+                direct = (field._CHECK_ATTRIBUTE and self._default_accessor and isinstance(attribute, str)
+                          and '.' not in attribute)
+                plan.append((field.dump_to or name, name, field, nested, attribute if direct else None))
+            self._plan = plan
+            self._fields = fields_dict
+        return self._plan
+
+    @staticmethod
+    def _row(obj, plan, accessor, dict_class):
+        items = []
+        subscriptable = hasattr(obj, '__getitem__')
+        for key, name, field, nested, attribute in plan:
+            if nested is not None:
+                value = nested.serialize(name, obj, accessor)
+            elif attribute is None or subscriptable:
+                value = field.serialize(name, obj, accessor=accessor)
+            else:
+                value = getattr(obj, attribute, missing)
+                if value is missing and hasattr(field, 'default'):
+                    value = field.default() if callable(field.default) else field.default
+                else:
+                    value = field._serialize(value, name, obj)
+            if value is not missing:
+                items.append((key, value))
+        return dict_class(items)
+
+    def serialize(self, obj, many: bool):
+        if many and is_iterable_but_not_string(obj):
+            obj = list(obj)
+        plan, accessor, dict_class = self.plan, self.schema.get_attribute, self.schema.dict_class
+        if many and obj is not None:
+            return [self._row(item, plan, accessor, dict_class) for item in obj]
+        return self._row(obj, plan, accessor, dict_class)
+
+    def dump(self, obj, many: bool = None):
+        schema = self.schema
+        many = schema.many if many is None else bool(many)
+        if many and is_iterable_but_not_string(obj):
+            obj = list(obj)
+        if not self.compilable:
+            return schema.dump(obj, many=many).data
+        types = set(map(type, obj)) if many and isinstance(obj, list) else {type(obj)}
+        if not types <= self._types_seen or any(issubclass(kind, Mapping) for kind in types):
+            self._types_seen.update(types)
+            return schema.dump(obj, many=many).data
+        try:
+            return self.serialize(obj, many)
+        except ValidationError:
+            return schema.dump(obj, many=many).data
+
+
+def compiled_dumper(schema) -> CompiledDumper:
+    """Returns the dumper compiled for the schema instance, creating it on first use."""
+    dumper = schema.__dict__.get('_compiled_dumper')
+    if dumper is None:
+        dumper = schema._compiled_dumper = CompiledDumper(schema)
+    return dumper
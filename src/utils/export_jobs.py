@@ -0,0 +1,193 @@
+"""
+Export jobs: `__export__` requests generated by a celery worker instead of the web worker.
+
+A job is identified by a hash of the user, the resource, the format and the query arguments, so submitting the
+same export again returns the job already running or finished. Its state lives in redis under `export:<job id>`
+for `EXPORT_JOB_TTL` seconds; the worker writes the file to `EXPORT_DIR` and reports progress as it goes, a running
+job without progress for `EXPORT_JOB_STALE_AFTER` seconds is submitted again.
+`__export__` requests for more than `max_export_limit` rows of a registered resource are answered with a job.
+"""
+import hashlib
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+import simplejson
+from flask import current_app, jsonify, make_response, request, send_file, url_for
+from flask_restful import Resource
+from flask_security import current_user, roles_accepted, roles_required
+from redis.exceptions import RedisError
+
+from .api import api, auth_token_required, check_shop_access
+from .blue_prints import bp
+from .celery import celery
+from .redis import redis_store
+
+EXPORT_KEY = 'export:{}'
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+EXTENSIONS = {'csv': 'csv.gz', 'xlsx': 'xlsx'}
+
+exportable = {}
+
+
+def register_export(name: str, resource) -> None:
+    """Makes the rows of `resource` available to export jobs as `name`."""
+    exportable[name] = resource
+
+
+def export_name(resource) -> Optional[str]:
+    """Name `resource` is registered under, None when it can't be exported by jobs."""
+    for name, registered in exportable.items():
+        if registered is resource:
+            return name
+    return None
+
+
+def job_id(user_id, name: str, file_format: str, args: Dict) -> str:
+    # values keep their order, which matters for `__order_by`
+    filters = sorted((key, values if isinstance(values, list) else [values]) for key, values in args.items())
+    payload = simplejson.dumps([user_id, name, file_format, filters])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def job_path(job: str, file_format: str) -> str:
+    return os.path.join(current_app.config['EXPORT_DIR'], '{}.{}'.format(job, EXTENSIONS[file_format]))
+
+
+def get_job(job: str) -> Optional[Dict]:
+    state = redis_store.get(EXPORT_KEY.format(job))
+    return simplejson.loads(state) if state else None
+
+
+def set_job(job: str, state: Dict, nx: bool = False) -> bool:
+    state['updated'] = time.time()
+    return bool(redis_store.set(EXPORT_KEY.format(job), simplejson.dumps(state), nx=nx,
+                                ex=current_app.config.get('EXPORT_JOB_TTL', 86400)))
+
+
+def update_job(job: str, **values) -> Dict:
+    """Progress of the worker, which doubles as its heartbeat."""
+    state = get_job(job) or {}
+    state.update(values, heartbeat=time.time())
+    set_job(job, state)
+    return state
+
+
+def _reusable(job: str, state: Optional[Dict]) -> bool:
+    """
+    Whether a submitted job can answer a new identical request: it finished, waits for a worker however long the
+    queue is, or runs on a worker that reported progress recently.
+    """
+    if not state or state['status'] == FAILED:
+        return False
+    if state['status'] == DONE:
+        return os.path.exists(job_path(job, state['format']))
+    if state['status'] == QUEUED:
+        return True
+    return time.time() - state.get('heartbeat', 0) < current_app.config.get('EXPORT_JOB_STALE_AFTER', 600)
+
+
+def _error(message: str, status: int):
+    return make_response(jsonify({'error': True, 'message': message}), status)
+
+
+def _public(job: str, state: Dict) -> Dict:
+    data = {key: state.get(key) for key in ('resource', 'format', 'status', 'rows', 'total', 'error')}
+    data['id'] = job
+    if state.get('status') == DONE:
+        data['download'] = url_for('{}.export_download'.format(bp.name), job=job)
+    return data
+
+
+def submit_job(name: str, file_format: str, args: Dict) -> Tuple[Dict, int]:
+    """Queues the export for the current user unless an identical one can be reused, with the status to answer."""
+    job = job_id(current_user.id, name, file_format, args)
+    state = dict(user_id=current_user.id, resource=name, format=file_format, status=QUEUED, rows=0, total=None)
+    if not set_job(job, state, nx=True):
+        existing = get_job(job)
+        if _reusable(job, existing):
+            return _public(job, existing), 200
+        set_job(job, state)
+    celery.send_task('src.tasks.export_tasks.export_job', args=(job, name, current_user.id, args, file_format))
+    return _public(job, state), 202
+
+
+def _submit_error() -> Optional[str]:
+    """Why the current user can't submit export jobs, which belong to a user account."""
+    if getattr(current_user, 'id', None) is None:
+        return 'Exports need a user account'
+    return None
+
+
+def export_job_response(resource, file_format: str, limit: int):
+    """Answers an `__export__` request over `limit` rows with an export job of the same rows."""
+    name = export_name(resource)
+    if name is None or _submit_error():
+        return _error('Exports are limited to {} rows'.format(limit), 413)
+    args = {key: request.args.getlist(key) for key in request.args if key != '__export__'}
+    try:
+        data, status = submit_job(name, file_format if file_format in EXTENSIONS else 'csv', args)
+    except RedisError:
+        return _error('Export jobs are unavailable, export at most {} rows'.format(limit), 503)
+    return make_response(jsonify({'success': True, 'message': 'Exports over {} rows run as jobs'.format(limit),
+                                  'data': data}), status)
+
+
+class ExportJobResource(Resource):
+    method_decorators = [check_shop_access, auth_token_required]
+
+    def post(self):
+        error = _submit_error()
+        if error:
+            return _error(error, 403)
+        payload = request.json or {}
+        name, file_format = payload.get('resource'), payload.get('format') or 'csv'
+        args = payload.get('filters') or {}
+        if name not in exportable:
+            return _error('Unknown resource {}'.format(name), 400)
+        if file_format not in EXTENSIONS or not isinstance(args, dict):
+            return _error('Invalid export request', 400)
+        # the role checks of the views of the resource
+        resource = exportable[name]
+        submit = roles_accepted(*resource.roles_accepted)(roles_required(*resource.roles_required)(self._submit))
+        return submit(name, file_format, args)
+
+    @staticmethod
+    def _submit(name: str, file_format: str, args: Dict):
+        try:
+            data, status = submit_job(name, file_format, args)
+        except RedisError:
+            return _error('Export jobs are unavailable', 503)
+        return make_response(jsonify({'success': True, 'data': data}), status)
+
+    def get(self, job=None):
+        try:
+            state = get_job(job) if job else None
+        except RedisError:
+            return _error('Export jobs are unavailable', 503)
+        if not state or state['user_id'] != current_user.id:
+            return _error('Export not found', 404)
+        return make_response(jsonify({'success': True, 'data': _public(job, state)}), 200)
+
+
+class ExportDownloadResource(Resource):
+    method_decorators = [check_shop_access, auth_token_required]
+
+    def get(self, job):
+        try:
+            state = get_job(job)
+        except RedisError:
+            return _error('Export jobs are unavailable', 503)
+        if not state or state['user_id'] != current_user.id:
+            return _error('Export not found', 404)
+        path = job_path(job, state['format'])
+        if state['status'] != DONE or not os.path.exists(path):
+            return _error('Export is {}'.format(state['status']), 409)
+        return send_file(path, as_attachment=True, attachment_filename='{}.{}'.format(
+            exportable[state['resource']].model.__name__, EXTENSIONS[state['format']]))
+
+
+api.add_resource(ExportJobResource, '/export_jobs/', '/export_jobs/<string:job>/', endpoint='export_jobs')
+api.add_resource(ExportDownloadResource, '/export_jobs/<string:job>/download/', endpoint='export_download')
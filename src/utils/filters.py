@@ -0,0 +1,82 @@
+from typing import Dict, List, Type
+
+from sqlalchemy import and_
+from sqlalchemy.orm.attributes import InstrumentedAttribute
+
+from .operators import Operators
+
+
+def _combinable(operator: Type[Operators]) -> bool:
+    return operator.apply.__func__ is Operators.apply.__func__
+
+
+class FilterPlan(object):
+    """
+    Lookup table from query-arg name (`__<field>__<op>`) to the operator applying it.
+
+    Built once per resource class; model attributes are resolved on first use and reused afterwards,
+    since mappers may not be configured at import time. Hybrid expressions are built again on every
+    use, they may depend on the moment they are built, like the date of today.
+    Plain operator clauses are combined into a single `filter()` call so the query is cloned once.
+    """
+
+    def __init__(self, model, filters: Dict[str, List[Type[Operators]]], external_filter: Dict = None):
+        self.model = model
+        self.entries = {}
+        self._columns = {}
+        self._joins = {}
+
+        for field, operators in (external_filter or {}).items():
+            for operator in operators['filters']:
+                self.entries['__{}__{}'.format(field, operator.op)] = (field, operator, operators, _combinable(operator))
+
+        for field, operators in filters.items():
+            for operator in operators:
+                self.entries['__{}__{}'.format(field, operator.op)] = (field, operator, None, _combinable(operator))
+
+    def column(self, model, field):
+        key = (model, field)
+        column = self._columns.get(key)
+        if column is None:
+            column = getattr(model, field)
+            if isinstance(column, InstrumentedAttribute):
+                self._columns[key] = column
+        return column
+
+    def join_condition(self, field, external):
+        if field not in self._joins:
+            self._joins[field] = and_(getattr(external['model'], external['join']) == self.model.id)
+        return self._joins[field]
+
+    def apply(self, queryset, args: Dict):
+        clauses = []
+        for key, value in args.items():
+            entry = self.entries.get(key)
+            if entry is None:
+                continue
+            field, operator, external, combinable = entry
+            model = self.model
+            if external is not None:
+                model = external['model']
+                queryset = queryset.join(model, self.join_condition(field, external))
+            if combinable:
+                clauses.append(operator.clause(self.column(model, field), value))
+            else:
+                queryset = operator.apply(queryset, self.column(model, field), value)
+        if clauses:
+            queryset = queryset.filter(*clauses)
+        return queryset
+
+    def orders(self, args: Dict) -> bool:
+        """Whether one of the filters of `args` orders the query itself, like a ranked search."""
+        return any(self.entries[key][1].orders(value) for key, value in args.items() if key in self.entries)
+
+
+class FilterPlanMixin(object):
+    """Compiles the `filters` and `external_filter` of every resource class into a `FilterPlan`."""
+
+    filter_plan: FilterPlan = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.filter_plan = FilterPlan(cls.model, cls.filters, getattr(cls, 'external_filter', None))
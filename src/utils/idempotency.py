@@ -0,0 +1,79 @@
+import hashlib
+from functools import wraps
+
+import simplejson
+from flask import current_app, jsonify, make_response, request
+from flask_security import current_user
+from redis.exceptions import RedisError
+
+from .redis import redis_store
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+IDEMPOTENCY_KEY = 'idempotency:{}:{}:{}:{}'
+
+PENDING = 'pending'
+
+
+def _cache_key(key: str) -> str:
+    user_id = getattr(current_user, 'id', None)
+    return IDEMPOTENCY_KEY.format(user_id, request.method, request.path, key)
+
+
+def _fingerprint() -> str:
+    return hashlib.sha256(request.get_data()).hexdigest()
+
+
+def _replay(cached: dict):
+    response = make_response(cached['body'], cached['status'])
+    response.mimetype = cached['mimetype']
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(func):
+    """
+    Answers requests repeating an `Idempotency-Key` header with the stored response of the first one.
+
+    The response is kept in redis for `IDEMPOTENCY_TTL` seconds together with a hash of the request body; a key
+    reused with another body is rejected, as is a retry arriving while the first request is still running.
+    Server errors aren't stored so the request can be retried. Without redis requests run as usual.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return func(*args, **kwargs)
+
+        cache_key, fingerprint = _cache_key(key), _fingerprint()
+        try:
+            if not redis_store.set(cache_key, PENDING, nx=True,
+                                   ex=current_app.config.get('IDEMPOTENCY_LOCK_TIMEOUT', 60)):
+                cached = redis_store.get(cache_key)
+                if cached is None or cached.decode('utf-8') == PENDING:
+                    return make_response(jsonify({'error': True, 'message': 'A request with this {} is in progress'
+                                                 .format(IDEMPOTENCY_HEADER)}), 409)
+                cached = simplejson.loads(cached)
+                if cached['fingerprint'] != fingerprint:
+                    return make_response(jsonify({'error': True, 'message': '{} was used for another request'
+                                                 .format(IDEMPOTENCY_HEADER)}), 422)
+                return _replay(cached)
+        except RedisError:
+            return func(*args, **kwargs)
+
+        response = None
+        try:
+            response = func(*args, **kwargs)
+        finally:
+            try:
+                if response is None or response.status_code >= 500:
+                    redis_store.delete(cache_key)
+                else:
+                    redis_store.setex(cache_key, current_app.config.get('IDEMPOTENCY_TTL', 86400), simplejson.dumps(
+                        dict(fingerprint=fingerprint, status=response.status_code, mimetype=response.mimetype,
+                             body=response.get_data(as_text=True))))
+            except RedisError:
+                pass
+        return response
+
+    return wrapper
@@ -0,0 +1,59 @@
+from typing import List
+
+from marshmallow import fields
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload, lazyload, selectinload
+
+EAGER_STRATEGIES = ('joined', 'subquery', 'selectin', 'immediate', False)
+
+UNLOADABLE_STRATEGIES = ('dynamic', 'noload', None)
+
+MAX_DEPTH = 3
+
+
+def _dumped_fields(schema):
+    # `Related` fields generated by ModelSchema dump the keys of their objects, they load them like `Nested`
+    dumped = {}
+    for name, field in schema.fields.items():
+        if not getattr(field, 'load_only', False):
+            dumped[name if field.attribute is None else field.attribute] = field
+    return dumped
+
+
+def _chain(parent, loader, attribute):
+    return loader(attribute) if parent is None else getattr(parent, loader.__name__)(attribute)
+
+
+def plan_loader_options(model, schema, depth: int = MAX_DEPTH, parent=None) -> List:
+    """
+    Loader options for the relationships of `model` dumped by `schema`.
+
+    Dumped collections are fetched with `selectinload` and scalar relationships with `joinedload`, whether a
+    nested schema or a `Related` field dumps them, following the nested schemas up to `depth` levels.
+    Relationships eager by default but not dumped are switched to `lazyload` rather than `noload` so code
+    reading them still gets the rows.
+    """
+    dumped = _dumped_fields(schema)
+    options = []
+    for relationship in inspect(model).relationships:
+        attribute = getattr(model, relationship.key)
+        field = dumped.get(relationship.key)
+        if field is None:
+            if relationship.lazy in EAGER_STRATEGIES:
+                options.append(_chain(parent, lazyload, attribute))
+            continue
+        if relationship.lazy in UNLOADABLE_STRATEGIES:
+            continue
+        option = _chain(parent, selectinload if relationship.uselist else joinedload, attribute)
+        options.append(option)
+        if depth > 1 and isinstance(field, fields.Nested) and not isinstance(field.only, str):
+            options.extend(plan_loader_options(relationship.mapper.class_, field.schema, depth - 1, option))
+    return options
+
+
+def loader_options(model, schema) -> List:
+    """Returns the loader options planned for the schema instance, planning them on first use."""
+    options = schema.__dict__.get('_loader_options')
+    if options is None:
+        options = schema._loader_options = plan_loader_options(model, schema)
+    return options
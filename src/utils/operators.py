@@ -1,6 +1,9 @@
+import re
 from abc import ABC, abstractstaticmethod
 from datetime import datetime
-from sqlalchemy import func, cast, Date
+from sqlalchemy import func, cast, Date, literal_column
+
+DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
 
 
 class Operators(ABC):
@@ -8,182 +11,220 @@ class Operators(ABC):
 
     @staticmethod
     @abstractstaticmethod
-    def prepare_queryset(query, model, key, value):
-        return query.filter(getattr(model, key) == value)
+    def clause(column, value):
+        return column == value
+
+    @classmethod
+    def apply(cls, query, column, value):
+        return query.filter(cls.clause(column, value))
+
+    @classmethod
+    def orders(cls, value) -> bool:
+        """Whether `apply` orders the query by an expression keyset pagination can't resume from."""
+        return False
+
+    @classmethod
+    def prepare_queryset(cls, query, model, key, value):
+        return cls.apply(query, getattr(model, key), value)
 
 
 class In(Operators):
     op = 'in'
 
     @staticmethod
-    def prepare_queryset(query, model, key, values):
+    def clause(column, values):
         if len(values) == 1:
             values = values[0].split(',')
-        return query.filter(getattr(model, key).in_(values))
+        return column.in_(values)
 
 
 class NotIn(Operators):
     op = 'not_in'
 
     @staticmethod
-    def prepare_queryset(query, model, key, values):
+    def clause(column, values):
         if len(values) == 1:
             values = values[0].split(',')
-        return query.filter(~getattr(model, key).in_(values))
+        return ~column.in_(values)
 
 
 class Equal(Operators):
     op = 'equal'
 
     @staticmethod
-    def prepare_queryset(query, model, key, value):
-        return query.filter(getattr(model, key) == value[0])
+    def clause(column, value):
+        return column == value[0]
 
 
 class NotEqual(Operators):
     op = 'ne'
 
     @staticmethod
-    def prepare_queryset(query, model, key, value):
-        return query.filter(getattr(model, key) != value[0])
+    def clause(column, value):
+        return column != value[0]
 
 
 class Contains(Operators):
     op = 'contains'
 
     @staticmethod
-    def prepare_queryset(query, model, key, value):
-        return query.filter(func.lower(getattr(model, key)).contains(value[0].lower()))
+    def clause(column, value):
+        return func.lower(column).contains(value[0].lower())
 
 
 class StartsWith(Operators):
     op = 'starts_with'
 
     @staticmethod
-    def prepare_queryset(query, model, key, value):
-        return query.filter(func.lower(getattr(model, key)).startswith(value[0].lower()))
+    def clause(column, value):
+        return func.lower(column).startswith(value[0].lower())
+
+
+class Search(Operators):
+    """
+    Ranked full text search of a tsvector column: every word of the value has to prefix a word of the document,
+    best matches first.
+    """
+    op = 'search'
+
+    config = literal_column("'simple'")
+
+    @staticmethod
+    def query(value):
+        words = re.findall(r'[^\W_]+', ' '.join(value).lower())
+        return func.to_tsquery(Search.config, ' & '.join(word + ':*' for word in words))
+
+    @staticmethod
+    def clause(column, value):
+        return column.op('@@')(Search.query(value))
+
+    @classmethod
+    def orders(cls, value):
+        return any(re.search(r'[^\W_]', part) for part in value)
+
+    @classmethod
+    def apply(cls, query, column, value):
+        if not cls.orders(value):
+            return query
+        return query.filter(cls.clause(column, value)).order_by(func.ts_rank(column, cls.query(value)).desc())
 
 
 class Boolean(Operators):
     op = 'bool'
 
     @staticmethod
-    def prepare_queryset(query, model, key, value):
+    def clause(column, value):
         val = False if value[0] == 'false' else True
-        return query.filter(getattr(model, key) == val)
+        return column == val
 
 
 class Between(Operators):
     op = 'between'
 
     @staticmethod
-    def prepare_queryset(query, model, key, value):
+    def clause(column, value):
         val1 = value[0]
         val2 = value[1]
-        return query.filter(getattr(model, key).between(val1, val2))
+        return column.between(val1, val2)
 
 
 class Greater(Operators):
     op = 'gt'
 
     @staticmethod
-    def prepare_queryset(query, model, key, value):
-        return query.filter(getattr(model, key) > value[0])
+    def clause(column, value):
+        return column > value[0]
 
 
 class Lesser(Operators):
     op = 'lt'
 
     @staticmethod
-    def prepare_queryset(query, model, key, value):
-        return query.filter(getattr(model, key) < value[0])
+    def clause(column, value):
+        return column < value[0]
 
 
 class Greaterequal(Operators):
     op = 'gte'
 
     @staticmethod
-    def prepare_queryset(query, model, key, value):
-        return query.filter(getattr(model, key) >= value[0])
+    def clause(column, value):
+        return column >= value[0]
 
 
 class LesserEqual(Operators):
     op = 'lte'
 
     @staticmethod
-    def prepare_queryset(query, model, key, value):
-        return query.filter(getattr(model, key) <= value[0])
+    def clause(column, value):
+        return column <= value[0]
 
 
 class DateEqual(Operators):
     op = 'date_equal'
 
     @staticmethod
-    def prepare_queryset(query, model, key, value):
-        return query.filter(getattr(model, key) == datetime.strptime(value[0], '%Y-%m-%dT%H:%M:%S.%fZ').date())
+    def clause(column, value):
+        return column == datetime.strptime(value[0], DATETIME_FORMAT).date()
 
 
 class DateGreaterEqual(Operators):
     op = 'date_gte'
 
     @staticmethod
-    def prepare_queryset(query, model, key, value):
-        return query.filter(
-            cast(getattr(model, key), Date) >= datetime.strptime(value[0], '%Y-%m-%dT%H:%M:%S.%fZ').date())
+    def clause(column, value):
+        return cast(column, Date) >= datetime.strptime(value[0], DATETIME_FORMAT).date()
 
 
 class DateLesserEqual(Operators):
     op = 'date_lte'
 
     @staticmethod
-    def prepare_queryset(query, model, key, value):
-        return query.filter(
-            cast(getattr(model, key), Date) <= datetime.strptime(value[0], '%Y-%m-%dT%H:%M:%S.%fZ').date())
+    def clause(column, value):
+        return cast(column, Date) <= datetime.strptime(value[0], DATETIME_FORMAT).date()
 
 
 class DateBetween(Operators):
     op = 'date_btw'
 
     @staticmethod
-    def prepare_queryset(query, model, key, values):
+    def clause(column, values):
         if len(values) == 1:
             values = values[0].split(',')
-        return query.filter(getattr(model, key)
-                            .between(datetime.strptime(values[0], '%Y-%m-%dT%H:%M:%S.%fZ').date(),
-                                     datetime.strptime(values[1], '%Y-%m-%dT%H:%M:%S.%fZ').date()))
+        return column.between(datetime.strptime(values[0], DATETIME_FORMAT).date(),
+                              datetime.strptime(values[1], DATETIME_FORMAT).date())
 
 
 class DateTimeEqual(Operators):
     op = 'datetime_equal'
 
     @staticmethod
-    def prepare_queryset(query, model, key, value):
-        return query.filter(getattr(model, key) == datetime.strptime(value[0], '%Y-%m-%dT%H:%M:%S.%fZ'))
+    def clause(column, value):
+        return column == datetime.strptime(value[0], DATETIME_FORMAT)
 
 
 class DateTimeGreaterEqual(Operators):
     op = 'datetime_gte'
 
     @staticmethod
-    def prepare_queryset(query, model, key, value):
-        return query.filter(getattr(model, key) >= datetime.strptime(value[0], '%Y-%m-%dT%H:%M:%S.%fZ'))
+    def clause(column, value):
+        return column >= datetime.strptime(value[0], DATETIME_FORMAT)
 
 
 class DateTimeLesserEqual(Operators):
     op = 'datetime_lte'
 
     @staticmethod
-    def prepare_queryset(query, model, key, value):
-        return query.filter(getattr(model, key) <= datetime.strptime(value[0], '%Y-%m-%dT%H:%M:%S.%fZ'))
+    def clause(column, value):
+        return column <= datetime.strptime(value[0], DATETIME_FORMAT)
 
 
 class DateTimeBetween(Operators):
     op = 'datetime_btw'
 
     @staticmethod
-    def prepare_queryset(query, model, key, values):
+    def clause(column, values):
         if len(values) == 1:
             values = values[0].split(',')
-        return query.filter(getattr(model, key)
-                            .between(datetime.strptime(values[0], '%Y-%m-%dT%H:%M:%S.%fZ'),
-                                     datetime.strptime(values[1], '%Y-%m-%dT%H:%M:%S.%fZ')))
+        return column.between(datetime.strptime(values[0], DATETIME_FORMAT),
+                              datetime.strptime(values[1], DATETIME_FORMAT))
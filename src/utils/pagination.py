@@ -0,0 +1,139 @@
+import base64
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, List, Tuple
+
+import simplejson
+from dateutil import parser
+from sqlalchemy import and_, or_, false
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from .exceptions import CustomException
+from .models import db
+
+COUNT_MODES = ('none', 'estimate', 'exact')
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'n': str(value)}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return parser.parse(value['dt'])
+        if 'd' in value:
+            return datetime.strptime(value['d'], '%Y-%m-%d').date()
+        if 'n' in value:
+            return Decimal(value['n'])
+    return value
+
+
+def encode_cursor(keys: List[str], values: List[Any]) -> str:
+    payload = simplejson.dumps({'k': keys, 'v': [_encode_value(value) for value in values]})
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str, keys: List[str]) -> List[Any]:
+    try:
+        payload = simplejson.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        values = [_decode_value(value) for value in payload['v']]
+    except (ValueError, TypeError, KeyError, UnicodeError):
+        raise CustomException(data={'__after': cursor}, message='Invalid cursor', operation='Query Resource')
+    if payload['k'] != keys or len(values) != len(keys):
+        raise CustomException(data={'__after': cursor}, message='Cursor does not match ordering',
+                              operation='Query Resource')
+    return values
+
+
+def _after(column, desc, value):
+    # postgres sorts NULLs last in ascending and first in descending order
+    if desc:
+        return column.isnot(None) if value is None else column < value
+    return None if value is None else or_(column > value, column.is_(None))
+
+
+def _equal(column, value):
+    return column.is_(None) if value is None else column == value
+
+
+def keyset_criterion(columns: List[Tuple[Any, bool]], values: List[Any]):
+    """
+    Builds the criterion selecting rows that sort strictly after `values`.
+
+    `columns` is the ordering as (expression, descending) pairs and must end with a unique key.
+    """
+    clauses = []
+    for index, ((column, desc), value) in enumerate(zip(columns, values)):
+        after = _after(column, desc, value)
+        if after is None:
+            continue
+        equal = [_equal(prev_column, prev_value) for (prev_column, _), prev_value
+                 in zip(columns[:index], values[:index])]
+        clauses.append(and_(*equal, after))
+    return or_(*clauses) if clauses else false()
+
+
+class Explain(Executable, ClauseElement):
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, 'postgresql')
+def _compile_explain(element, compiler, **kwargs):
+    return 'EXPLAIN (FORMAT JSON) ' + compiler.process(element.statement, **kwargs)
+
+
+def can_estimate() -> bool:
+    return db.session.connection().dialect.name == 'postgresql'
+
+
+def estimate_count(query) -> int:
+    """Row estimate of the planner for `query`, exact count on databases other than postgres."""
+    query = query.order_by(None).enable_eagerloads(False)
+    if not can_estimate():
+        return query.count()
+    plan = db.session.execute(Explain(query.statement)).scalar()
+    if isinstance(plan, str):
+        plan = simplejson.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class Page(object):
+    __slots__ = ('items', 'total', 'has_more', 'estimated')
+
+    def __init__(self, items, total=None, has_more=False, estimated=False):
+        self.items = items
+        self.total = total
+        self.has_more = has_more
+        # total is a planner estimate rather than a count
+        self.estimated = estimated
+
+
+def paginate(query, page: int, per_page: int, count: str = 'exact') -> Page:
+    """Offset pagination where the total is exact, a planner estimate or skipped according to `count`."""
+    page = max(page, 1)
+    if count == 'none':
+        items = query.limit(per_page + 1).offset((page - 1) * per_page).all()
+        return Page(items[:per_page], has_more=len(items) > per_page)
+
+    items = query.limit(per_page).offset((page - 1) * per_page).all()
+    seen = (page - 1) * per_page + len(items)
+    estimated = False
+    if len(items) < per_page and (items or page == 1):
+        total = seen
+    elif count == 'estimate':
+        estimated = can_estimate()
+        # the estimate may fall short of the rows already served
+        total = max(estimate_count(query), seen)
+    else:
+        total = query.order_by(None).count()
+    return Page(items, total=total, has_more=page * per_page < total, estimated=estimated)
@@ -5,17 +5,21 @@ from typing import Type, List, Tuple, Dict
 from dateutil.relativedelta import relativedelta
 from flask import request
 from flask_security import current_user
-from sqlalchemy import and_
 from sqlalchemy.exc import OperationalError, IntegrityError, InvalidRequestError
 from sqlalchemy.orm.exc import DetachedInstanceError
 
+from .dumper import compiled_dumper
 from .exceptions import ResourceNotFound, SQLIntegrityError, SQlOperationalError, CustomException, RequestNotAllowed, \
     SQlInvalidRequestError, SQLDetachedInstanceError
+from .filters import FilterPlanMixin
+from .loading import loader_options
 from .models import db
+from .pagination import encode_cursor, decode_cursor, keyset_criterion, paginate, Page, COUNT_MODES
+from .schema import schema_cache
 from .sentry import sentry
 
 
-class ModelResource(ABC):
+class ModelResource(FilterPlanMixin, ABC):
     model = None
     schema = None
 
@@ -45,7 +49,12 @@ class ModelResource(ABC):
 
     export: bool = False
 
-    max_export_limit: int = 5000
+    # larger `__export__` requests run as export jobs, see src/utils/export_jobs.py
+    max_export_limit: int = 10000
+
+    count: str = 'exact'
+
+    serializer: str = 'marshmallow'
 
     roles_accepted: Tuple[str] = ()
 
@@ -90,43 +99,85 @@ class ModelResource(ABC):
                                                          and int(
             request.args.get('__limit')) <= self.max_limit else self.default_limit
 
+        self.cursor = '__cursor' in request.args or '__after' in request.args
+        self.after = request.args.get('__after')
+
+        if request.args.get('__count') in COUNT_MODES:
+            self.count = request.args.get('__count')
+
     def apply_filters(self, queryset, **kwargs):
-        for k, v in kwargs.items():
-            array_key = k.split('__')
-            if array_key[0] == '' and array_key[1] in self.filters.keys():
-                for operator in self.filters.get(array_key[1]):
-                    if operator.op == array_key[2]:
-                        queryset = operator().prepare_queryset(queryset, self.model, array_key[1], v)
-
-            elif array_key[0] == '' and array_key[1] in self.external_filter.keys():
-                query_filter = self.external_filter.get(array_key[1])
-                for operator in query_filter['filters']:
-                    if operator.op == array_key[2]:
-                        queryset = queryset.join(query_filter['model'],
-                                                 and_(getattr(query_filter['model'],
-                                                              query_filter['join']) == self.model.id))
-
-                        queryset = operator().prepare_queryset(queryset, query_filter['model'], array_key[1], v)
+        queryset = self.filter_plan.apply(queryset, kwargs)
 
         if '__distinct_by' in request.args:
             queryset = queryset.distinct(getattr(self.model, request.args['__distinct_by']))
         return queryset
 
-    def apply_ordering(self, queryset, order_by_list):
+    def ordering_keys(self, order_by_list) -> List[Tuple[str, bool]]:
         if len(order_by_list) == 1:
             order_by_list = order_by_list[0].split(',')
+        keys = []
         for order_by in order_by_list:
             desc = False
             if order_by.startswith('-'):
                 desc = True
                 order_by = order_by.replace('-', '')
             if order_by in self.order_by:
-                if desc:
-                    queryset = queryset.order_by(getattr(self.model, order_by).desc())
-                else:
-                    queryset = queryset.order_by(getattr(self.model, order_by))
+                keys.append((order_by, desc))
+        return keys
+
+    def apply_ordering(self, queryset, order_by_list):
+        for order_by, desc in self.ordering_keys(order_by_list):
+            if desc:
+                queryset = queryset.order_by(getattr(self.model, order_by).desc())
+            else:
+                queryset = queryset.order_by(getattr(self.model, order_by))
         return queryset
 
+    def paginate_cursor(self, queryset, order_by_list):
+        """
+        Keyset pagination over the whitelisted `order_by` keys with `id` as tie breaker.
+
+        Returns the page of objects and the opaque cursor of the next page, None on the last one. Filters ordering
+        the query themselves, like a ranked search, page by offset instead.
+        """
+        args = request.args.to_dict(flat=False)
+        if self.filter_plan.orders(args):
+            raise CustomException(data={key: args[key] for key in args if key in self.filter_plan.entries},
+                                  message='Ranked filters can not be paged by cursor, use __page',
+                                  operation='Query Resource')
+        keys = [key for key in self.ordering_keys(order_by_list) if key[0] != 'id']
+        keys.append(('id', keys[0][1] if keys else False))
+        columns = [(getattr(self.model, key), desc) for key, desc in keys]
+        names = [('-' if desc else '') + key for key, desc in keys]
+
+        if self.after:
+            queryset = queryset.filter(keyset_criterion(columns, decode_cursor(self.after, names)))
+
+        queryset = queryset.order_by(*[column.desc() if desc else column for column, desc in columns])\
+            .add_columns(*[column for column, _ in columns]).limit(self.limit + 1)
+
+        rows = queryset.all()
+        next_cursor = None
+        if len(rows) > self.limit:
+            rows = rows[:self.limit]
+            next_cursor = encode_cursor(names, list(rows[-1][1:]))
+        return [row[0] for row in rows], next_cursor
+
+    def paginate(self, queryset) -> Page:
+        return paginate(queryset, self.page, self.limit, self.count)
+
+    def dump_schema(self):
+        return schema_cache.get(self.schema, self.obj_only, self.obj_exclude)
+
+    def load_options(self) -> List:
+        return loader_options(self.model, self.dump_schema())
+
+    def dump(self, obj, many: bool = False):
+        schema = self.dump_schema()
+        if self.serializer == 'compiled':
+            return compiled_dumper(schema).dump(obj, many=many)
+        return schema.dump(obj, many=many).data
+
     def patch_resource(self, slug):
         obj = self.model.query.get(slug)
         if obj and self.has_change_permission(obj):
@@ -164,8 +215,7 @@ class ModelResource(ABC):
                                                status=500)
 
             return {'success': True, 'message': 'obj updated successfully',
-                    'data': self.schema(exclude=tuple(self.obj_exclude), only=tuple(self.obj_only))
-                        .dump(obj).data}, 200
+                    'data': self.dump_schema().dump(obj).data}, 200
 
         return {'error': True, 'message': 'Forbidden Permission Denied To Change Resource'}, 403
 
@@ -204,8 +254,7 @@ class ModelResource(ABC):
                                              status=400)
         self.after_objects_save(objects)
         return {'success': True, 'message': 'Resource Updated successfully',
-                'data': self.schema(exclude=tuple(self.obj_exclude), only=tuple(self.obj_only))
-                    .dump(objects, many=True).data}, 201
+                'data': self.dump_schema().dump(objects, many=True).data}, 201
 
     def save_resource(self):
         data = request.json if isinstance(request.json, list) else [request.json]
@@ -236,8 +285,7 @@ class ModelResource(ABC):
             raise SQlInvalidRequestError(data=data, message='Invalid Request Error', operation='Adding Resource',
                                          status=400)
         return {'success': True, 'message': 'Resource added successfully',
-                'data': self.schema(exclude=tuple(self.obj_exclude), only=tuple(self.obj_only))
-                    .dump(objects, many=True).data}, 201
+                'data': self.dump_schema().dump(objects, many=True).data}, 201
 
     @abstractmethod
     def has_read_permission(self, qs) -> Type(db.Model):
@@ -259,7 +307,7 @@ class ModelResource(ABC):
         pass
 
 
-class AssociationModelResource(ABC):
+class AssociationModelResource(FilterPlanMixin, ABC):
     model = None
 
     schema = None
@@ -284,6 +332,10 @@ class AssociationModelResource(ABC):
 
     page: int = 1
 
+    count: str = 'exact'
+
+    serializer: str = 'marshmallow'
+
     auth_required = False
 
     roles_accepted: Tuple[str] = ()
@@ -330,15 +382,26 @@ class AssociationModelResource(ABC):
                                                          and int(
             request.args.get('__limit')) <= self.max_limit else self.default_limit
 
+        if request.args.get('__count') in COUNT_MODES:
+            self.count = request.args.get('__count')
+
     def apply_filters(self, queryset, **kwargs):
-        for k, v in kwargs.items():
-            array_key = k.split('__')
-            if array_key[0] == '' and array_key[1] in self.filters.keys():
-                for operator in self.filters.get(array_key[1]):
-                    if operator.op == array_key[2]:
-                        queryset = operator().prepare_queryset(queryset, self.model, array_key[1], v)
+        return self.filter_plan.apply(queryset, kwargs)
 
-        return queryset
+    def paginate(self, queryset) -> Page:
+        return paginate(queryset, self.page, self.limit, self.count)
+
+    def dump_schema(self):
+        return schema_cache.get(self.schema, self.obj_only, self.obj_exclude)
+
+    def load_options(self) -> List:
+        return loader_options(self.model, self.dump_schema())
+
+    def dump(self, obj, many: bool = False):
+        schema = self.dump_schema()
+        if self.serializer == 'compiled':
+            return compiled_dumper(schema).dump(obj, many=many)
+        return schema.dump(obj, many=many).data
 
     def apply_ordering(self, queryset, order_by):
         desc = False
@@ -448,7 +511,7 @@ class AssociationModelResource(ABC):
         pass
 
 
-class DataResource(ABC):
+class DataResource(FilterPlanMixin, ABC):
     model = None
 
     filters = {}
@@ -467,7 +530,8 @@ class DataResource(ABC):
 
     export: bool = True
 
-    max_export_limit: int = 5000
+    # larger `__export__` requests run as export jobs, see src/utils/export_jobs.py
+    max_export_limit: int = 10000
 
     roles_required: Tuple[str] = ()
 
@@ -517,22 +581,7 @@ class DataResource(ABC):
             request.args.get('__limit')) <= self.max_limit else self.default_limit
 
     def apply_filters(self, queryset, **kwargs):
-        for k, v in kwargs.items():
-            array_key = k.split('__')
-            if array_key[0] == '' and array_key[1] in self.filters.keys():
-                for operator in self.filters.get(array_key[1]):
-                    if operator.op == array_key[2]:
-                        queryset = operator().prepare_queryset(queryset, self.model, array_key[1], v)
-
-            elif array_key[0] == '' and array_key[1] in self.external_filter.keys():
-                query_filter = self.external_filter.get(array_key[1])
-                for operator in query_filter['filters']:
-                    if operator.op == array_key[2]:
-                        queryset = queryset.join(query_filter['model'],
-                                                 and_(getattr(query_filter['model'],
-                                                              query_filter['join']) == self.model.id))
-
-                        queryset = operator().prepare_queryset(queryset, query_filter['model'], array_key[1], v)
+        queryset = self.filter_plan.apply(queryset, kwargs)
 
         if '__distinct_by' in request.args:
             queryset = queryset.distinct(getattr(self.model, request.args['__distinct_by']))
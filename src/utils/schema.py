@@ -1,7 +1,15 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Tuple
+
 from flask_marshmallow import Marshmallow
 import simplejson
 from marshmallow_sqlalchemy import ModelSchema, ModelSchemaOpts
+from redis.exceptions import RedisError
 from .models import db
+from .redis import redis_store
+
+METRICS_KEY = 'schema_cache:metrics'
 
 
 class FlaskMarshmallowFactory(Marshmallow):
@@ -23,3 +31,106 @@ class BaseOpts(ModelSchemaOpts):
 
 class BaseSchema(ModelSchema):
     OPTIONS_CLASS = BaseOpts
+
+
+class SchemaCache(object):
+    """
+    Bounded LRU of schema instances keyed by schema class and the normalized `only`/`exclude` selection.
+
+    Instances keep marshalling state while dumping, so every thread gets its own LRU; hit and miss
+    counters are shared under a lock and reported by `cache_info`. Every `report_every` lookups the
+    counts are added to `schema_cache:metrics` in redis, where `shared_info` sums them over all the
+    processes. Cached instances are only meant for dumping, loads should keep constructing a fresh schema.
+    """
+
+    def __init__(self, app=None, maxsize: int = 128, report_every: int = 1000):
+        self.maxsize = maxsize
+        self.report_every = report_every
+        self.hits = 0
+        self.misses = 0
+        self._reported = (0, 0)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app=None):
+        self.maxsize = app.config.get('SCHEMA_CACHE_SIZE', self.maxsize)
+        self.report_every = app.config.get('SCHEMA_CACHE_REPORT_EVERY', self.report_every)
+        self.clear()
+
+    @property
+    def _schemas(self) -> OrderedDict:
+        schemas = getattr(self._local, 'schemas', None)
+        if schemas is None:
+            schemas = self._local.schemas = OrderedDict()
+        return schemas
+
+    @staticmethod
+    def key(schema_class, only: Iterable[str] = (), exclude: Iterable[str] = ()) -> Tuple:
+        return schema_class, tuple(sorted(set(only or ()))), tuple(sorted(set(exclude or ())))
+
+    def get(self, schema_class, only: Iterable[str] = (), exclude: Iterable[str] = ()):
+        key = self.key(schema_class, only, exclude)
+        schemas = self._schemas
+        schema = schemas.get(key)
+        if schema is not None:
+            self._count(hit=True)
+            schemas.move_to_end(key)
+            return schema
+
+        self._count(hit=False)
+        schema = schema_class(only=key[1], exclude=key[2])
+        schemas[key] = schema
+        while len(schemas) > self.maxsize:
+            schemas.popitem(last=False)
+        return schema
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            if self.hits + self.misses - sum(self._reported) < self.report_every:
+                return
+        self.report()
+
+    def report(self) -> None:
+        """Adds the lookups counted since the last report to the counters of all the processes."""
+        with self._lock:
+            hits, misses = self.hits - self._reported[0], self.misses - self._reported[1]
+            self._reported = (self.hits, self.misses)
+        try:
+            if hits:
+                redis_store.hincrby(METRICS_KEY, 'hits', hits)
+            if misses:
+                redis_store.hincrby(METRICS_KEY, 'misses', misses)
+        except RedisError:
+            pass
+
+    def cache_info(self) -> Dict:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        return _info(hits, misses, maxsize=self.maxsize, currsize=len(self._schemas))
+
+    @staticmethod
+    def shared_info() -> Dict:
+        """Hits, misses and hit rate reported by all the processes."""
+        counts = {(field.decode('utf-8') if isinstance(field, bytes) else field): int(value)
+                  for field, value in redis_store.hgetall(METRICS_KEY).items()}
+        return _info(counts.get('hits', 0), counts.get('misses', 0))
+
+    def clear(self) -> None:
+        with self._lock:
+            self.hits = self.misses = 0
+            self._reported = (0, 0)
+        self._local = threading.local()
+
+
+def _info(hits: int, misses: int, **info) -> Dict:
+    total = hits + misses
+    return dict(info, hits=hits, misses=misses, hit_rate=round(hits / total, 4) if total else 0.0)
+
+
+schema_cache = SchemaCache()
@@ -0,0 +1,208 @@
+"""
+Search index of the catalog behind a pluggable backend.
+
+Documents are flat dicts with an `id`; the text of `FIELDS` is searchable, weighted as given, and every other
+scalar field can be filtered on. `ElasticsearchBackend` talks to the bulk and search APIs of the cluster at
+`ELASTIC_SEARCH_URL`; `MemoryBackend` keeps an inverted index in the process, which the web and celery workers
+don't share, so it is only used under `TESTING` or when `SEARCH_BACKEND` asks for it. `SEARCH_BACKEND` picks one,
+defaulting to elasticsearch when a URL is configured; without either search is disabled.
+"""
+import bisect
+import re
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+import requests
+import simplejson
+
+FIELDS = {'name': 4, 'therapeutic_name': 3, 'brand_name': 2, 'salt_names': 1, 'tag_names': 1}
+
+
+def tokens(text) -> List[str]:
+    if isinstance(text, (list, tuple)):
+        text = ' '.join(str(part) for part in text if part)
+    return re.findall(r'[^\W_]+', str(text or '').lower())
+
+
+class SearchBackend(ABC):
+
+    @abstractmethod
+    def upsert(self, documents: List[Dict]) -> None:
+        pass
+
+    @abstractmethod
+    def delete(self, ids: Iterable[int]) -> None:
+        pass
+
+    @abstractmethod
+    def search(self, text: str, filters: Dict = None, size: int = 20) -> List[int]:
+        """Ids of the documents matching every word of `text` as a prefix and `filters`, best first."""
+        pass
+
+    def clear(self) -> None:
+        pass
+
+
+class MemoryBackend(SearchBackend):
+
+    def __init__(self):
+        self.documents = {}
+        self.postings = defaultdict(dict)
+        self.terms = []
+
+    def _remove(self, doc_id) -> None:
+        document = self.documents.pop(doc_id, None)
+        if document is None:
+            return
+        for field in FIELDS:
+            for term in tokens(document.get(field)):
+                postings = self.postings.get(term)
+                if postings is not None and postings.pop(doc_id, None) is not None and not postings:
+                    del self.postings[term]
+                    del self.terms[bisect.bisect_left(self.terms, term)]
+
+    def upsert(self, documents: List[Dict]) -> None:
+        for document in documents:
+            self._remove(document['id'])
+            self.documents[document['id']] = document
+            for field, weight in FIELDS.items():
+                for term in tokens(document.get(field)):
+                    if term not in self.postings:
+                        bisect.insort(self.terms, term)
+                    postings = self.postings[term]
+                    postings[document['id']] = postings.get(document['id'], 0) + weight
+
+    def delete(self, ids: Iterable[int]) -> None:
+        for doc_id in ids:
+            self._remove(doc_id)
+
+    def _prefixed(self, word) -> Dict[int, int]:
+        scores = defaultdict(int)
+        position = bisect.bisect_left(self.terms, word)
+        while position < len(self.terms) and self.terms[position].startswith(word):
+            for doc_id, weight in self.postings[self.terms[position]].items():
+                # exact words count twice as much as prefixes
+                scores[doc_id] += weight * 2 if self.terms[position] == word else weight
+            position += 1
+        return scores
+
+    def search(self, text: str, filters: Dict = None, size: int = 20) -> List[int]:
+        scores = None
+        for word in tokens(text):
+            matches = self._prefixed(word)
+            if scores is None:
+                scores = matches
+            else:
+                scores = {doc_id: score + matches[doc_id] for doc_id, score in scores.items() if doc_id in matches}
+        hits = [(score, doc_id) for doc_id, score in (scores or {}).items()
+                if all(self.documents[doc_id].get(key) == value for key, value in (filters or {}).items())]
+        return [doc_id for _, doc_id in sorted(hits, key=lambda hit: (-hit[0], hit[1]))[:size]]
+
+    def clear(self) -> None:
+        self.__init__()
+
+
+class ElasticsearchBackend(SearchBackend):
+
+    headers = {'content-type': 'application/x-ndjson'}
+
+    def __init__(self, url: str, index: str, doc_type: str = '_doc', timeout: int = 10):
+        self.url = url.rstrip('/')
+        self.index = index
+        self.doc_type = doc_type
+        self.timeout = timeout
+
+    def _bulk(self, actions: List[Dict]) -> None:
+        body = ''.join(simplejson.dumps(action) + '\n' for action in actions)
+        response = requests.post('{}/_bulk'.format(self.url), data=body.encode('utf-8'), headers=self.headers,
+                                 timeout=self.timeout)
+        response.raise_for_status()
+        result = response.json()
+        if result.get('errors'):
+            failed = [item for item in result['items'] if 'error' in next(iter(item.values()))]
+            raise RuntimeError('{} bulk actions failed, first: {}'.format(len(failed), failed[:1]))
+
+    def _meta(self, action: str, doc_id) -> Dict:
+        meta = {'_index': self.index, '_id': doc_id}
+        if self.doc_type:
+            meta['_type'] = self.doc_type
+        return {action: meta}
+
+    def upsert(self, documents: List[Dict]) -> None:
+        actions = []
+        for document in documents:
+            actions.extend((self._meta('index', document['id']), document))
+        if actions:
+            self._bulk(actions)
+
+    def delete(self, ids: Iterable[int]) -> None:
+        actions = [self._meta('delete', doc_id) for doc_id in ids]
+        if actions:
+            self._bulk(actions)
+
+    def search(self, text: str, filters: Dict = None, size: int = 20) -> List[int]:
+        words = tokens(text)
+        if not words:
+            return []
+        match = {'query_string': {'query': ' '.join(word + '*' for word in words), 'default_operator': 'and',
+                                  'fields': ['{}^{}'.format(field, weight) for field, weight in FIELDS.items()]}}
+        terms = [{'term': {key: value}} for key, value in (filters or {}).items()]
+        query = {'bool': {'must': [match], 'filter': terms}}
+        response = requests.post('{}/{}/_search'.format(self.url, self.index), timeout=self.timeout,
+                                 json={'query': query, 'size': size, '_source': False})
+        response.raise_for_status()
+        return [int(hit['_id']) for hit in response.json()['hits']['hits']]
+
+    def clear(self) -> None:
+        requests.post('{}/{}/_delete_by_query'.format(self.url, self.index), json={'query': {'match_all': {}}},
+                      timeout=self.timeout).raise_for_status()
+
+
+def search_backend(config) -> Optional[str]:
+    """Name of the backend `config` asks for, None when search isn't configured."""
+    url = config.get('ELASTIC_SEARCH_URL')
+    backend = config.get('SEARCH_BACKEND') or ('elastic' if url else None)
+    if backend is None and config.get('TESTING'):
+        return 'memory'
+    if backend not in (None, 'elastic', 'memory'):
+        raise ValueError('Unknown SEARCH_BACKEND {}'.format(backend))
+    if backend == 'elastic' and not url:
+        raise ValueError('SEARCH_BACKEND elastic needs ELASTIC_SEARCH_URL')
+    return backend
+
+
+class SearchIndex(object):
+
+    _backend: SearchBackend = None
+    batch_size = 500
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app=None):
+        backend = search_backend(app.config)
+        if backend == 'elastic':
+            self._backend = ElasticsearchBackend(app.config['ELASTIC_SEARCH_URL'],
+                                                 app.config.get('SEARCH_INDEX', 'products'),
+                                                 app.config.get('SEARCH_DOC_TYPE', '_doc'))
+        elif backend == 'memory':
+            self._backend = MemoryBackend()
+        else:
+            self._backend = None
+            app.logger.error('No search backend configured, set ELASTIC_SEARCH_URL to search products')
+        self.batch_size = app.config.get('SEARCH_INDEX_BATCH_SIZE', 500)
+
+    @property
+    def enabled(self) -> bool:
+        return self._backend is not None
+
+    @property
+    def backend(self) -> SearchBackend:
+        if self._backend is None:
+            raise RuntimeError('No search backend configured, set ELASTIC_SEARCH_URL or SEARCH_BACKEND')
+        return self._backend
+
+
+search_index = SearchIndex()
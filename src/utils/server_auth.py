@@ -1,6 +1,7 @@
 from uuid import UUID
 from typing import List
 
+from .auth_context import AuthContext
 from .serializer_helper import serializer_helper
 
 
@@ -15,6 +16,7 @@ class ServerUser(object):
     permissions: List[str] = []
     shop_ids: List[str] = []
     brand_id: str = None
+    auth_context: AuthContext = AuthContext()
 
     def __init__(self, app=None, integration_model=None):
         if app and integration_model:
@@ -30,6 +32,7 @@ class ServerUser(object):
             .filter(self.integration_model.access_key == token.replace('Bearer ', '')).scalar()
         if secret_key:
             brand_id, shop_ids, permissions, roles = serializer_helper.deserialize_data(secret_key)
+            self.roles = []
             for role in roles:
                 user_role = UserRole()
                 user_role.name = role
@@ -37,6 +40,7 @@ class ServerUser(object):
             self.permissions = permissions
             self.shop_ids = shop_ids
             self.brand_id = brand_id
+            self.auth_context = AuthContext(roles=roles, permissions=permissions, store_ids=shop_ids)
 
             return self
         return None
@@ -56,14 +60,21 @@ class ServerUser(object):
         """Returns `True` if the user is active."""
         return bool(self.brand_id)
 
+    @property
+    def store_ids(self):
+        return list(self.auth_context.store_ids)
+
     def has_role(self, role: str) -> bool:
-        return role in self.roles
+        return self.auth_context.has_role(role if isinstance(role, str) else role.name)
 
     def has_shop_access(self, shop_id):
-        return str(shop_id) in self.shop_ids
+        return self.auth_context.has_store_access(shop_id)
+
+    def has_store_access(self, store_id):
+        return self.auth_context.has_store_access(store_id)
 
     def has_permission(self, permission):
-        return permission in self.permissions
+        return self.auth_context.has_permission(permission)
 
     @property
     def retail_brand_id(self):
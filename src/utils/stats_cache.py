@@ -0,0 +1,133 @@
+"""
+Response cache of the stats endpoints.
+
+Responses are cached in redis under a hash of the query arguments and of generation counters: one per store
+requested, one per endpoint and a global one. Writes bump the counters of the stores they touch once they are
+committed and once the rollups they feed are refreshed, so cached responses are never served stale and ranges in
+the past can be kept for `STATS_CACHE_TTL`. Ranges reaching the current day are kept `STATS_CACHE_TODAY_TTL`
+seconds. Hits and misses are counted per endpoint in `stats:metrics`.
+"""
+import hashlib
+from datetime import date, datetime
+from functools import wraps
+from typing import Dict, Iterable, List
+
+import simplejson
+from flask import current_app, make_response, request
+from flask_security import current_user
+from redis.exceptions import RedisError
+
+from . import commit_hooks
+from .redis import redis_store
+
+GENERATION_KEY = 'stats:generation:{}'
+
+CACHE_KEY = 'stats:cache:{}:{}'
+
+METRICS_KEY = 'stats:metrics'
+
+GLOBAL = 'all'
+
+
+def requested_stores() -> List[str]:
+    stores = request.args.getlist('__retail_shop_id__in')
+    if len(stores) == 1:
+        stores = stores[0].split(',')
+    return sorted({store.strip() for store in stores if store.strip()})
+
+
+def store_generation(store_id) -> str:
+    return 'store:{}'.format(store_id)
+
+
+def bump_generations(*names) -> None:
+    """Invalidates the responses cached under the generations `names`."""
+    if not names:
+        return
+    pipeline = redis_store.pipeline()
+    for name in set(names):
+        pipeline.incr(GENERATION_KEY.format(name))
+    pipeline.execute()
+
+
+def bump_stores(store_ids: Iterable) -> None:
+    bump_generations(*(store_generation(store_id) for store_id in store_ids))
+
+
+def _cache_key(endpoint: str, stores: List[str]) -> str:
+    names = [GLOBAL, endpoint] + [store_generation(store) for store in stores]
+    generations = [int(value or 0) for value in redis_store.mget([GENERATION_KEY.format(name) for name in names])]
+    arguments = sorted((key, request.args.getlist(key)) for key in request.args)
+    payload = simplejson.dumps([arguments, generations])
+    return CACHE_KEY.format(endpoint, hashlib.sha256(payload.encode('utf-8')).hexdigest())
+
+
+def _ttl() -> int:
+    try:
+        to_date = datetime.strptime(request.args['__created_on__lte'], '%Y-%m-%dT%H:%M:%S.%fZ').date()
+    except (KeyError, ValueError):
+        to_date = None
+    if to_date is None or to_date >= date.today():
+        return current_app.config.get('STATS_CACHE_TODAY_TTL', 60)
+    return current_app.config.get('STATS_CACHE_TTL', 7 * 86400)
+
+
+def _count(endpoint: str, outcome: str) -> None:
+    try:
+        redis_store.hincrby(METRICS_KEY, '{}:{}'.format(endpoint, outcome), 1)
+    except RedisError:
+        pass
+
+
+def cache_info() -> Dict[str, Dict]:
+    """Hits, misses and hit rate of every endpoint."""
+    info = {}
+    for field, value in redis_store.hgetall(METRICS_KEY).items():
+        endpoint, outcome = (field.decode('utf-8') if isinstance(field, bytes) else field).rsplit(':', 1)
+        info.setdefault(endpoint, {'hits': 0, 'misses': 0})[outcome] = int(value)
+    for counts in info.values():
+        total = counts['hits'] + counts['misses']
+        counts['hit_rate'] = round(counts['hits'] / total, 4) if total else 0.0
+    return info
+
+
+def cached_stats(endpoint: str):
+    """
+    Serves the decorated stats view from the cache. It has to run after authentication; requests for stores the
+    user can't access go to the view, which refuses them.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            stores = requested_stores()
+            if not all(current_user.has_shop_access(store) for store in stores):
+                return func(*args, **kwargs)
+            try:
+                key = _cache_key(endpoint, stores)
+                cached = redis_store.get(key)
+            except RedisError:
+                return func(*args, **kwargs)
+
+            if cached is not None:
+                _count(endpoint, 'hits')
+                response = make_response(cached, 200)
+                response.mimetype = 'application/json'
+                response.headers['X-Cache'] = 'HIT'
+                return response
+
+            _count(endpoint, 'misses')
+            response = func(*args, **kwargs)
+            if response.status_code == 200:
+                try:
+                    redis_store.setex(key, _ttl(), response.get_data())
+                except RedisError:
+                    pass
+            response.headers['X-Cache'] = 'MISS'
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+commit_hooks.register_commit_handler('stats', lambda names: bump_generations(*names))
@@ -1,6 +1,27 @@
 import unittest
 from .test_users import TestSetup\
     , TestSetupFailure, TestRole, TestUser, TestUserRole
+from .test_auth_context import TestAuthContext
+from .test_pagination import TestCursor, TestPaginate
+from .test_filters import TestFilterPlan
+from .test_schema_cache import TestSchemaCache
+from .test_serializer import TestCompiledDumper, TestProductDump
+from .test_loading import TestLoaderOptions, TestOrderLoaderOptions
+from .test_idempotency import TestIdempotency
+from .test_export import TestExport, TestExportJobs, TestExportLimit
+from .test_stats_cache import TestStatsCache
+from .test_search_index import TestMemoryBackend, TestSearchIndex
+from .test_barcodes import TestBarcodeCache
+from .test_allocation import TestAllocation
+from .test_importer import TestCatalogImporter
+from .test_catalog_files import TestCatalogFiles
+from .test_commit_hooks import TestCommitHooks
+from .test_counters import TestStockCounters
+from .test_invoice import TestInvoiceNumbers
+from .test_order_sync import TestOrderSync
+from .test_rollups import TestSalesRollups
+from .test_aggregates import TestCustomerAggregates
+from .test_valuation import TestStockValuation
 
 
 def suite():
@@ -10,4 +31,31 @@ def suite():
     test_suite.addTest(unittest.makeSuite(TestUser))
     test_suite.addTest(unittest.makeSuite(TestRole))
     test_suite.addTest(unittest.makeSuite(TestUserRole))
+    test_suite.addTest(unittest.makeSuite(TestAuthContext))
+    test_suite.addTest(unittest.makeSuite(TestCursor))
+    test_suite.addTest(unittest.makeSuite(TestPaginate))
+    test_suite.addTest(unittest.makeSuite(TestFilterPlan))
+    test_suite.addTest(unittest.makeSuite(TestSchemaCache))
+    test_suite.addTest(unittest.makeSuite(TestCompiledDumper))
+    test_suite.addTest(unittest.makeSuite(TestProductDump))
+    test_suite.addTest(unittest.makeSuite(TestLoaderOptions))
+    test_suite.addTest(unittest.makeSuite(TestOrderLoaderOptions))
+    test_suite.addTest(unittest.makeSuite(TestIdempotency))
+    test_suite.addTest(unittest.makeSuite(TestExport))
+    test_suite.addTest(unittest.makeSuite(TestExportLimit))
+    test_suite.addTest(unittest.makeSuite(TestExportJobs))
+    test_suite.addTest(unittest.makeSuite(TestStatsCache))
+    test_suite.addTest(unittest.makeSuite(TestMemoryBackend))
+    test_suite.addTest(unittest.makeSuite(TestSearchIndex))
+    test_suite.addTest(unittest.makeSuite(TestBarcodeCache))
+    test_suite.addTest(unittest.makeSuite(TestAllocation))
+    test_suite.addTest(unittest.makeSuite(TestCatalogImporter))
+    test_suite.addTest(unittest.makeSuite(TestCatalogFiles))
+    test_suite.addTest(unittest.makeSuite(TestCommitHooks))
+    test_suite.addTest(unittest.makeSuite(TestStockCounters))
+    test_suite.addTest(unittest.makeSuite(TestInvoiceNumbers))
+    test_suite.addTest(unittest.makeSuite(TestOrderSync))
+    test_suite.addTest(unittest.makeSuite(TestSalesRollups))
+    test_suite.addTest(unittest.makeSuite(TestCustomerAggregates))
+    test_suite.addTest(unittest.makeSuite(TestStockValuation))
     return test_suite
@@ -0,0 +1,61 @@
+from flask_testing import TestCase
+
+from manager import app, db
+from src import configs
+from src.orders import invoice
+from src.products.models import Brand, Product, Stock
+from src.user.models import Organisation, Role, Store, User, UserRole, UserStore
+
+
+class DatabaseTestCase(TestCase):
+    """Runs every test on freshly created tables of the testing database."""
+
+    def create_app(self):
+        app.config.from_object(configs.get('testing'))
+        # failing assertions inside a test request context would leave it pushed over the one of the test
+        app.config['PRESERVE_CONTEXT_ON_EXCEPTION'] = False
+        return app
+
+    def setUp(self):
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        # drop_all trips over the printer enums, their type is named after the builtin varchar
+        db.engine.execute('DROP SCHEMA public CASCADE; CREATE SCHEMA public')
+        invoice._sequences.clear()
+
+    def create(self, model, **fields):
+        obj = model(**fields)
+        db.session.add(obj)
+        db.session.flush()
+        return obj
+
+    def create_store(self, name='Store', organisation=None):
+        organisation = organisation or self.create(Organisation, name='{} organisation'.format(name))
+        return self.create(Store, name=name, organisation_id=organisation.id)
+
+    def create_stock(self, store, product=None, **fields):
+        if product is None:
+            brand = Brand.query.filter(Brand.name == 'Brand').first() or self.create(Brand, name='Brand')
+            product = self.create(Product, name='Product {}'.format(Product.query.count()), brand_id=brand.id)
+        fields.setdefault('units_purchased', 10)
+        fields.setdefault('purchase_amount', 5)
+        fields.setdefault('selling_amount', 8)
+        return self.create(Stock, product_id=product.id, store_id=store.id, **fields)
+
+    def create_user(self, stores=(), roles=('admin',), **fields):
+        count = User.query.count()
+        fields.setdefault('email', 'user{}@example.com'.format(count))
+        fields.setdefault('mobile_number', str(9000000000 + count))
+        user = self.create(User, name='User {}'.format(count), active=True, **fields)
+        for name in roles:
+            role = Role.query.filter(Role.name == name).first() or self.create(Role, name=name)
+            self.create(UserRole, user_id=user.id, role_id=role.id)
+        for store in stores:
+            self.create(UserStore, user_id=user.id, store_id=store.id)
+        return user
+
+    @staticmethod
+    def auth_headers(user):
+        return {'Authorization': user.get_auth_token(), 'Content-Type': 'application/json'}
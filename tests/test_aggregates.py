@@ -0,0 +1,218 @@
+from datetime import date, datetime
+from unittest import mock
+
+from manager import db
+from src.orders.models import Order
+from src.orders.rollups import refresh_pending_sales
+from src.user.aggregates import count_orders, reconcile_customer_aggregates
+from src.user.models import Customer, CustomerTransaction, MonthlyCustomerCohort, Organisation, \
+    WeeklyCustomerCohort
+from src.utils.stats_cache import GENERATION_KEY
+from .database import DatabaseTestCase
+from .test_rollups import SetRedis
+
+
+class TestCustomerAggregates(DatabaseTestCase):
+
+    def setUp(self):
+        super(TestCustomerAggregates, self).setUp()
+        self.redis = SetRedis()
+        for target in ('src.orders.rollups.redis_store', 'src.products.valuation.redis_store',
+                       'src.utils.stats_cache.redis_store'):
+            patch = mock.patch(target, self.redis)
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.store = self.create_store()
+        self.asha = self.customer('Asha')
+        self.ravi = self.customer('Ravi')
+        db.session.commit()
+
+    def customer(self, name):
+        return self.create(Customer, name=name, number=name, organisation_id=self.store.organisation_id)
+
+    def order(self, customer, day, total=10, amount_paid=4, store=None, **fields):
+        order = self.create(Order, store_id=(store or self.store).id, customer_id=customer.id, total=total,
+                            amount_paid=amount_paid, created_on=datetime.combine(day, datetime.min.time()), **fields)
+        db.session.commit()
+        return order
+
+    def aggregates(self, customer):
+        db.session.expire_all()
+        customer = Customer.query.get(customer.id)
+        first, last = (value and value.date() for value in (customer.first_order_on, customer.last_order_on))
+        return customer.total_orders, customer.total_billing, customer.amount_due, first, last
+
+    def test_orders(self):
+        first = self.order(self.asha, date(2018, 1, 2))
+        second = self.order(self.asha, date(2018, 1, 5), 20, 20)
+        self.order(self.asha, date(2018, 1, 1), is_void=True)
+        self.assertEqual(self.aggregates(self.asha), (2, 30, 6, date(2018, 1, 2), date(2018, 1, 5)))
+
+        # amounts change by their delta
+        second = Order.query.get(second.id)
+        second.total, second.amount_paid = 25, 5
+        db.session.commit()
+        self.assertEqual(self.aggregates(self.asha), (2, 35, 26, date(2018, 1, 2), date(2018, 1, 5)))
+
+        # orders that stop counting recompute the dates
+        second = Order.query.get(second.id)
+        second.is_void = True
+        db.session.commit()
+        self.assertEqual(self.aggregates(self.asha), (1, 10, 6, date(2018, 1, 2), date(2018, 1, 2)))
+
+        first = Order.query.get(first.id)
+        first.customer_id = self.ravi.id
+        db.session.commit()
+        self.assertEqual(self.aggregates(self.asha), (0, 0, 0, None, None))
+        self.assertEqual(self.aggregates(self.ravi), (1, 10, 6, date(2018, 1, 2), date(2018, 1, 2)))
+
+        db.session.delete(Order.query.get(first.id))
+        db.session.commit()
+        self.assertEqual(self.aggregates(self.ravi), (0, 0, 0, None, None))
+
+    def test_transactions(self):
+        self.order(self.asha, date(2018, 1, 2))
+        transaction = self.create(CustomerTransaction, customer_id=self.asha.id, amount=4)
+        db.session.commit()
+        self.assertEqual(self.aggregates(self.asha)[2], 2)
+
+        transaction = CustomerTransaction.query.get(transaction.id)
+        transaction.customer_id, transaction.amount = self.ravi.id, 1
+        db.session.commit()
+        self.assertEqual((self.aggregates(self.asha)[2], self.aggregates(self.ravi)[2]), (6, -1))
+
+        db.session.delete(CustomerTransaction.query.get(transaction.id))
+        db.session.commit()
+        self.assertEqual(self.aggregates(self.ravi)[2], 0)
+
+    def test_count_orders(self):
+        count_orders(db.session.connection(), [
+            dict(customer_id=self.asha.id, total=10, amount_paid=4, created_on=datetime(2018, 1, 3)),
+            dict(customer_id=self.asha.id, total=5, amount_paid=None, created_on=datetime(2018, 1, 1)),
+            dict(customer_id=self.asha.id, total=7, is_void=True, created_on=datetime(2017, 1, 1)),
+            dict(customer_id=None, total=7, created_on=datetime(2018, 1, 1))])
+        db.session.commit()
+        self.assertEqual(self.aggregates(self.asha), (2, 15, 11, date(2018, 1, 1), date(2018, 1, 3)))
+        self.assertEqual(self.redis.data[GENERATION_KEY.format('customer_stats')], b'1')
+
+    def test_reconcile(self):
+        self.order(self.asha, date(2018, 1, 2))
+        self.create(CustomerTransaction, customer_id=self.asha.id, amount=1)
+        db.session.commit()
+        expected = self.aggregates(self.asha)
+        db.session.execute(Customer.__table__.update().values(total_orders=5, amount_due=0, last_order_on=None))
+        db.session.commit()
+        self.assertEqual(reconcile_customer_aggregates(batch_size=1), 2)
+        self.assertEqual(self.aggregates(self.asha), expected)
+        self.assertEqual(self.aggregates(self.ravi), (0, 0, 0, None, None))
+        self.assertEqual(reconcile_customer_aggregates(), 0)
+
+    def cohorts(self, model, period):
+        db.session.expire_all()
+        return sorted((getattr(row, period), getattr(row, 'cohort_' + period), row.customers, row.orders, row.total)
+                      for row in model.query)
+
+    def test_cohorts(self):
+        old = self.customer('Old')
+        db.session.commit()
+        self.order(old, date(2017, 12, 1))
+        self.order(old, date(2018, 1, 3))
+        self.order(self.asha, date(2018, 1, 2))
+        self.order(self.asha, date(2018, 1, 10))
+        self.order(self.ravi, date(2018, 1, 9), 20)
+        self.order(self.ravi, date(2018, 1, 11), 20, is_void=True)
+        refresh_pending_sales()
+
+        self.assertEqual(self.cohorts(WeeklyCustomerCohort, 'week'), [
+            (date(2017, 11, 27), date(2017, 11, 27), 1, 1, 10),
+            (date(2018, 1, 1), date(2017, 11, 27), 1, 1, 10),
+            (date(2018, 1, 1), date(2018, 1, 1), 1, 1, 10),
+            (date(2018, 1, 8), date(2018, 1, 1), 1, 1, 10),
+            (date(2018, 1, 8), date(2018, 1, 8), 1, 1, 20)])
+        # distinct customers of the month, asha ordered in two of its weeks
+        self.assertEqual(self.cohorts(MonthlyCustomerCohort, 'month'), [
+            (date(2017, 12, 1), date(2017, 12, 1), 1, 1, 10),
+            (date(2018, 1, 1), date(2017, 12, 1), 1, 1, 10),
+            (date(2018, 1, 1), date(2018, 1, 1), 2, 3, 40)])
+
+    def test_cohorts_follow_the_first_order(self):
+        self.order(self.asha, date(2018, 1, 2))
+        self.order(self.asha, date(2018, 2, 5))
+        refresh_pending_sales()
+        backdated = self.order(self.asha, date(2017, 12, 1))
+        refresh_pending_sales()
+        self.assertEqual(self.cohorts(MonthlyCustomerCohort, 'month'), [
+            (date(2017, 12, 1), date(2017, 12, 1), 1, 1, 10),
+            (date(2018, 1, 1), date(2017, 12, 1), 1, 1, 10),
+            (date(2018, 2, 1), date(2017, 12, 1), 1, 1, 10)])
+
+        backdated = Order.query.get(backdated.id)
+        backdated.is_void = True
+        db.session.commit()
+        refresh_pending_sales()
+        self.assertEqual(self.cohorts(MonthlyCustomerCohort, 'month'), [
+            (date(2018, 1, 1), date(2018, 1, 1), 1, 1, 10),
+            (date(2018, 2, 1), date(2018, 1, 1), 1, 1, 10)])
+        self.assertEqual(self.cohorts(WeeklyCustomerCohort, 'week'), [
+            (date(2018, 1, 1), date(2018, 1, 1), 1, 1, 10),
+            (date(2018, 2, 5), date(2018, 1, 1), 1, 1, 10)])
+
+        # synced orders go through count_orders
+        row = dict(store_id=self.store.id, customer_id=self.asha.id, total=10, created_on=datetime(2017, 11, 6))
+        db.session.execute(Order.__table__.insert().values(**row))
+        count_orders(db.session.connection(), [row])
+        db.session.commit()
+        refresh_pending_sales()
+        self.assertEqual([row[1] for row in self.cohorts(WeeklyCustomerCohort, 'week')],
+                         [date(2017, 11, 6)] * 3)
+
+    def test_customer_stats(self):
+        old = self.customer('Old')
+        user = self.create_user([self.store])
+        db.session.commit()
+        self.order(old, date(2017, 12, 1))
+        self.order(old, date(2018, 1, 3))
+        self.order(self.asha, date(2018, 1, 2))
+        self.order(self.asha, date(2018, 1, 10))
+        self.order(self.ravi, date(2018, 1, 9), 20)
+        refresh_pending_sales()
+
+        def stats(to_date):
+            response = self.client.get('/api/v1/customer_stats/', headers=self.auth_headers(user), query_string={
+                '__retail_shop_id__in': self.store.id, '__retail_brand_id__equal': self.store.organisation_id,
+                '__created_on__gte': '2018-01-01T00:00:00.000Z', '__created_on__lte': to_date})
+            self.assert200(response)
+            return [[row[0], row[3][:10]] for key in ('new_customers', 'return_customers', 'old_customers')
+                    for row in response.json[key]]
+
+        self.assertEqual(stats('2018-01-14T00:00:00.000Z'), [[1, '2018-01-01'], [1, '2018-01-08'],
+                                                              [1, '2018-01-08'], [1, '2018-01-01']])
+        self.assertEqual(stats('2019-01-14T00:00:00.000Z'), [[2, '2018-01-01'], [1, '2018-01-01']])
+
+    def test_customer_stats_follow_the_amount_due_of_the_organisation(self):
+        second = self.create_store('Second', Organisation.query.get(self.store.organisation_id))
+        user = self.create_user([self.store])
+        db.session.commit()
+        self.order(self.asha, date(2018, 1, 2))
+
+        def total_due():
+            response = self.client.get('/api/v1/customer_stats/', headers=self.auth_headers(user), query_string={
+                '__retail_shop_id__in': self.store.id, '__retail_brand_id__equal': self.store.organisation_id,
+                '__created_on__gte': '2018-01-01T00:00:00.000Z', '__created_on__lte': '2018-01-14T00:00:00.000Z'})
+            return response.headers['X-Cache'], response.json['total_due']
+
+        self.assertEqual(total_due(), ('MISS', 6))
+        self.assertEqual(total_due(), ('HIT', 6))
+        # orders of the other store only bump the generation of their store
+        order = self.order(self.ravi, date(2018, 1, 3), 10, 0, second)
+        self.assertEqual(total_due(), ('MISS', 16))
+        self.order(self.ravi, date(2018, 1, 4), 10, 10, second)
+        self.assertEqual(total_due(), ('HIT', 16))
+
+        order = Order.query.get(order.id)
+        order.amount_paid = 10
+        db.session.commit()
+        self.assertEqual(total_due(), ('MISS', 6))
+        db.session.delete(Order.query.get(order.id))
+        db.session.commit()
+        self.assertEqual(total_due(), ('HIT', 6))
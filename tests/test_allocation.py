@@ -0,0 +1,43 @@
+import unittest
+from unittest import mock
+
+from sqlalchemy.dialects import postgresql
+
+from src.products.allocation import InsufficientStock, allocate, allocate_many
+
+
+class FakeConnection(object):
+
+    def __init__(self, *batches):
+        self.batches = list(batches)
+        self.statements = []
+
+    def execute(self, statement):
+        self.statements.append(str(statement.compile(dialect=postgresql.dialect())))
+        result = mock.Mock()
+        result.fetchall.return_value = self.batches.pop(0) if self.batches else []
+        return result
+
+
+class TestAllocation(unittest.TestCase):
+
+    def test_skips_locked_stocks_then_waits(self):
+        connection = FakeConnection([(1, 2.0), (2, 1.0)], [], [(3, 5.0)])
+        self.assertEqual(allocate(connection, 7, 1, 5), [(1, 2.0), (2, 1.0), (3, 2.0)])
+        self.assertIn('FOR UPDATE SKIP LOCKED', connection.statements[0])
+        self.assertIn('NOT IN', connection.statements[1])
+        self.assertNotIn('SKIP LOCKED', connection.statements[2])
+
+    def test_insufficient_stock(self):
+        with self.assertRaises(InsufficientStock) as context:
+            allocate(FakeConnection([(1, 2.0)]), 7, 1, 3)
+        self.assertEqual(context.exception.status, 409)
+        self.assertEqual(context.exception.message['data'], {'product_id': 7, 'requested': 3, 'available': 2.0})
+
+    def test_demands_share_the_allocation_of_their_product(self):
+        pools = {7: [(1, 2.0), (2, 4.0)], 9: [(5, 1.0)]}
+        with mock.patch('src.products.allocation.allocate',
+                        side_effect=lambda connection, product_id, *args: list(pools[product_id])) as allocated:
+            splits = allocate_many(None, 1, [(9, 1.0), (7, 3.0), (7, 3.0)])
+        self.assertEqual([call[0][1:4] for call in allocated.call_args_list], [(7, 1, 6.0), (9, 1, 1.0)])
+        self.assertEqual(splits, [[(5, 1.0)], [(1, 2.0), (2, 1.0)], [(2, 3.0)]])
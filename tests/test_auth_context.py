@@ -0,0 +1,26 @@
+import unittest
+
+from src.utils.auth_context import AuthContext
+
+
+class TestAuthContext(unittest.TestCase):
+
+    def setUp(self):
+        self.context = AuthContext(roles=['owner'], permissions=['view_order', 'add_store'], store_ids=[3, 1])
+
+    def test_permissions(self):
+        self.assertTrue(self.context.has_permission('view_order'))
+        self.assertFalse(self.context.has_permission('remove_order'))
+
+    def test_roles(self):
+        self.assertTrue(self.context.has_role('owner'))
+        self.assertFalse(self.context.has_role('admin'))
+
+    def test_store_access(self):
+        self.assertTrue(self.context.has_store_access(3))
+        self.assertTrue(self.context.has_store_access('1'))
+        self.assertFalse(self.context.has_store_access(2))
+        self.assertFalse(self.context.has_store_access(None))
+
+    def test_store_ids_keep_order(self):
+        self.assertEqual(self.context.store_ids, (3, 1))
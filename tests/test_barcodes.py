@@ -0,0 +1,45 @@
+import unittest
+from unittest import mock
+
+import simplejson
+
+from src.products.barcodes import BarcodeCache
+
+
+class TestBarcodeCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = BarcodeCache()
+        self.cache.warmed = True
+        self.cache.products = {'8901': dict(id=1, name='Crocin', barcode='8901', price=10.0,
+                                            taxes=[dict(id=1, name='GST', value=12, store_id=1),
+                                                   dict(id=2, name='GST', value=5, store_id=2)])}
+        self.cache.barcodes = {1: '8901'}
+        self.default_stock = mock.Mock(return_value={'id': 5, 'selling_amount': 12.5})
+        patches = [mock.patch('src.products.barcodes.default_stock', self.default_stock),
+                   mock.patch('src.products.barcodes.db')]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_lookup_keeps_store_taxes_and_stock(self):
+        product = self.cache.lookup('8901', 2)
+        self.assertEqual([tax['id'] for tax in product['taxes']], [2])
+        self.assertEqual(product['stock'], {'id': 5, 'selling_amount': 12.5})
+        self.cache.lookup('8901', 2)
+        self.assertEqual(self.default_stock.call_count, 1)
+        self.assertEqual(len(self.cache.products['8901']['taxes']), 2)
+
+    def test_invalidation_message(self):
+        self.cache.lookup('8901', 1)
+        self.cache.handle_message({'data': simplejson.dumps({'stocks': [[1, 1]]}).encode('utf-8')})
+        self.assertNotIn((1, 1), self.cache.stocks)
+        self.cache.handle_message({'data': simplejson.dumps({'products': [1], 'stocks': []})})
+        self.assertEqual(self.cache.products, {})
+        self.assertEqual(self.cache.barcodes, {})
+
+    def test_stock_expires(self):
+        self.cache.stock_ttl = 0
+        self.cache.stock(1, 1)
+        self.cache.stock(1, 1)
+        self.assertEqual(self.default_stock.call_count, 2)
@@ -0,0 +1,70 @@
+import io
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from src.products.catalog_files import Checkpoint, ingest_file, normalize_chunk, read_chunks
+
+
+class FakeImporter(object):
+
+    imported_names = []
+    fail_after = None
+
+    def __init__(self, batch_size):
+        self.rows = self.imported = self.skipped = 0
+
+    def add_all(self, rows):
+        for row in rows:
+            if self.fail_after is not None and len(self.imported_names) >= self.fail_after:
+                raise RuntimeError('interrupted')
+            self.rows += 1
+            if row is None:
+                self.skipped += 1
+            else:
+                self.imported += 1
+                self.imported_names.append(row['name'])
+
+    def report(self):
+        return ''
+
+
+class TestCatalogFiles(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.jsonl')
+        with os.fdopen(handle, 'w') as stream:
+            for i in range(7):
+                stream.write('{"name": "Product %d", "manufacturer": "Cipla"}\n' % i)
+            stream.write('not json\n')
+        self.addCleanup(os.remove, self.path)
+        FakeImporter.imported_names, FakeImporter.fail_after = [], None
+        patches = [mock.patch('src.products.catalog_files.CatalogImporter', FakeImporter),
+                   mock.patch('src.products.catalog_files.ProcessPoolExecutor', ThreadPoolExecutor)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_csv_records_span_quoted_lines(self):
+        stream = io.BytesIO(b'name,manufacturer\n"Crocin\n500",GSK\n\nDolo,"Micro ""Labs"""\n')
+        stream.readline()
+        chunks = list(read_chunks(stream, stream.tell(), 5, 'csv'))
+        self.assertEqual(len(chunks), 1)
+        rows = normalize_chunk(chunks[0][1], ['name', 'manufacturer'])
+        self.assertEqual([(row['name'], row['brand_name']) for row in rows],
+                         [('Crocin 500', 'GSK'), ('Dolo', 'Micro "Labs"')])
+
+    def test_resumes_from_checkpoint(self):
+        FakeImporter.fail_after = 5
+        with self.assertRaises(RuntimeError):
+            ingest_file(self.path, workers=1, chunk_size=2, progress=lambda message: None)
+        state = Checkpoint(self.path).load()
+        self.assertEqual((state['rows'], state['imported']), (4, 4))
+
+        FakeImporter.fail_after = None
+        counts = ingest_file(self.path, workers=1, chunk_size=2, progress=lambda message: None)
+        self.assertEqual(FakeImporter.imported_names, ['Product {}'.format(i) for i in (0, 1, 2, 3, 4, 4, 5, 6)])
+        self.assertEqual((counts['rows'], counts['imported'], counts['skipped']), (8, 7, 1))
+        self.assertFalse(os.path.exists(self.path + '.checkpoint'))
@@ -0,0 +1,75 @@
+from unittest import mock
+
+from manager import db
+from src.user.models import User, UserStore
+from src.utils import commit_hooks
+from src.utils.auth_context import AUTH_VERSION_KEY, invalidate_auth_snapshots
+from .database import DatabaseTestCase
+from .test_stats_cache import FakeRedis
+
+
+class TestCommitHooks(DatabaseTestCase):
+
+    def setUp(self):
+        super(TestCommitHooks, self).setUp()
+        self.calls = []
+        commit_hooks.register_commit_handler('test', lambda keys: self.calls.append(set(keys)))
+        self.addCleanup(commit_hooks._handlers.pop, 'test', None)
+
+    def test_runs_after_commit(self):
+        commit_hooks.mark(db.session, 'test', 1, None, 2)
+        db.session.flush()
+        self.assertEqual(self.calls, [])
+        db.session.commit()
+        self.assertEqual(self.calls, [{1, 2}])
+        db.session.commit()
+        self.assertEqual(len(self.calls), 1)
+
+    def test_waits_for_the_outer_transaction(self):
+        db.session.begin_nested()
+        commit_hooks.mark(db.session, 'test', 1)
+        db.session.commit()
+        self.assertEqual(self.calls, [])
+        db.session.commit()
+        self.assertEqual(self.calls, [{1}])
+
+    def test_dropped_on_rollback(self):
+        commit_hooks.mark(db.session, 'test', 1)
+        db.session.rollback()
+        db.session.commit()
+        self.assertEqual(self.calls, [])
+
+    def test_savepoint_rollback_keeps_outer_marks(self):
+        commit_hooks.mark(db.session, 'test', 1)
+        db.session.begin_nested()
+        db.session.rollback()
+        db.session.commit()
+        self.assertEqual(self.calls, [{1}])
+
+    def test_handler_errors_are_captured(self):
+        commit_hooks.register_commit_handler('test', mock.Mock(side_effect=RuntimeError))
+        commit_hooks.mark(db.session, 'test', 1)
+        with mock.patch('src.utils.commit_hooks.sentry') as sentry:
+            db.session.commit()
+        self.assertEqual(sentry.captureException.call_count, 1)
+
+    def test_store_access_changes_invalidate_auth_snapshots(self):
+        redis = FakeRedis()
+        key = AUTH_VERSION_KEY.format
+        with mock.patch('src.utils.auth_context.redis_store', redis):
+            user = self.create(User, email='a@b.com', name='a', mobile_number='1')
+            store = self.create_store()
+            db.session.commit()
+            self.assertNotIn(key(user.id), redis.data)
+
+            self.create(UserStore, user_id=user.id, store_id=store.id)
+            self.assertNotIn(key(user.id), redis.data)
+            db.session.commit()
+            self.assertEqual(redis.data[key(user.id)], b'1')
+
+            user.stores.remove(store)
+            db.session.rollback()
+            self.assertEqual(redis.data[key(user.id)], b'1')
+
+            invalidate_auth_snapshots([user.id, user.id])
+            self.assertEqual(redis.data[key(user.id)], b'2')
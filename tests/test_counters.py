@@ -0,0 +1,116 @@
+from manager import db
+from src.orders.models import Item, Order
+from src.products.counters import reconcile_stock_counters
+from src.products.models import Stock
+from .database import DatabaseTestCase
+
+
+class TestStockCounters(DatabaseTestCase):
+
+    def setUp(self):
+        super(TestStockCounters, self).setUp()
+        self.store = self.create_store()
+        self.stock = self.create_stock(self.store, units_purchased=10)
+        self.other = self.create_stock(self.store, units_purchased=4)
+        self.order = self.create(Order, store_id=self.store.id)
+        db.session.commit()
+
+    def counters(self, stock):
+        db.session.expire_all()
+        stock = Stock.query.get(stock.id)
+        return stock.units_sold, stock.units_available, stock.is_sold
+
+    def sell(self, quantity, stock=None, **fields):
+        item = self.create(Item, order_id=self.order.id, stock_id=(stock or self.stock).id, quantity=quantity,
+                           unit_price=8, **fields)
+        db.session.commit()
+        return item
+
+    def test_insert(self):
+        self.assertEqual(self.counters(self.stock), (0, 10, False))
+        self.sell(3)
+        self.assertEqual(self.counters(self.stock), (3, 7, False))
+        self.sell(2, stock_adjust=True)
+        self.assertEqual(self.counters(self.stock), (3, 7, False))
+        self.sell(4, self.other)
+        self.assertEqual(self.counters(self.other), (4, 0, True))
+
+    def test_update(self):
+        item = self.sell(3)
+        item.quantity = 5
+        db.session.commit()
+        self.assertEqual(self.counters(self.stock), (5, 5, False))
+        item.stock_adjust = True
+        db.session.commit()
+        self.assertEqual(self.counters(self.stock), (0, 10, False))
+        item.stock_adjust = False
+        db.session.commit()
+        self.assertEqual(self.counters(self.stock), (5, 5, False))
+
+    def test_update_of_an_unloaded_item(self):
+        item_id = self.sell(3).id
+        db.session.expire_all()
+        item = Item.query.get(item_id)
+        db.session.expire(item, ['quantity'])
+        item.quantity = 1
+        db.session.commit()
+        self.assertEqual(self.counters(self.stock), (1, 9, False))
+
+    def test_stock_moves(self):
+        item = self.sell(3)
+        item.stock_id = self.other.id
+        db.session.commit()
+        self.assertEqual(self.counters(self.stock), (0, 10, False))
+        self.assertEqual(self.counters(self.other), (3, 1, False))
+
+    def test_void(self):
+        self.sell(3)
+        self.sell(4, self.other)
+        self.sell(1, stock_adjust=True)
+        order = Order.query.get(self.order.id)
+        order.is_void = True
+        db.session.commit()
+        self.assertEqual(self.counters(self.stock), (0, 10, False))
+        self.assertEqual(self.counters(self.other)[:2], (0, 4))
+
+        # items of a void order don't count
+        self.sell(2)
+        self.assertEqual(self.counters(self.stock), (0, 10, False))
+
+        order = Order.query.get(self.order.id)
+        order.is_void = False
+        db.session.commit()
+        self.assertEqual(self.counters(self.stock), (5, 5, False))
+        self.assertEqual(self.counters(self.other), (4, 0, True))
+
+    def test_delete(self):
+        self.sell(3)
+        loose = self.create(Item, stock_id=self.stock.id, quantity=2, unit_price=8)
+        db.session.commit()
+        self.assertEqual(self.counters(self.stock), (5, 5, False))
+        db.session.delete(Item.query.get(loose.id))
+        db.session.commit()
+        self.assertEqual(self.counters(self.stock), (3, 7, False))
+
+        # items are deleted with their order
+        db.session.delete(Order.query.get(self.order.id))
+        db.session.commit()
+        self.assertEqual(Item.query.count(), 0)
+        self.assertEqual(self.counters(self.stock), (0, 10, False))
+
+    def test_units_purchased_change(self):
+        self.sell(3)
+        stock = Stock.query.get(self.stock.id)
+        stock.units_purchased = 6
+        db.session.commit()
+        self.assertEqual(self.counters(self.stock), (3, 3, False))
+
+    def test_reconcile(self):
+        self.sell(3)
+        self.sell(1, self.other)
+        db.session.execute(Stock.__table__.update().values(units_sold=9, units_available=0))
+        db.session.commit()
+        self.assertEqual(reconcile_stock_counters(store_ids=[self.store.id], batch_size=1), 2)
+        self.assertEqual(self.counters(self.stock)[:2], (3, 7))
+        self.assertEqual(self.counters(self.other)[:2], (1, 3))
+        self.assertEqual(reconcile_stock_counters(), 0)
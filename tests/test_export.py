@@ -0,0 +1,207 @@
+import csv
+import gzip
+import io
+import shutil
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import simplejson
+from redis.exceptions import RedisError
+
+from manager import db
+from src.products.resources import StockResource
+from src.user.models import Store
+from src.tasks.export_tasks import export_job
+from src.utils.export import csv_chunks, write_csv
+from src.utils.export_jobs import EXPORT_KEY, RUNNING, ExportJobResource, get_job, job_id, set_job, update_job
+from .database import DatabaseTestCase
+from .test_stats_cache import FakeRedis
+
+
+class TestExport(unittest.TestCase):
+
+    records = [{'id': 1, 'name': 'Crocin', 'tags': [1, 2], 'batch_number': None},
+               {'id': 2, 'name': 'Dolo, 650', 'tags': [], 'batch_number': 'B7'}]
+
+    def test_header_and_rows(self):
+        rows = list(csv.reader(io.StringIO(''.join(csv_chunks(self.records)))))
+        self.assertEqual(rows, [['batch_number', 'id', 'name', 'tags'],
+                                ['', '1', 'Crocin', '[1, 2]'],
+                                ['B7', '2', 'Dolo, 650', '[]']])
+
+    def test_chunks(self):
+        records = ({'id': i} for i in range(5))
+        chunks = list(csv_chunks(records, rows_per_chunk=2))
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(''.join(chunks).split(), ['id', '0', '1', '2', '3', '4'])
+
+    def test_empty(self):
+        buffer = io.StringIO()
+        write_csv(iter(()), buffer)
+        self.assertEqual(buffer.getvalue(), '')
+
+    def test_job_id(self):
+        args = {'store_id': ['1'], '__order_by': ['-id', 'created_on']}
+        same = {'__order_by': ['-id', 'created_on'], 'store_id': '1'}
+        self.assertEqual(job_id(1, 'stock', 'csv', args), job_id(1, 'stock', 'csv', same))
+        self.assertNotEqual(job_id(1, 'stock', 'csv', args),
+                            job_id(1, 'stock', 'csv', {'store_id': ['1'], '__order_by': ['created_on', '-id']}))
+        self.assertNotEqual(job_id(1, 'stock', 'csv', args), job_id(2, 'stock', 'csv', args))
+        self.assertNotEqual(job_id(1, 'stock', 'csv', args), job_id(1, 'stock', 'xlsx', args))
+
+
+class ExportRedis(FakeRedis):
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+
+class TestExportLimit(DatabaseTestCase):
+
+    def setUp(self):
+        super(TestExportLimit, self).setUp()
+        store = self.create_store()
+        for _ in range(3):
+            self.create_stock(store)
+        self.user = self.create_user([store])
+        db.session.commit()
+        self.headers = self.auth_headers(self.user)
+        patches = [mock.patch('src.utils.export_jobs.redis_store', ExportRedis()),
+                   mock.patch('src.utils.export_jobs.celery'),
+                   mock.patch.object(StockResource, 'max_export_limit', 3)]
+        self.celery = patches[1].start()
+        for patch in patches:
+            if patch is not patches[1]:
+                patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_streams_exports_within_the_limit(self):
+        response = self.client.get('/api/v1/stock?__export__=csv', headers=self.headers)
+        self.assert200(response)
+        self.assertEqual(len(response.data.decode('utf-8').splitlines()), 4)
+        self.assertFalse(self.celery.send_task.called)
+
+    def test_larger_exports_run_as_jobs(self):
+        self.create_stock(Store.query.first())
+        db.session.commit()
+        response = self.client.get('/api/v1/stock?__export__=xlsx&__order_by=-id', headers=self.headers)
+        self.assertStatus(response, 202)
+        self.assertEqual((response.json['data']['resource'], response.json['data']['format']), ('stock', 'xlsx'))
+        job, name, user_id, args, file_format = self.celery.send_task.call_args[1]['args']
+        self.assertEqual((job, name, user_id, args, file_format),
+                         (response.json['data']['id'], 'stock', self.user.id, {'__order_by': ['-id']}, 'xlsx'))
+
+        # the same export again reuses the job
+        self.assertStatus(self.client.get('/api/v1/stock?__export__=xlsx&__order_by=-id', headers=self.headers),
+                          200)
+        self.assertEqual(self.celery.send_task.call_count, 1)
+
+
+class TestExportJobs(DatabaseTestCase):
+
+    def setUp(self):
+        super(TestExportJobs, self).setUp()
+        self.store = self.create_store()
+        for _ in range(2):
+            self.create_stock(self.store)
+        self.user = self.create_user([self.store])
+        self.other = self.create_user([self.store])
+        db.session.commit()
+        self.redis = ExportRedis()
+        patches = [mock.patch('src.utils.export_jobs.redis_store', self.redis),
+                   mock.patch('src.utils.export_jobs.celery')]
+        self.celery = patches[1].start()
+        patches[0].start()
+        for patch in patches:
+            self.addCleanup(patch.stop)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.app.config['EXPORT_DIR'] = directory
+
+    def submit(self, user=None, **payload):
+        payload = dict(dict(resource='stock', format='csv', filters={'__order_by': ['id']}), **payload)
+        return self.client.post('/api/v1/export_jobs/', headers=self.auth_headers(user or self.user),
+                                data=simplejson.dumps(payload))
+
+    def status(self, job, user=None):
+        return self.client.get('/api/v1/export_jobs/{}/'.format(job), headers=self.auth_headers(user or self.user))
+
+    def test_submit_and_download(self):
+        response = self.submit()
+        self.assertStatus(response, 202)
+        job = response.json['data']['id']
+        self.assertEqual(self.celery.send_task.call_args[1]['args'],
+                         (job, 'stock', self.user.id, {'__order_by': ['id']}, 'csv'))
+        self.assertEqual(self.status(job).json['data']['status'], 'queued')
+
+        export_job(*self.celery.send_task.call_args[1]['args'])
+        data = self.status(job).json['data']
+        self.assertEqual((data['status'], data['rows'], data['total']), ('done', 2, 2))
+        response = self.client.get(data['download'], headers=self.auth_headers(self.user))
+        self.assert200(response)
+        self.assertEqual(len(gzip.decompress(response.data).decode('utf-8').splitlines()), 3)
+        response.close()
+
+        # the finished job answers the same export
+        self.assertStatus(self.submit(), 200)
+        self.assertEqual(self.celery.send_task.call_count, 1)
+
+    def test_queued_jobs_are_reused(self):
+        job = self.submit().json['data']['id']
+        state = get_job(job)
+        self.redis.data[EXPORT_KEY.format(job)] = simplejson.dumps(dict(state, updated=0))
+        self.assertStatus(self.submit(), 200)
+        self.assertEqual(self.celery.send_task.call_count, 1)
+
+    def test_running_jobs_without_heartbeat_are_submitted_again(self):
+        job = self.submit().json['data']['id']
+        update_job(job, status=RUNNING, total=2)
+        self.assertStatus(self.submit(), 200)
+
+        set_job(job, dict(get_job(job), heartbeat=time.time() - self.app.config['EXPORT_JOB_STALE_AFTER'] - 1))
+        response = self.submit()
+        self.assertStatus(response, 202)
+        self.assertEqual(response.json['data']['status'], 'queued')
+        self.assertEqual(self.celery.send_task.call_count, 2)
+
+    def test_jobs_of_other_users(self):
+        job = self.submit().json['data']['id']
+        self.assert404(self.status(job, self.other))
+        self.assert404(self.client.get('/api/v1/export_jobs/{}/download/'.format(job),
+                                       headers=self.auth_headers(self.other)))
+        self.assertStatus(self.submit(self.other), 202)
+        self.assertEqual(self.celery.send_task.call_count, 2)
+
+    def test_invalid_requests(self):
+        self.assert400(self.submit(resource='product'))
+        self.assert400(self.submit(format='pdf'))
+        self.assert400(self.submit(filters=['id']))
+        self.assertFalse(self.celery.send_task.called)
+
+    def test_access(self):
+        self.assert401(self.submit(self.create_user()))
+        customer = self.create_user([self.store], roles=('customer',))
+        db.session.commit()
+        # answered like the views of the resource
+        self.assertStatus(self.submit(customer),
+                          self.client.get('/api/v1/stock', headers=self.auth_headers(customer)).status_code)
+        self.assertFalse(self.celery.send_task.called)
+
+    def test_users_without_an_id(self):
+        with mock.patch('src.utils.export_jobs.current_user', SimpleNamespace(id=None)), \
+                self.app.test_request_context(method='POST', data='{"resource": "stock"}',
+                                              content_type='application/json'):
+            self.assert403(ExportJobResource().post())
+        self.assertFalse(self.celery.send_task.called)
+
+    def test_redis_errors(self):
+        self.redis.set = self.redis.get = mock.Mock(side_effect=RedisError)
+        self.assertStatus(self.submit(), 503)
+        self.assertStatus(self.status('job'), 503)
+        self.assertFalse(self.celery.send_task.called)
@@ -0,0 +1,88 @@
+import unittest
+from datetime import date
+from unittest import mock
+
+from sqlalchemy import Column, Date, ForeignKey, Integer, String
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import Session
+
+from src.products.models import Stock
+from src.utils import operators as ops
+from src.utils.filters import FilterPlan
+
+Base = declarative_base()
+
+
+class Article(Base):
+    __tablename__ = 'article'
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    keywords = Column(TSVECTOR)
+    expiry_date = Column(Date)
+
+    @hybrid_property
+    def expired(self):
+        return self.expiry_date < today()
+
+    @expired.expression
+    def expired(cls):
+        return cls.expiry_date < today()
+
+
+def today():
+    return date.today()
+
+
+class Label(Base):
+    __tablename__ = 'label'
+    id = Column(Integer, primary_key=True)
+    article_id = Column(ForeignKey('article.id'))
+    tag = Column(String)
+
+
+class TestFilterPlan(unittest.TestCase):
+
+    def setUp(self):
+        self.plan = FilterPlan(Article, {'name': [ops.Equal, ops.Contains], 'id': [ops.In], 'keywords': [ops.Search],
+                                         'expired': [ops.Boolean]},
+                               {'tag': {'model': Label, 'join': 'article_id', 'filters': [ops.Equal]}})
+        self.query = Session().query(Article)
+
+    def test_entries(self):
+        self.assertEqual(set(self.plan.entries), {'__name__equal', '__name__contains', '__id__in', '__tag__equal',
+                                                  '__keywords__search', '__expired__bool'})
+
+    def test_matches_operators(self):
+        args = {'__name__contains': ['Ab'], '__id__in': ['1,2'], '__page': ['2']}
+        expected = ops.Contains.prepare_queryset(self.query, Article, 'name', args['__name__contains'])
+        expected = ops.In.prepare_queryset(expected, Article, 'id', args['__id__in'])
+        self.assertEqual(str(self.plan.apply(self.query, args)), str(expected))
+
+    def test_external_filter_joins(self):
+        self.assertIn('JOIN label', str(self.plan.apply(self.query, {'__tag__equal': ['x']})))
+
+    def test_search_is_ranked_by_prefixes(self):
+        query = self.plan.apply(self.query, {'__keywords__search': ['Para-cetamol 500_mg!']})
+        sql = str(query.statement.compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True}))
+        self.assertIn("article.keywords @@ to_tsquery('simple', 'para:* & cetamol:* & 500:* & mg:*')", sql)
+        self.assertIn('ORDER BY ts_rank(article.keywords', sql)
+        self.assertIs(self.plan.apply(self.query, {'__keywords__search': [' - ']}), self.query)
+
+    def test_search_orders_the_query(self):
+        self.assertTrue(self.plan.orders({'__keywords__search': ['para'], '__page': ['2']}))
+        self.assertFalse(self.plan.orders({'__keywords__search': [' - '], '__name__equal': ['x']}))
+
+    def test_hybrids_are_built_on_every_use(self):
+        for day in (date(2018, 4, 1), date(2018, 4, 2)):
+            with mock.patch('tests.test_filters.today', return_value=day):
+                query = self.plan.apply(self.query, {'__expired__bool': ['true']})
+            self.assertIn(day, query.statement.compile().params.values())
+        self.plan.apply(self.query, {'__name__equal': ['x']})
+        self.assertEqual(set(self.plan._columns), {(Article, 'name')})
+
+    def test_stock_expiry_is_evaluated_by_the_database(self):
+        sql = str(Stock.expired.compile(dialect=postgresql.dialect()))
+        self.assertIn('CURRENT_DATE', sql)
@@ -0,0 +1,74 @@
+import unittest
+from unittest import mock
+
+from flask import Flask, jsonify, make_response
+
+from src.utils.idempotency import idempotent
+
+
+class FakeRedis(object):
+
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value.encode('utf-8')
+        return True
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value.encode('utf-8')
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+class TestIdempotency(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = 0
+        self.app = Flask(__name__)
+
+        @self.app.route('/order/', methods=['POST'])
+        @idempotent
+        def create():
+            self.calls += 1
+            return make_response(jsonify({'id': self.calls}), 500 if self.calls == 99 else 201)
+
+        self.client = self.app.test_client()
+        patches = [mock.patch('src.utils.idempotency.redis_store', FakeRedis()),
+                   mock.patch('src.utils.idempotency.current_user', mock.Mock(id=1))]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def post(self, body='{"a": 1}', key='k1'):
+        return self.client.post('/order/', data=body, headers={'Idempotency-Key': key},
+                                content_type='application/json')
+
+    def test_retry_is_replayed(self):
+        first, second = self.post(), self.post()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.get_data(), first.get_data())
+        self.assertEqual(second.headers['Idempotent-Replayed'], 'true')
+
+    def test_key_reused_with_other_body(self):
+        self.post()
+        self.assertEqual(self.post(body='{"a": 2}').status_code, 422)
+        self.assertEqual(self.calls, 1)
+
+    def test_without_key(self):
+        self.client.post('/order/', data='{}', content_type='application/json')
+        self.client.post('/order/', data='{}', content_type='application/json')
+        self.assertEqual(self.calls, 2)
+
+    def test_server_error_not_stored(self):
+        self.calls = 98
+        self.assertEqual(self.post().status_code, 500)
+        self.assertEqual(self.post().status_code, 201)
+        self.assertEqual(self.calls, 100)
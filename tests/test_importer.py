@@ -0,0 +1,38 @@
+import unittest
+from decimal import Decimal
+from unittest import mock
+
+from src.products.importer import CatalogImporter, normalize
+
+
+class TestCatalogImporter(unittest.TestCase):
+
+    def test_normalize_sources(self):
+        product = normalize({'name': ' Crocin  500 ', 'manufacturer': 'GSK', 'genericname': 'Paracetamol',
+                             'price': {'INR': {'default': 15.456}}, 'categories_without_path': ['Fever', '', 'Pain']})
+        self.assertEqual(product['name'], 'Crocin 500')
+        self.assertEqual(product['price'], Decimal('15.46'))
+        self.assertEqual(product['therapeutic_name'], 'Paracetamol')
+        self.assertEqual(product['categories'], ['Fever', 'Pain'])
+        product = normalize({'productName': 'Dolo 650', 'manufacturer': 'Micro Labs', 'packSizeMrp': '30',
+                             'productFormName': 'TABLET'})
+        self.assertEqual((product['name'], product['price'], product['formulation_types']),
+                         ('Dolo 650', Decimal('30.00'), 'TABLET'))
+        self.assertEqual(normalize({'name': 'Azee', 'brand_name': 'Cipla', 'categories': 'a|b'})['categories'],
+                         ['a', 'b'])
+
+    def test_normalize_rejects(self):
+        self.assertIsNone(normalize({'name': 'Crocin'}))
+        self.assertIsNone(normalize({'name': 'Crocin', 'manufacturer': 'GSK', 'price': 'free'}))
+        self.assertIsNone(normalize({'name': 'x' * 128, 'manufacturer': 'GSK'}))
+        self.assertIsNone(normalize({'productName': 'Dolo', 'manufacturer': 'Micro', 'packSizeMrp': -1}))
+
+    def test_batches_dedup_names(self):
+        session = mock.Mock()
+        importer = CatalogImporter(batch_size=3, session=session)
+        with mock.patch.object(CatalogImporter, '_import', side_effect=lambda rows: len(rows) - 1) as imported:
+            importer.add_all([normalize({'name': name, 'manufacturer': 'GSK'}) for name in
+                              ('Crocin', 'CROCIN', 'Dolo', 'Azee')] + [None])
+        self.assertEqual([sorted(call[0][0]) for call in imported.call_args_list], [['crocin', 'dolo'], ['azee']])
+        self.assertEqual(session.commit.call_count, 2)
+        self.assertEqual((importer.rows, importer.imported, importer.skipped), (5, 1, 4))
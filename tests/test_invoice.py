@@ -0,0 +1,74 @@
+from manager import app, db
+from src.orders.invoice import next_invoice_number, next_invoice_numbers
+from src.orders.models import InvoiceBlock
+from src.user.models import Store
+from src.user.schemas import StoreSchema
+from .database import DatabaseTestCase
+
+
+class TestInvoiceNumbers(DatabaseTestCase):
+
+    def setUp(self):
+        super(TestInvoiceNumbers, self).setUp()
+        self.store = self.create_store()
+        self.store.invoice_number = 100
+        db.session.commit()
+
+    def test_sequence_starts_after_the_store_number(self):
+        self.assertEqual([next_invoice_number(self.store) for _ in range(3)], [101, 102, 103])
+        self.assertEqual(next_invoice_numbers(self.store, 3), [104, 105, 106])
+        self.assertEqual(next_invoice_numbers(self.store, 0), [])
+        db.session.commit()
+        self.assertEqual(Store.query.get(self.store.id).invoice_number, 100)
+
+    def test_numbers_are_not_reused_after_rollback(self):
+        self.assertEqual(next_invoice_number(self.store), 101)
+        db.session.rollback()
+        self.assertEqual(next_invoice_number(Store.query.get(self.store.id)), 102)
+
+    def test_sequences_per_store(self):
+        other = self.create_store('Other')
+        db.session.commit()
+        self.assertEqual(next_invoice_number(other), 1)
+        self.assertEqual(next_invoice_number(self.store), 101)
+
+    def test_terminal_blocks(self):
+        app.config['INVOICE_BLOCK_SIZE'] = 2
+        self.addCleanup(app.config.__setitem__, 'INVOICE_BLOCK_SIZE', 50)
+        self.store.separate_offline_billing = True
+        db.session.commit()
+        first = [next_invoice_number(self.store, 'a') for _ in range(2)]
+        self.assertEqual([next_invoice_number(self.store, 'b'), next_invoice_number(self.store)], [103, 105])
+        self.assertEqual(first + [next_invoice_number(self.store, 'a')], [101, 102, 106])
+        self.assertEqual(next_invoice_numbers(self.store, 2, 'b'), [104, 108])
+        db.session.commit()
+        self.assertEqual([(block.next_number, block.last_number) for block in
+                          InvoiceBlock.query.filter(InvoiceBlock.terminal_id == 'a',
+                                                    InvoiceBlock.next_number <= InvoiceBlock.last_number)],
+                         [(107, 107)])
+
+    def test_store_dumps_the_current_number(self):
+        schema = StoreSchema(only=('id', 'name', 'invoice_number'))
+        self.assertEqual(schema.dump(self.store).data['invoice_number'], 100)
+        next_invoice_numbers(self.store, 3)
+        db.session.commit()
+        self.assertEqual(schema.dump(Store.query.get(self.store.id)).data['invoice_number'], 103)
+
+        store, errors = StoreSchema().load({'name': 'Seeded', 'invoice_number': 500}, session=db.session)
+        self.assertEqual((errors, store.invoice_number), ({}, 500))
+        self.assertIn('invoice_number', StoreSchema().load({'name': 'Seeded', 'invoice_number': -1},
+                                                           session=db.session).errors)
+
+    def test_writing_the_store_number_reseeds_the_sequence(self):
+        app.config['INVOICE_BLOCK_SIZE'] = 2
+        self.addCleanup(app.config.__setitem__, 'INVOICE_BLOCK_SIZE', 50)
+        self.store.separate_offline_billing = True
+        db.session.commit()
+        self.assertEqual([next_invoice_number(self.store, 'a'), next_invoice_number(self.store)], [101, 103])
+        db.session.commit()
+
+        store = Store.query.get(self.store.id)
+        store.invoice_number = 500
+        db.session.commit()
+        self.assertEqual(StoreSchema(only=('invoice_number',)).dump(store).data, {'invoice_number': 500})
+        self.assertEqual([next_invoice_number(store), next_invoice_number(store, 'a')], [501, 502])
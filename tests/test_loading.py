@@ -0,0 +1,131 @@
+import unittest
+
+from marshmallow import Schema, fields
+from marshmallow_sqlalchemy.fields import Related
+from sqlalchemy import Column, ForeignKey, Integer, String, create_engine, event
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import Session, relationship
+
+from manager import db
+from src.orders.models import Order, OrderStatus, Status
+from src.orders.schemas import OrderSchema
+from src.user.models import User
+from src.utils.loading import plan_loader_options
+from .database import DatabaseTestCase
+
+Base = declarative_base()
+
+
+class Brand(Base):
+    __tablename__ = 'brand'
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+
+
+class Shelf(Base):
+    __tablename__ = 'shelf'
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+
+
+class Article(Base):
+    __tablename__ = 'article'
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    brand_id = Column(ForeignKey('brand.id'))
+    shelf_id = Column(ForeignKey('shelf.id'))
+    brand = relationship('Brand')
+    shelf = relationship('Shelf', lazy='subquery')
+    labels = relationship('Label', back_populates='article')
+    notes = relationship('Label', lazy='dynamic')
+
+
+class Label(Base):
+    __tablename__ = 'label'
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    article_id = Column(ForeignKey('article.id'))
+    brand_id = Column(ForeignKey('brand.id'))
+    article = relationship('Article', back_populates='labels')
+    brand = relationship('Brand')
+
+
+class NamedSchema(Schema):
+    id = fields.Integer()
+    name = fields.String()
+
+
+class LabelSchema(NamedSchema):
+    brand = fields.Nested(NamedSchema)
+
+
+class ArticleSchema(NamedSchema):
+    brand = fields.Nested(NamedSchema)
+    shelf = fields.Nested(NamedSchema)
+    labels = fields.Nested(LabelSchema, many=True)
+    notes = fields.Nested(NamedSchema, many=True)
+
+
+class TestLoaderOptions(unittest.TestCase):
+
+    def setUp(self):
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(engine)
+        self.session = Session(engine)
+        brand = Brand(name='brand')
+        self.session.add_all([Article(name=str(i), brand=brand, shelf=Shelf(name=str(i)),
+                                      labels=[Label(name=str(j), brand=Brand(name=str(j))) for j in range(3)])
+                              for i in range(20)])
+        self.session.commit()
+        self.session.expunge_all()
+        self.statements = []
+        event.listen(engine, 'before_cursor_execute', lambda *args: self.statements.append(args[2]))
+
+    def dump(self, schema):
+        articles = self.session.query(Article).options(*plan_loader_options(Article, schema)).all()
+        return schema.dump(articles, many=True).data
+
+    def test_fixed_number_of_queries(self):
+        data = self.dump(ArticleSchema(exclude=('notes',)))
+        self.assertEqual(len(data[0]['labels']), 3)
+        self.assertEqual(data[0]['labels'][0]['brand']['name'], '0')
+        # articles joined with brand and shelf, then labels joined with their brand
+        self.assertEqual(len(self.statements), 2)
+
+    def test_excluded_eager_relationship_not_loaded(self):
+        self.dump(ArticleSchema(only=('id', 'name')))
+        self.assertEqual(len(self.statements), 1)
+        self.assertNotIn('JOIN shelf', self.statements[0])
+
+
+class TestOrderLoaderOptions(DatabaseTestCase):
+
+    def setUp(self):
+        super(TestOrderLoaderOptions, self).setUp()
+        status = self.create(Status, name='placed', code=1)
+        for i in range(4):
+            store = self.create_store('Store {}'.format(i))
+            user = self.create(User, email='{}@example.com'.format(i), name=str(i), mobile_number=str(i))
+            order = self.create(Order, store_id=store.id, user_id=user.id, is_draft=False)
+            self.create(OrderStatus, order_id=order.id, status_id=status.id)
+        db.session.commit()
+        db.session.expunge_all()
+
+    def test_related_fields_are_loaded_with_the_orders(self):
+        schema = OrderSchema(exclude=('items', 'items_count', 'customer', 'address', 'discounts', 'retail_shop'))
+        self.assertIsInstance(schema.fields['created_by'], Related)
+        statements = []
+
+        def record(*args):
+            statements.append(args[2])
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            orders = Order.query.options(*plan_loader_options(Order, schema)).order_by(Order.id).all()
+            data = schema.dump(orders, many=True).data
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertEqual([(order['store'], order['created_by'], order['time_line']) for order in data],
+                         [(i + 1, i + 1, [1]) for i in range(4)])
+        # orders joined with their store and user, then the statuses of all of them
+        self.assertEqual(len(statements), 2)
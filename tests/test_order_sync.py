@@ -0,0 +1,86 @@
+from manager import db
+from src.orders.models import Item, ItemTax, Order
+from src.orders.sync import sync_orders
+from src.products.models import Stock, Tax
+from src.user.models import Address, Customer, CustomerAddress
+from .database import DatabaseTestCase
+
+
+class TestOrderSync(DatabaseTestCase):
+
+    def setUp(self):
+        super(TestOrderSync, self).setUp()
+        self.store = self.create_store()
+        self.store.invoice_number = 10
+        self.stock = self.create_stock(self.store, units_purchased=10)
+        self.tax = self.create(Tax, name='GST', value=5, store_id=self.store.id)
+        self.customer = self.create(Customer, name='Asha', number='1', organisation_id=self.store.organisation_id)
+        self.address = self.create(Address, name='Home')
+        self.create(CustomerAddress, customer_id=self.customer.id, address_id=self.address.id)
+
+        other = self.create_store('Other')
+        self.other_stock = self.create_stock(other)
+        self.other_tax = self.create(Tax, name='GST', value=5, store_id=other.id)
+        self.other_customer = self.create(Customer, name='Ravi', number='2', organisation_id=other.organisation_id)
+        self.other_address = self.create(Address, name='Office')
+        self.create(CustomerAddress, customer_id=self.other_customer.id, address_id=self.other_address.id)
+        db.session.commit()
+
+    def order(self, reference, quantity=2, **fields):
+        item = dict(name='Crocin', unit_price=10, quantity=quantity, stock_id=self.stock.id,
+                    taxes=[dict(tax_id=self.tax.id, tax_value=5, tax_amount=1)])
+        return dict(dict(client_reference=reference, total=10 * quantity, items=[item]), **fields)
+
+    def sync(self, *orders):
+        results = sync_orders(list(orders), self.store, None, None)
+        db.session.commit()
+        return results
+
+    def units_sold(self):
+        db.session.expire_all()
+        return Stock.query.get(self.stock.id).units_sold
+
+    def test_creates_orders(self):
+        results = self.sync(self.order('a'), self.order('b', 3, is_void=True),
+                            self.order('c', customer_id=self.customer.id, address_id=self.address.id))
+        self.assertEqual([(result['status'], result['invoice_number']) for result in results],
+                         [('created', 11), ('created', 12), ('created', 13)])
+        self.assertEqual(Order.query.count(), 3)
+        self.assertEqual((Item.query.count(), ItemTax.query.count()), (3, 3))
+        # the void order doesn't count
+        self.assertEqual(self.units_sold(), 4)
+        self.assertEqual(Customer.query.get(self.customer.id).total_orders, 1)
+
+    def test_replay_is_idempotent(self):
+        first = self.sync(self.order('a'), self.order('b'))
+        again = self.sync(self.order('b'), self.order('a'), self.order('c'))
+        self.assertEqual([result['status'] for result in again], ['duplicate', 'duplicate', 'created'])
+        self.assertEqual([(result['id'], result['invoice_number']) for result in again[:2]],
+                         [(first[1]['id'], first[1]['invoice_number']), (first[0]['id'], first[0]['invoice_number'])])
+        self.assertEqual(again[2]['invoice_number'], 13)
+        self.assertEqual(Order.query.count(), 3)
+        self.assertEqual(self.units_sold(), 6)
+
+    def test_duplicates_in_one_batch(self):
+        results = self.sync(self.order('a'), self.order('a', 5))
+        self.assertEqual([result['status'] for result in results], ['created', 'duplicate'])
+        self.assertEqual(self.units_sold(), 2)
+
+    def test_invalid_orders(self):
+        results = self.sync(
+            self.order('a', customer_id=self.other_customer.id),
+            self.order('b', address_id=self.other_address.id),
+            self.order('c', customer_id=self.customer.id, address_id=self.other_address.id),
+            dict(self.order('d'), items=[dict(unit_price=1, quantity=1, stock_id=self.other_stock.id)]),
+            dict(self.order('e'), items=None),
+            self.order('f', address_id=self.address.id),
+            dict(self.order('g'), items=[dict(unit_price=1, quantity=1, stock_id=self.stock.id,
+                                              taxes=[dict(tax_id=self.other_tax.id), dict(tax_id=self.tax.id)])]))
+        self.assertEqual([result['status'] for result in results], ['invalid'] * 5 + ['created', 'invalid'])
+        self.assertEqual(results[0]['errors'], {'customer_id': ['Unknown customer']})
+        self.assertEqual(results[1]['errors'], {'address_id': ['Unknown address']})
+        self.assertEqual(results[2]['errors'], {'address_id': ['Unknown address']})
+        self.assertIn('Unknown stock', results[3]['errors']['items'][0])
+        self.assertEqual(results[5]['invoice_number'], 11)
+        self.assertEqual(results[6]['errors'], {'items': ['Unknown tax [{}]'.format(self.other_tax.id)]})
+        self.assertEqual(self.units_sold(), 2)
@@ -0,0 +1,77 @@
+import unittest
+from datetime import date, datetime
+from decimal import Decimal
+from unittest import mock
+
+from manager import app, db
+from src.products.models import Brand
+from src.products.resources import ProductResource
+from src.utils.api import page_response
+from src.utils.exceptions import CustomException
+from src.utils.pagination import encode_cursor, decode_cursor, estimate_count, paginate
+from .database import DatabaseTestCase
+
+
+class TestCursor(unittest.TestCase):
+
+    def test_round_trip(self):
+        values = [datetime(2018, 4, 1, 10, 30, 5, 120), date(2018, 4, 2), Decimal('10.50'), None, 42, 'abc']
+        keys = ['created_on', '-expiry_date', 'price', 'batch_number', 'id', 'name']
+        self.assertEqual(decode_cursor(encode_cursor(keys, values), keys), values)
+
+    def test_ordering_mismatch(self):
+        cursor = encode_cursor(['id'], [1])
+        self.assertRaises(CustomException, decode_cursor, cursor, ['-id'])
+
+    def test_garbage(self):
+        self.assertRaises(CustomException, decode_cursor, 'not-a-cursor', ['id'])
+
+    def test_ranked_search_is_not_paged_by_cursor(self):
+        # the rank would lead the ordering the cursor resumes from
+        with app.test_request_context('/?__keywords__search=para&__cursor'):
+            with self.assertRaises(CustomException) as raised:
+                ProductResource().paginate_cursor(mock.Mock(), [])
+        self.assertEqual(raised.exception.status, 400)
+
+
+class TestPaginate(DatabaseTestCase):
+
+    def setUp(self):
+        super(TestPaginate, self).setUp()
+        for i in range(25):
+            self.create(Brand, name='Brand {:02d}'.format(i))
+        db.session.commit()
+        db.session.execute('ANALYZE brand')
+        self.query = Brand.query.order_by(Brand.name)
+
+    def test_exact(self):
+        page = paginate(self.query, 2, 10)
+        self.assertEqual([brand.name for brand in page.items], ['Brand {:02d}'.format(i) for i in range(10, 20)])
+        self.assertEqual((page.total, page.has_more, page.estimated), (25, True, False))
+        self.assertEqual(page_response(page, 'exact', []), {'success': True, 'data': [], 'total': 25})
+
+    def test_estimate(self):
+        self.assertEqual(estimate_count(self.query), 25)
+        self.assertEqual(estimate_count(self.query.filter(Brand.name == 'Brand 01')), 1)
+        page = paginate(self.query, 1, 10, 'estimate')
+        self.assertEqual((page.total, page.has_more, page.estimated), (25, True, True))
+        self.assertTrue(page_response(page, 'estimate', [])['estimated'])
+
+    def test_estimate_never_below_rows_served(self):
+        with mock.patch('src.utils.pagination.estimate_count', return_value=3):
+            page = paginate(self.query, 2, 10, 'estimate')
+        self.assertEqual((page.total, page.has_more), (20, False))
+
+    def test_last_page_is_counted_not_estimated(self):
+        with mock.patch('src.utils.pagination.estimate_count') as estimated:
+            page = paginate(self.query, 3, 10, 'estimate')
+        self.assertFalse(estimated.called)
+        self.assertEqual((len(page.items), page.total, page.has_more, page.estimated), (5, 25, False, False))
+        self.assertNotIn('estimated', page_response(page, 'estimate', []))
+
+    def test_without_count(self):
+        page = paginate(self.query, 3, 10, 'none')
+        self.assertEqual((len(page.items), page.total, page.has_more), (5, None, False))
+        page = paginate(self.query, 2, 10, 'none')
+        self.assertTrue(page.has_more)
+        self.assertEqual(page_response(page, 'none', []), {'success': True, 'data': [], 'has_more': True})
@@ -0,0 +1,186 @@
+from datetime import date, datetime, time, timedelta
+from unittest import mock
+
+from sqlalchemy import func, select
+
+from manager import db
+from src.orders import rollups
+from src.orders.models import DailyProductSales, DailyStoreSales, Item, Order
+from src.utils.stats_cache import GENERATION_KEY, store_generation
+from .database import DatabaseTestCase
+from .test_stats_cache import FakePipeline, FakeRedis
+
+
+class SetPipeline(FakePipeline):
+
+    def __init__(self, redis):
+        super(SetPipeline, self).__init__(redis)
+        self.results = []
+
+    def smembers(self, key):
+        self.results.append(self.redis.smembers(key))
+
+    def delete(self, key):
+        self.results.append(self.redis.delete(key))
+
+    def execute(self):
+        return self.results
+
+
+class SetRedis(FakeRedis):
+
+    def __init__(self):
+        super(SetRedis, self).__init__()
+        self.sets = {}
+
+    def pipeline(self):
+        return SetPipeline(self)
+
+    def sadd(self, key, *members):
+        self.sets.setdefault(key, set()).update(member.encode('utf-8') for member in members)
+
+    def smembers(self, key):
+        return set(self.sets.get(key, ()))
+
+    def delete(self, key):
+        return int(self.sets.pop(key, None) is not None)
+
+
+class TestSalesRollups(DatabaseTestCase):
+
+    def setUp(self):
+        super(TestSalesRollups, self).setUp()
+        self.redis = SetRedis()
+        for target in ('src.orders.rollups.redis_store', 'src.products.valuation.redis_store',
+                       'src.utils.stats_cache.redis_store'):
+            patch = mock.patch(target, self.redis)
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.today = date.today()
+        self.store = self.create_store()
+        self.other_store = self.create_store('Other')
+        self.stock = self.create_stock(self.store, units_purchased=100)
+        self.other_stock = self.create_stock(self.other_store, units_purchased=100)
+        db.session.commit()
+
+    def day(self, days_ago):
+        return self.today - timedelta(days=days_ago)
+
+    def order(self, days_ago, quantity, stock=None, adjusted=0, **fields):
+        stock = stock or self.stock
+        order = self.create(Order, store_id=stock.store_id, total=8 * quantity, amount_paid=5,
+                            created_on=datetime.combine(self.day(days_ago), time(12)), **fields)
+        self.create(Item, order_id=order.id, stock_id=stock.id, quantity=quantity, unit_price=8)
+        if adjusted:
+            self.create(Item, order_id=order.id, stock_id=stock.id, quantity=adjusted, unit_price=8,
+                        stock_adjust=True)
+        return order
+
+    def store_rows(self):
+        return sorted((row.store_id, row.day, row.orders, row.total, row.amount_due, row.quantity)
+                      for row in DailyStoreSales.query)
+
+    def product_rows(self):
+        return sorted((row.store_id, row.day, row.product_id, row.quantity, row.sales, row.cost)
+                      for row in DailyProductSales.query)
+
+    def test_refresh_excludes_void_orders(self):
+        self.order(1, 2)
+        self.order(1, 3, adjusted=1)
+        self.order(1, 5, is_void=True)
+        self.order(1, 4, self.other_stock)
+        db.session.commit()
+        rollups.refresh_daily_sales(self.day(1), [self.store.id])
+        db.session.commit()
+        self.assertEqual(self.store_rows(), [(self.store.id, self.day(1), 2, 40, 30, 5)])
+        self.assertEqual(self.product_rows(), [(self.store.id, self.day(1), self.stock.product_id, 5, 40, 25)])
+
+        # refreshing replaces the rows of the day
+        order = Order.query.filter(Order.is_void.is_(True)).one()
+        order.is_void = False
+        db.session.commit()
+        rollups.refresh_daily_sales(self.day(1))
+        db.session.commit()
+        self.assertEqual(self.store_rows(), [(self.store.id, self.day(1), 3, 80, 65, 10),
+                                             (self.other_store.id, self.day(1), 1, 32, 27, 4)])
+
+    def test_end_date_is_inclusive(self):
+        for days_ago in (4, 3, 2):
+            self.order(days_ago, days_ago)
+        db.session.commit()
+        rollups.backfill_daily_sales(self.day(4), self.day(1))
+
+        def days(from_days_ago, to_days_ago):
+            sales = rollups.store_sales_between(self.day(from_days_ago), self.day(to_days_ago), [self.store.id])
+            return sorted(row.day for row in db.session.execute(select([sales.c.day])))
+
+        self.assertEqual(days(4, 3), [self.day(4), self.day(3)])
+        self.assertEqual(days(3, 3), [self.day(3)])
+        self.assertEqual(days(2, 0), [self.day(2)])
+
+        # the current day is computed live up to the end date
+        self.order(0, 1)
+        db.session.commit()
+        self.assertEqual(days(2, 0), [self.day(2), self.today])
+        self.assertEqual(days(2, 1), [self.day(2)])
+
+    def test_rollups_and_live_day_match_the_orders(self):
+        for days_ago, quantity in ((3, 2), (2, 5), (1, 1), (0, 4), (0, 3)):
+            self.order(days_ago, quantity, adjusted=1)
+            self.order(days_ago, quantity, self.other_stock)
+        self.order(2, 7, is_void=True)
+        self.order(0, 7, is_void=True)
+        db.session.commit()
+        # a rollup of the current day is left out, it is computed live
+        rollups.backfill_daily_sales(self.day(3), self.today)
+
+        store_ids = [self.store.id, self.other_store.id]
+        start, end = datetime.combine(self.day(3), time.min), datetime.combine(self.today, time.max)
+        for between, direct in ((rollups.store_sales_between, rollups.store_sales),
+                                (rollups.product_sales_between, rollups.product_sales)):
+            sales = between(self.day(3), self.today, store_ids)
+            expected = direct(start, end, store_ids).alias()
+            self.assertEqual(sorted(map(tuple, db.session.execute(select(list(sales.c))))),
+                             sorted(map(tuple, db.session.execute(select(list(expected.c))))))
+
+        sales = rollups.store_sales_between(self.day(3), self.today, [self.store.id])
+        self.assertEqual(tuple(db.session.execute(select([func.sum(sales.c.orders), func.sum(sales.c.quantity)]))
+                               .first()), (5, 15))
+
+    def test_orders_queue_their_days(self):
+        order = self.order(1, 2)
+        self.order(0, 3, self.other_stock)
+        db.session.commit()
+        self.assertEqual(self.redis.smembers(rollups.DIRTY_KEY),
+                         {'{}:{}'.format(self.store.id, self.day(1)).encode('utf-8'),
+                          '{}:{}'.format(self.other_store.id, self.today).encode('utf-8')})
+
+        self.assertEqual(rollups.refresh_pending_sales(), 2)
+        self.assertEqual(self.redis.smembers(rollups.DIRTY_KEY), set())
+        self.assertEqual(self.store_rows(), [(self.store.id, self.day(1), 1, 16, 11, 2),
+                                             (self.other_store.id, self.today, 1, 24, 19, 3)])
+
+        # moving an order marks the day it leaves
+        order = Order.query.get(order.id)
+        order.created_on = datetime.combine(self.day(2), time(12))
+        db.session.commit()
+        self.assertEqual(rollups.refresh_pending_sales(), 2)
+        self.assertEqual(self.store_rows(), [(self.store.id, self.day(2), 1, 16, 11, 2),
+                                             (self.other_store.id, self.today, 1, 24, 19, 3)])
+
+    def test_drain_store_days(self):
+        self.redis.sadd('days', '1:2018-01-02', '2:2018-01-02', '1:2018-01-01')
+        refresh = mock.Mock()
+        days = rollups.drain_store_days('days', refresh)
+        self.assertEqual(days, {date(2018, 1, 1): {1}, date(2018, 1, 2): {1, 2}})
+        self.assertEqual(refresh.call_args_list,
+                         [mock.call(date(2018, 1, 1), {1}), mock.call(date(2018, 1, 2), {1, 2})])
+        self.assertEqual(self.redis.smembers('days'), set())
+        self.assertEqual(self.redis.data[GENERATION_KEY.format(store_generation(2))], b'1')
+
+    def test_failed_drains_queue_the_days_left(self):
+        self.redis.sadd('days', '1:2018-01-01', '1:2018-01-02', '2:2018-01-03')
+        refresh = mock.Mock(side_effect=[None, RuntimeError, None])
+        with self.assertRaises(RuntimeError):
+            rollups.drain_store_days('days', refresh)
+        self.assertEqual(self.redis.smembers('days'), {b'1:2018-01-02', b'2:2018-01-03'})
@@ -0,0 +1,67 @@
+import threading
+import unittest
+from unittest import mock
+
+from src.utils.schema import SchemaCache
+from .test_stats_cache import FakeRedis
+
+
+class DummySchema(object):
+
+    def __init__(self, only=(), exclude=()):
+        self.only = only
+        self.exclude = exclude
+
+
+class TestSchemaCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = SchemaCache(maxsize=2)
+
+    def test_normalized_key(self):
+        schema = self.cache.get(DummySchema, ('name', 'id', 'id'), ['external_id'])
+        self.assertIs(self.cache.get(DummySchema, ['id', 'name'], ('external_id',)), schema)
+        self.assertEqual(schema.only, ('id', 'name'))
+        self.assertEqual(self.cache.cache_info()['hit_rate'], 0.5)
+
+    def test_evicts_least_recently_used(self):
+        first = self.cache.get(DummySchema, ('id',))
+        self.cache.get(DummySchema, ('name',))
+        self.cache.get(DummySchema, ('id',))
+        self.cache.get(DummySchema, (), ('id',))
+        self.assertIs(self.cache.get(DummySchema, ('id',)), first)
+        self.assertEqual(self.cache.cache_info()['currsize'], 2)
+        self.assertEqual(self.cache.cache_info()['misses'], 3)
+
+    def test_instances_per_thread(self):
+        schema = self.cache.get(DummySchema, ('id',))
+        other = []
+        thread = threading.Thread(target=lambda: other.append(self.cache.get(DummySchema, ('id',))))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], schema)
+
+    def test_counts_lookups_of_all_threads(self):
+        def lookups():
+            for _ in range(500):
+                self.cache.get(DummySchema, ('id',))
+
+        threads = [threading.Thread(target=lookups) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        info = self.cache.cache_info()
+        self.assertEqual((info['hits'], info['misses']), (1996, 4))
+
+    def test_reports_to_redis(self):
+        redis = FakeRedis()
+        cache = SchemaCache(maxsize=2, report_every=3)
+        with mock.patch('src.utils.schema.redis_store', redis):
+            for only in (('id',), ('id',), ('name',), ('id',)):
+                cache.get(DummySchema, only)
+            self.assertEqual(cache.shared_info(), {'hits': 1, 'misses': 2, 'hit_rate': 0.3333})
+            cache.report()
+            self.assertEqual(cache.shared_info(), {'hits': 2, 'misses': 2, 'hit_rate': 0.5})
+            cache.report()
+            self.assertEqual(redis.hashes['schema_cache:metrics'], {'hits': 2, 'misses': 2})
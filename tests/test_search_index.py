@@ -0,0 +1,84 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from flask import Flask
+
+from src.products import indexing, views
+from src.utils.search_index import ElasticsearchBackend, MemoryBackend, SearchIndex
+
+
+def product(product_id, name, brand_name='Cipla', salt_names=(), is_disabled=False):
+    return dict(id=product_id, name=name, therapeutic_name=None, brand_name=brand_name,
+                salt_names=list(salt_names), tag_names=[], is_disabled=is_disabled)
+
+
+class TestMemoryBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = MemoryBackend()
+        self.backend.upsert([product(1, 'Crocin 500', salt_names=['Paracetamol']),
+                             product(2, 'Paracip 650', salt_names=['Paracetamol']),
+                             product(3, 'Azithral 500', brand_name='Alembic', salt_names=['Azithromycin']),
+                             product(4, 'Paracetamol 500', is_disabled=True)])
+
+    def test_words_match_as_prefixes(self):
+        self.assertEqual(self.backend.search('para'), [2, 4, 1])
+        self.assertEqual(self.backend.search('para 500'), [4, 1])
+        self.assertEqual(self.backend.search('azi alem'), [3])
+        self.assertEqual(self.backend.search('para', {'is_disabled': False}), [2, 1])
+        self.assertEqual(self.backend.search(' - '), [])
+
+    def test_upsert_replaces_document(self):
+        self.backend.upsert([product(1, 'Dolo 650', salt_names=['Paracetamol'])])
+        self.assertEqual(self.backend.search('crocin'), [])
+        self.assertEqual(self.backend.search('650'), [1, 2])
+        self.assertNotIn('crocin', self.backend.terms)
+
+    def test_delete(self):
+        self.backend.delete([2, 3, 99])
+        self.assertEqual(self.backend.search('para'), [4, 1])
+        self.assertEqual(self.backend.search('alembic'), [])
+
+
+class TestSearchIndex(unittest.TestCase):
+
+    def test_backend_follows_config(self):
+        app = Flask(__name__)
+        app.config['TESTING'] = True
+        self.assertIsInstance(SearchIndex(app).backend, MemoryBackend)
+        app.config['ELASTIC_SEARCH_URL'] = 'http://localhost:9200/'
+        backend = SearchIndex(app).backend
+        self.assertIsInstance(backend, ElasticsearchBackend)
+        self.assertEqual(backend.url, 'http://localhost:9200')
+        app.config.update(TESTING=False, SEARCH_BACKEND='memory')
+        self.assertIsInstance(SearchIndex(app).backend, MemoryBackend)
+
+    def test_unconfigured_search(self):
+        app = Flask(__name__)
+        with self.assertLogs(app.logger, 'ERROR'):
+            index = SearchIndex(app)
+        self.assertFalse(index.enabled)
+        with self.assertRaises(RuntimeError):
+            index.backend.search('para')
+
+        app = Flask(__name__)
+        app.config['SEARCH_BACKEND'] = 'elastic'
+        self.assertRaises(ValueError, SearchIndex, app)
+        app.config['SEARCH_BACKEND'] = 'solr'
+        self.assertRaises(ValueError, SearchIndex, app)
+
+    def test_unconfigured_search_is_left_out(self):
+        index = SearchIndex()
+        with mock.patch.object(indexing, 'search_index', index), mock.patch.object(indexing, 'redis_store') as redis:
+            self.assertEqual(indexing.index_pending_products(), 0)
+        self.assertFalse(redis.pipeline.called)
+
+        app = Flask(__name__)
+        with mock.patch.object(views, 'api') as api:
+            views._register_product_search(SimpleNamespace(app=app))
+            self.assertFalse(api.add_resource.called)
+            app.config['TESTING'] = True
+            views._register_product_search(SimpleNamespace(app=app))
+            api.add_resource.assert_called_once_with(views.ProductSearchResource, '/product_search/',
+                                                     endpoint='product_search')
@@ -0,0 +1,139 @@
+import unittest
+from datetime import date
+from unittest import mock
+
+import simplejson
+from marshmallow import Schema, fields, post_dump
+
+from manager import app, db
+from src.products.models import Product, Tag, Tax
+from src.products.resources import ProductResource
+from src.products.schemas import ProductSchema
+from src.utils.dumper import compiled_dumper
+from .database import DatabaseTestCase
+
+
+class Obj(object):
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class LineTagSchema(Schema):
+    id = fields.Integer()
+    name = fields.String()
+
+
+class LineSchema(Schema):
+    id = fields.Integer()
+    name = fields.String(dump_to='title')
+    secret = fields.String(load_only=True)
+    price = fields.Float()
+    expiry = fields.Date()
+    stock = fields.Integer(default=0)
+    tags = fields.Nested(LineTagSchema, many=True, only=('name',))
+    brand = fields.Nested(LineTagSchema)
+    brand_name = fields.Nested(LineTagSchema, attribute='brand', only='name')
+    label = fields.Method('get_label')
+
+    def get_label(self, obj):
+        return '{} ({})'.format(obj.name, len(obj.tags))
+
+
+class UpperSchema(LineTagSchema):
+
+    @post_dump
+    def upper(self, data):
+        data['name'] = data['name'].upper()
+        return data
+
+
+class OtherObj(Obj):
+    pass
+
+
+def make_items(count, price=1.5):
+    return [Obj(id=i, name='item %s' % i, secret='x', price=price, expiry=date(2018, 4, i % 28 + 1),
+                tags=[Obj(id=j, name='tag %s' % j) for j in range(i % 3)],
+                brand=Obj(id=i, name='brand') if i % 2 else None) for i in range(count)]
+
+
+class TestCompiledDumper(unittest.TestCase):
+
+    def assertSameDump(self, schema, obj, many):
+        expected = simplejson.dumps(schema.dump(obj, many=many).data, sort_keys=True)
+        self.assertEqual(simplejson.dumps(compiled_dumper(schema).dump(obj, many=many), sort_keys=True), expected)
+
+    def test_matches_marshmallow(self):
+        schema = LineSchema()
+        for _ in range(3):
+            self.assertSameDump(schema, make_items(20), True)
+            self.assertSameDump(schema, make_items(1)[0], False)
+
+    def test_field_selection(self):
+        schema = LineSchema(only=('id', 'tags', 'brand'), exclude=('brand',))
+        for _ in range(2):
+            self.assertSameDump(schema, make_items(5), True)
+
+    def test_invalid_value_falls_back(self):
+        schema = LineSchema()
+        compiled_dumper(schema).dump(make_items(2), many=True)
+        self.assertSameDump(schema, make_items(3, price='not a number'), True)
+
+    def test_dump_processors(self):
+        schema = UpperSchema()
+        self.assertFalse(compiled_dumper(schema).compilable)
+        self.assertSameDump(schema, [Obj(id=1, name='a')], True)
+
+    def test_first_dump_of_each_element_type(self):
+        schema = LineTagSchema()
+        dumper = compiled_dumper(schema)
+        with mock.patch.object(schema, 'dump', wraps=schema.dump) as dumped:
+            dumper.dump([Obj(id=1, name='a')], many=True)
+            dumper.dump([Obj(id=2, name='b')], many=True)
+            self.assertEqual(dumped.call_count, 1)
+            self.assertEqual(dumper.dump([OtherObj(id=3, name='c')], many=True), [{'id': 3, 'name': 'c'}])
+            dumper.dump(Obj(id=4, name='d'))
+            self.assertEqual(dumped.call_count, 2)
+        self.assertEqual(dumper._types_seen, {Obj, OtherObj})
+
+
+class TestProductDump(DatabaseTestCase):
+    """The compiled product dump of `BaseView.get` against the marshmallow dump it replaces."""
+
+    def setUp(self):
+        super(TestProductDump, self).setUp()
+        store = self.create_store()
+        tags = [self.create(Tag, name='Tag {}'.format(i), store_id=store.id) for i in range(2)]
+        tax = self.create(Tax, name='GST', value=12, store_id=store.id)
+        for i in range(6):
+            stock = self.create_stock(store, expiry_date=date(2019, 1, i + 1), batch_number=str(i))
+            product = stock.product
+            product.description = [{'size': i}] if i % 2 else None
+            product.tags = tags[:i % 3]
+            product.taxes = [tax] if i % 2 else []
+            product.barcode = '8901234{:05d}'.format(i) if i % 3 else None
+        db.session.commit()
+
+    def assertSameDump(self, path):
+        with app.test_request_context(path):
+            resource = ProductResource()
+            query = Product.query.options(*resource.load_options()).order_by(Product.id)
+            schema = ProductSchema(only=resource.obj_only, exclude=resource.obj_exclude)
+            for _ in range(3):
+                products = query.all()
+                self.assertEqual(simplejson.dumps(resource.dump(products, many=True), sort_keys=True),
+                                 simplejson.dumps(schema.dump(products, many=True).data, sort_keys=True))
+            self.assertEqual(resource.dump(products[1]), schema.dump(products[1]).data)
+            db.session.rollback()
+
+    # the store link of `_links` needs a store_id that products no longer have
+    def test_default_fields(self):
+        self.assertSameDump('/api/v1/product?__exclude=_links')
+
+    def test_optional_fields(self):
+        self.assertSameDump('/api/v1/product?__exclude=_links&__include=brand,stocks,available_stocks,'
+                            'similar_products')
+
+    def test_field_selection(self):
+        self.assertSameDump('/api/v1/product?__only=id,name,tags,taxes,brand&__include=brand')
@@ -0,0 +1,95 @@
+import unittest
+from unittest import mock
+
+from flask import Flask, jsonify, make_response
+
+from src.utils import stats_cache
+from src.utils.stats_cache import cached_stats
+
+
+class FakePipeline(object):
+
+    def __init__(self, redis):
+        self.redis = redis
+
+    def incr(self, key):
+        self.redis.data[key] = str(int(self.redis.data.get(key, 0)) + 1).encode('utf-8')
+
+    def execute(self):
+        return []
+
+
+class FakeRedis(object):
+
+    def __init__(self):
+        self.data = {}
+        self.hashes = {}
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+
+    def hincrby(self, key, field, amount):
+        fields = self.hashes.setdefault(key, {})
+        fields[field] = fields.get(field, 0) + amount
+
+    def hgetall(self, key):
+        return self.hashes.get(key, {})
+
+
+class TestStatsCache(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = 0
+        self.app = Flask(__name__)
+
+        @self.app.route('/stats/')
+        @cached_stats('order_stats')
+        def stats():
+            self.calls += 1
+            return make_response(jsonify({'total_orders': self.calls}), 200)
+
+        self.client = self.app.test_client()
+        self.user = mock.Mock()
+        self.user.has_shop_access.return_value = True
+        patches = [mock.patch('src.utils.stats_cache.redis_store', FakeRedis()),
+                   mock.patch('src.utils.stats_cache.current_user', self.user)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def get(self, shops='1,2'):
+        return self.client.get('/stats/', query_string={'__retail_shop_id__in': shops,
+                                                        '__created_on__gte': '2018-01-01T00:00:00.000Z',
+                                                        '__created_on__lte': '2018-01-31T00:00:00.000Z'})
+
+    def test_repeated_request_is_cached(self):
+        first, second = self.get(), self.get()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(first.headers['X-Cache'], 'MISS')
+        self.assertEqual(second.headers['X-Cache'], 'HIT')
+        self.assertEqual(second.get_data(), first.get_data())
+        self.assertEqual(stats_cache.cache_info()['order_stats'], {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+    def test_store_write_invalidates(self):
+        self.get()
+        stats_cache.bump_stores([3])
+        self.assertEqual(self.get().headers['X-Cache'], 'HIT')
+        stats_cache.bump_stores([2])
+        self.assertEqual(self.get().headers['X-Cache'], 'MISS')
+        self.assertEqual(self.calls, 2)
+
+    def test_forbidden_store_is_not_served(self):
+        self.get()
+        self.user.has_shop_access.return_value = False
+        response = self.get()
+        self.assertNotIn('X-Cache', response.headers)
+        self.assertEqual(self.calls, 2)
@@ -0,0 +1,151 @@
+from datetime import date, datetime, time
+from unittest import mock
+
+from manager import db
+from src.orders.models import Item, Order
+from src.products import valuation
+from src.products.models import Distributor, DistributorBill, DistributorPurchase, Stock, StockValuation
+from .database import DatabaseTestCase
+from .test_rollups import SetRedis
+
+
+class TestStockValuation(DatabaseTestCase):
+
+    def setUp(self):
+        super(TestStockValuation, self).setUp()
+        self.redis = SetRedis()
+        for target in ('src.orders.rollups.redis_store', 'src.products.valuation.redis_store',
+                       'src.utils.stats_cache.redis_store'):
+            patch = mock.patch(target, self.redis)
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.store = self.create_store()
+        self.other_store = self.create_store('Other')
+        self.distributor = self.create(Distributor, name='Distributor', store_id=self.store.id)
+        self.bill = self.create_bill(date(2018, 1, 5))
+        db.session.commit()
+
+    def create_bill(self, day):
+        return self.create(DistributorBill, distributor_id=self.distributor.id, purchase_date=day,
+                           created_on=datetime.combine(day, time(9)))
+
+    def stock(self, day, store=None, **fields):
+        stock = self.create_stock(store or self.store, created_on=datetime.combine(day, time(10)), **fields)
+        db.session.commit()
+        return stock
+
+    def sell(self, stock, quantity, order=None):
+        item = self.create(Item, stock_id=stock.id, quantity=quantity, unit_price=8,
+                           order_id=order and order.id)
+        db.session.commit()
+        return item
+
+    def dirty(self):
+        return {member.decode('utf-8') for member in self.redis.smembers(valuation.DIRTY_KEY)}
+
+    def day_key(self, day, store=None):
+        return '{}:{}'.format((store or self.store).id, day)
+
+    def valuations(self):
+        db.session.expire_all()
+        return sorted((row.store_id, row.day, row.purchased_value, row.sold_value, row.expired_value,
+                       row.inventory_value) for row in StockValuation.query)
+
+    def purchases(self):
+        return sorted((row.store_id, row.day, row.distributor_id, row.purchases) for row in DistributorPurchase.query)
+
+    def test_refresh_day(self):
+        day = date(2018, 1, 2)
+        sold = self.stock(day, distributor_bill_id=self.bill.id)
+        self.sell(sold, 3)
+        self.stock(day, units_purchased=4, purchase_amount=2, is_expired=True)
+        self.stock(date(2018, 1, 3))
+        self.stock(day, self.other_store)
+
+        valuation.refresh_valuation_day(day, [self.store.id])
+        db.session.commit()
+        self.assertEqual(self.valuations(), [(self.store.id, day, 58, 24, 8, 35)])
+        self.assertEqual(self.purchases(), [])
+
+        valuation.refresh_valuation_day(date(2018, 1, 5))
+        db.session.commit()
+        self.assertEqual(self.purchases(), [(self.store.id, date(2018, 1, 5), self.distributor.id, 50)])
+
+        # refreshing replaces the rows of the day
+        Stock.query.filter(Stock.is_expired.is_(True)).update({'is_expired': False})
+        valuation.refresh_valuation_day(day)
+        db.session.commit()
+        self.assertEqual(self.valuations(), [(self.store.id, day, 58, 24, 0, 43),
+                                             (self.other_store.id, day, 50, 0, 0, 50)])
+
+    def test_snapshot_all(self):
+        self.stock(date(2018, 1, 2), distributor_bill_id=self.bill.id)
+        self.stock(date(2018, 1, 3))
+        self.stock(date(2018, 1, 3), self.other_store)
+        valuation.snapshot_all([self.store.id])
+        self.assertEqual([row[:3] for row in self.valuations()], [(self.store.id, date(2018, 1, 2), 50),
+                                                                  (self.store.id, date(2018, 1, 3), 50)])
+        self.assertEqual(self.purchases(), [(self.store.id, date(2018, 1, 5), self.distributor.id, 50)])
+
+        Stock.query.filter(Stock.created_on < datetime(2018, 1, 3)).delete()
+        db.session.commit()
+        valuation.snapshot_all()
+        self.assertEqual([row[:3] for row in self.valuations()], [(self.store.id, date(2018, 1, 3), 50),
+                                                                  (self.other_store.id, date(2018, 1, 3), 50)])
+        self.assertEqual(self.purchases(), [])
+
+    def test_stock_writes_mark_their_days(self):
+        stock = self.stock(date(2018, 1, 2), distributor_bill_id=self.bill.id)
+        self.assertEqual(self.dirty(), {self.day_key(date(2018, 1, 2)), self.day_key(date(2018, 1, 5))})
+
+        self.redis.sets.clear()
+        stock = Stock.query.get(stock.id)
+        stock.created_on = datetime(2018, 1, 3, 10)
+        stock.distributor_bill_id = self.create_bill(date(2018, 1, 6)).id
+        db.session.commit()
+        self.assertEqual(self.dirty(), {self.day_key(day) for day in (date(2018, 1, 2), date(2018, 1, 3),
+                                                                      date(2018, 1, 5), date(2018, 1, 6))})
+
+        self.redis.sets.clear()
+        stock = Stock.query.get(stock.id)
+        stock.store_id = self.other_store.id
+        db.session.commit()
+        # the bill day moves with the stock
+        self.assertEqual(self.dirty(), {self.day_key(date(2018, 1, 3)), self.day_key(date(2018, 1, 6)),
+                                        self.day_key(date(2018, 1, 3), self.other_store),
+                                        self.day_key(date(2018, 1, 6), self.other_store)})
+
+        self.redis.sets.clear()
+        db.session.delete(Stock.query.get(stock.id))
+        db.session.commit()
+        self.assertEqual(self.dirty(), {self.day_key(date(2018, 1, 3), self.other_store),
+                                        self.day_key(date(2018, 1, 6), self.other_store)})
+
+    def test_sales_mark_the_days_of_their_stocks(self):
+        stock = self.stock(date(2018, 1, 2))
+        other = self.stock(date(2018, 1, 3))
+        order = self.create(Order, store_id=self.store.id)
+        db.session.commit()
+        self.redis.sets.clear()
+        item = self.sell(stock, 2, order)
+        self.assertEqual(self.dirty(), {self.day_key(date(2018, 1, 2))})
+
+        self.redis.sets.clear()
+        item = Item.query.get(item.id)
+        item.stock_id = other.id
+        db.session.commit()
+        self.assertEqual(self.dirty(), {self.day_key(date(2018, 1, 2)), self.day_key(date(2018, 1, 3))})
+
+        self.redis.sets.clear()
+        order = Order.query.get(order.id)
+        order.is_void = True
+        db.session.commit()
+        self.assertEqual(self.dirty(), {self.day_key(date(2018, 1, 3))})
+
+    def test_refresh_pending_valuation(self):
+        stock = self.stock(date(2018, 1, 2), distributor_bill_id=self.bill.id)
+        self.sell(stock, 3)
+        self.assertEqual(valuation.refresh_pending_valuation(), 2)
+        self.assertEqual(self.dirty(), set())
+        self.assertEqual(self.valuations(), [(self.store.id, date(2018, 1, 2), 50, 24, 0, 35)])
+        self.assertEqual(self.purchases(), [(self.store.id, date(2018, 1, 5), self.distributor.id, 50)])